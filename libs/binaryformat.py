@@ -0,0 +1,577 @@
+# Copyright (C) 2014  Vangelis Tasoulas <vangelis@tasoulas.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Binary columnar output format.
+
+A binary output file starts with a header block, followed by one record
+per sample:
+
+  Header block
+    magic        4 bytes   'SDCB'
+    version      uint16
+    columns      uint32    number of columns
+    record_size  uint32    size of every record in bytes (0 if the
+                           records are delta encoded)
+    header_size  uint32    size of the whole header block (the offset of
+                           the first record)
+    catalog      JSON      {"encoding": "fixed" or "delta",
+                            "keyframe_interval": N,
+                            "columns": a list with a [name, type, width,
+                                       NA_value] entry per column}
+                           padded with spaces up to header_size.
+
+  Record (fixed encoding)
+    NA bitmap    ceil(columns / 8) bytes. Bit i (LSB first) is set if
+                 column i is NA in this record.
+    values       int64 ('q'), counter int64 ('c'), float64 ('d') or
+                 fixed-width string ('s') per column, little-endian,
+                 without any padding
+
+  Record (delta encoding)
+    length       varint    size of the rest of the record
+    flags        1 byte    bit 0 is set if the record is a keyframe
+    NA bitmap    as above
+    values       the values of all of the columns except the counters
+                 ('c'), as above
+    counters     one zig-zag varint per counter column which is not NA.
+                 Keyframes hold the value of the counter, the rest of the
+                 records hold the difference from the last value of the
+                 counter since the previous keyframe.
+
+With the fixed encoding all of the records have the same size, so the file
+can be memory mapped and a column can be read from every record with a
+constant stride, without parsing anything (see BinaryReader).
+
+The delta encoding stores the counters (the columns which the plugins
+describe as DataCollector.COUNTER) as small varint differences, which take
+one or two bytes on idle systems instead of eight. A keyframe is written
+every 'keyframe_interval' records (and at the start of every file), so a
+record can be decoded starting from the keyframe before it.
+
+A binary file can be converted back to the CSV layout with:
+    python -m libs.binaryformat FILE.sdcb [FILE.csv]
+"""
+
+import sys
+import json
+import mmap
+import bisect
+import struct
+import logging
+from libs.rowencoder import INT, COUNTER, FLOAT, STR
+from libs.writer import valueFormatter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ['BinaryFormat', 'BinaryReader', 'binaryToCSV', 'BINARY_EXTENSION', 'BINARY_ENCODINGS']
+
+LOG = logging.getLogger('default.' + __name__)
+
+MAGIC = b'SDCB'
+VERSION = 2
+BINARY_EXTENSION = '.sdcb'
+
+# Accepted values for the binary_encoding option
+BINARY_ENCODINGS = ('fixed', 'delta')
+
+# magic, version, columns, record_size, header_size
+_PREAMBLE = struct.Struct('<4sHIII')
+
+# The type code of every column type
+_TYPE_CODES = {INT: 'q', COUNTER: 'c', FLOAT: 'd', STR: 's'}
+
+# Default width (in bytes) of the string columns. Longer values are truncated.
+STR_WIDTH = 64
+
+# Set in the flags of the delta encoded keyframes
+_KEYFRAME = 1
+
+# The range of the values stored as int64
+_INT64_MIN = -2 ** 63
+_INT64_MAX = 2 ** 63 - 1
+
+#----------------------------------------------------------------------
+def _recordStruct(codes, widths, bitmap_size):
+    fmt = '<' + str(bitmap_size) + 's'
+    for code, width in zip(codes, widths):
+        if code == 's':
+            fmt += str(width) + 's'
+        else:
+            # Counters are stored as int64 when they are not delta encoded
+            fmt += 'q' if code == 'c' else code
+    return struct.Struct(fmt)
+
+def _zigzag(n):
+    return n << 1 if n >= 0 else ((-n) << 1) - 1
+
+def _unzigzag(z):
+    return -((z + 1) >> 1) if z & 1 else z >> 1
+
+def _putVarint(buf, n):
+    while n > 0x7f:
+        buf.append((n & 0x7f) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+def _getVarint(buf, p):
+    """
+    Returns the varint at position p of buf (a bytearray)
+    and the position after it
+    """
+    n = 0
+    shift = 0
+    while True:
+        b = buf[p]
+        p += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, p
+        shift += 7
+
+#----------------------------------------------------------------------
+class BinaryFormat(object):
+    """
+    Encodes rows (the lists returned by RowEncoder.fill()) in binary
+    records.
+
+    The column names, types and NA values are taken from a compiled
+    RowEncoder. Values which are equal to the NA value of their column (or
+    cannot be converted to the type of the column) are marked in the NA
+    bitmap of the record and stored as 0 (or an empty string).
+
+    encoding:          'fixed' or 'delta' (see the description of the module)
+    keyframe_interval: Write a keyframe every N records (delta encoding)
+    precision:         The decimal digits of the floats in the CSV lines
+                       returned by line(). The records always store the
+                       full precision.
+
+    With the delta encoding the records depend on the previous ones, so
+    the rows must be encoded in the order they are written. Every call of
+    header() starts a new file, so the next record will be a keyframe.
+
+    #### Sample code ####
+    fmt = BinaryFormat(encoder, widths={'datetime': 19})
+    f.write(fmt.header())
+    f.write(fmt.rows([list(encoder.fill(results, leading_values))]))
+    """
+
+    # The output files must be opened in binary mode
+    binary = True
+
+    def __init__(self, encoder, widths=None, str_width=STR_WIDTH, encoding='fixed', keyframe_interval=100, precision=None):
+        if encoding not in BINARY_ENCODINGS:
+            raise ValueError("Unknown binary encoding '" + str(encoding) + "'. Use one of " + str(BINARY_ENCODINGS))
+
+        widths = widths or {}
+        self.encoding = encoding
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.columns = list(encoder.columns)
+        self.NA_values = list(encoder.NA_values)
+        self.codes = [_TYPE_CODES[t] for t in encoder.types]
+        self.widths = [widths.get(name, str_width) if code == 's' else 8 for name, code in zip(self.columns, self.codes)]
+        self._bitmap_size = (len(self.columns) + 7) // 8
+        # CSV lines are still needed to echo the samples in the console
+        self._delimiter = encoder.delimiter
+        self._format = valueFormatter(precision)
+
+        # The columns packed with struct. With the delta encoding, the
+        # counters are written as varints after them.
+        if encoding == 'delta':
+            self._packed = [i for i, code in enumerate(self.codes) if code != 'c']
+            self._counters = [i for i, code in enumerate(self.codes) if code == 'c']
+        else:
+            self._packed = range(len(self.columns))
+            self._counters = []
+        self._struct = _recordStruct([self.codes[i] for i in self._packed], [self.widths[i] for i in self._packed], self._bitmap_size)
+        self.record_size = self._struct.size if encoding == 'fixed' else 0
+
+        # Precompile one converter per column
+        converters = {'q': _toInt, 'c': _toInt, 'd': float, 's': str}
+        self._converters = [converters[code] for code in self.codes]
+        self._empty = {'q': 0, 'c': 0, 'd': 0.0, 's': b''}
+        # The columns stored as int64 (the delta encoded counters are varints)
+        self._int64 = frozenset(i for i in self._packed if self.codes[i] in ('q', 'c'))
+
+        # Delta encoding state
+        self._refs = [None] * len(self._counters)
+        self._since_keyframe = None
+
+    def header(self):
+        """
+        Returns the header block
+        """
+        catalog = {
+            'encoding': self.encoding,
+            'keyframe_interval': self.keyframe_interval,
+            'columns': [[name, code, width, na] for name, code, width, na in zip(self.columns, self.codes, self.widths, self.NA_values)]
+        }
+        catalog = json.dumps(catalog, separators=(',', ':'), sort_keys=True).encode('utf-8')
+        header_size = _PREAMBLE.size + len(catalog)
+        # Keep the first record aligned to 8 bytes
+        padding = -header_size % 8
+        # A new file starts with a keyframe
+        self._since_keyframe = None
+        return _PREAMBLE.pack(MAGIC, VERSION, len(self.columns), self.record_size, header_size + padding) + catalog + b' ' * padding
+
+    def _convert(self, i, v, bitmap):
+        """
+        Returns the value of column i converted to its type, or None
+        (and marks it in the NA bitmap) if the value is NA, cannot be
+        converted (i.e. int('inf')) or doesn't fit in an int64 column
+        """
+        if v is None or v == self.NA_values[i]:
+            bitmap[i >> 3] |= 1 << (i & 7)
+            return None
+        try:
+            v = self._converters[i](v)
+        except (TypeError, ValueError, OverflowError):
+            bitmap[i >> 3] |= 1 << (i & 7)
+            return None
+        if i in self._int64 and not _INT64_MIN <= v <= _INT64_MAX:
+            bitmap[i >> 3] |= 1 << (i & 7)
+            return None
+        return v
+
+    def record(self, row):
+        """
+        Returns the binary record of a single row
+        """
+        bitmap = bytearray(self._bitmap_size)
+        values = []
+        for i in self._packed:
+            v = self._convert(i, row[i], bitmap)
+            values.append(self._empty[self.codes[i]] if v is None else v)
+
+        if self.encoding == 'fixed':
+            return self._struct.pack(bytes(bitmap), *values)
+
+        keyframe = self._since_keyframe is None or self._since_keyframe >= self.keyframe_interval
+        # The references are updated only after the record was packed, so
+        # that a row which fails to be encoded doesn't desync the reader
+        refs = [None] * len(self._counters) if keyframe else list(self._refs)
+
+        varints = bytearray()
+        for j, i in enumerate(self._counters):
+            v = self._convert(i, row[i], bitmap)
+            if v is None:
+                continue
+            _putVarint(varints, _zigzag(v if refs[j] is None else v - refs[j]))
+            refs[j] = v
+
+        body = bytearray([_KEYFRAME if keyframe else 0])
+        body += self._struct.pack(bytes(bitmap), *values)
+        body += varints
+        record = bytearray()
+        _putVarint(record, len(body))
+
+        self._refs = refs
+        self._since_keyframe = 1 if keyframe else self._since_keyframe + 1
+        return bytes(record + body)
+
+    def rows(self, rows):
+        """
+        Returns the binary records of a list of rows
+        """
+        return b''.join([self.record(row) for row in rows])
+
+    def line(self, row):
+        """
+        Returns the row as a CSV line (used to echo the samples in the console)
+        """
+        return self._delimiter.join(map(self._format, row))
+
+def _toInt(v):
+    try:
+        return int(v)
+    except ValueError:
+        # i.e. '1.0'
+        return int(float(v))
+
+#----------------------------------------------------------------------
+class BinaryReader(object):
+    """
+    Reads a binary output file through a read-only memory map.
+
+    Only the complete records are visible (a record which was being
+    written when the collector stopped is ignored).
+
+    The records of delta encoded files are decoded starting from the
+    keyframe before them, so column() and row() need to parse the records
+    and numpy views are not available.
+
+    #### Sample code ####
+    reader = BinaryReader('data_collected.sdcb')
+    user = reader.column('cpu_cpu0_user')          # all of the records
+    user = reader.column('cpu_cpu0_user', 100, 200) # records 100-199
+    na = reader.naMask('cpu_cpu0_user')
+    for row in reader.rows():
+        print(row)
+    reader.close()
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._mm = None
+        self._f = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._f.close()
+            raise ValueError("'" + path + "' is empty")
+
+        if self._mm.size() < _PREAMBLE.size:
+            self.close()
+            raise ValueError("'" + path + "' is not a binary " + BINARY_EXTENSION + " file")
+        magic, version, ncols, self.record_size, self.header_size = _PREAMBLE.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("'" + path + "' is not a binary " + BINARY_EXTENSION + " file")
+        if version != VERSION:
+            self.close()
+            raise ValueError("Unsupported binary format version " + str(version) + " in '" + path + "'")
+
+        catalog = json.loads(self._mm[_PREAMBLE.size:self.header_size].decode('utf-8'))
+        self.encoding = catalog['encoding']
+        self.keyframe_interval = catalog['keyframe_interval']
+        self.columns = [str(c[0]) for c in catalog['columns']]
+        self.codes = [str(c[1]) for c in catalog['columns']]
+        self.widths = [c[2] for c in catalog['columns']]
+        self.NA_values = [c[3] for c in catalog['columns']]
+        self._index = dict((name, i) for i, name in enumerate(self.columns))
+        self._bitmap_size = (ncols + 7) // 8
+
+        if self.encoding == 'delta':
+            self._packed = [i for i, code in enumerate(self.codes) if code != 'c']
+            self._counters = [i for i, code in enumerate(self.codes) if code == 'c']
+        else:
+            self._packed = range(ncols)
+            self._counters = []
+        self._struct = _recordStruct([self.codes[i] for i in self._packed], [self.widths[i] for i in self._packed], self._bitmap_size)
+
+        # The offset of every packed column inside a (fixed) record
+        self._offsets = {}
+        offset = self._bitmap_size
+        for i in self._packed:
+            self._offsets[i] = offset
+            offset += self.widths[i]
+        self._array = None
+
+        # The (offset, length) of the body of every delta encoded
+        # record, and the numbers of the keyframe records
+        self._records = []
+        self._keyframes = []
+        if self.encoding == 'delta':
+            self._scan()
+        # The last decoded record and the values of its counters
+        self._last = (None, None)
+
+    def _scan(self):
+        """
+        Find the offsets of the delta encoded records
+        """
+        size = self._mm.size()
+        p = self.header_size
+        while p < size:
+            head = bytearray(self._mm[p:p + 10])
+            try:
+                length, used = _getVarint(head, 0)
+            except IndexError:
+                break
+            body = p + used
+            if length < 1 or body + length > size:
+                # An incomplete record at the end of the file
+                break
+            if ord(self._mm[body:body + 1]) & _KEYFRAME:
+                self._keyframes.append(len(self._records))
+            self._records.append((body, length))
+            p = body + length
+
+    def __len__(self):
+        if self.encoding == 'delta':
+            return len(self._records)
+        return (self._mm.size() - self.header_size) // self.record_size
+
+    def _slice(self, start, stop):
+        start, stop, step = slice(start, stop).indices(len(self))
+        return start, max(start, stop)
+
+    def _recordArray(self):
+        """
+        Returns a numpy structured array viewing the memory map (no copy)
+        """
+        if self._array is None or len(self._array) != len(self):
+            fields = [('_na', 'u1', (self._bitmap_size,))] if self._bitmap_size else []
+            for name, code, width in zip(self.columns, self.codes, self.widths):
+                fields.append((name, 'S' + str(width) if code == 's' else '<' + ('f8' if code == 'd' else 'i8')))
+            self._array = numpy.ndarray((len(self),), dtype=numpy.dtype(fields), buffer=self._mm, offset=self.header_size)
+        return self._array
+
+    def _decode(self, index, refs):
+        """
+        Decode the delta encoded record 'index', given the counter values
+        of the previous record in 'refs' (updated in place).
+        Returns the NA bitmap and the values of the record.
+        """
+        body, length = self._records[index]
+        buf = bytearray(self._mm[body:body + length])
+        if buf[0] & _KEYFRAME:
+            refs[:] = [None] * len(self._counters)
+        packed = self._struct.unpack_from(bytes(buf), 1)
+        bitmap = bytearray(packed[0])
+        values = [0] * len(self.columns)
+        for i, v in zip(self._packed, packed[1:]):
+            values[i] = v
+        p = 1 + self._struct.size
+        for j, i in enumerate(self._counters):
+            if bitmap[i >> 3] & (1 << (i & 7)):
+                continue
+            d, p = _getVarint(buf, p)
+            d = _unzigzag(d)
+            refs[j] = values[i] = d if refs[j] is None else refs[j] + d
+        return bitmap, values
+
+    def _deltaRecord(self, index):
+        """
+        Decode the delta encoded record 'index', starting from the
+        previously decoded record or the keyframe before it
+        """
+        last, refs = self._last
+        keyframe = self._keyframes[bisect.bisect_right(self._keyframes, index) - 1] if self._keyframes else 0
+        if last is not None and keyframe <= last < index:
+            # Continue from the last decoded record (i.e. reading sequentially)
+            first = last + 1
+        else:
+            first = keyframe
+            refs = [None] * len(self._counters)
+        for r in range(first, index + 1):
+            bitmap, values = self._decode(r, refs)
+        self._last = (index, refs)
+        return bitmap, values
+
+    def column(self, name, start=None, stop=None):
+        """
+        Returns the values of column 'name' for the records [start, stop).
+
+        If numpy is available and the records are not delta encoded, a
+        numpy view on the memory map is returned (nothing is copied or
+        parsed). Otherwise, a list is returned. NA values are returned as 0
+        (or an empty string), use naMask() to find them.
+        """
+        i = self._index[name]
+        start, stop = self._slice(start, stop)
+        if self.encoding == 'delta':
+            return [self._deltaRecord(r)[1][i] for r in range(start, stop)]
+        if numpy is not None:
+            return self._recordArray()[name][start:stop]
+
+        code, width, offset = self.codes[i], self.widths[i], self._offsets[i]
+        field = struct.Struct('<' + (str(width) + 's' if code == 's' else ('d' if code == 'd' else 'q')))
+        first = self.header_size + offset
+        values = [field.unpack_from(self._mm, first + r * self.record_size)[0] for r in range(start, stop)]
+        if code == 's':
+            values = [v.rstrip(b'\0') for v in values]
+        return values
+
+    def naMask(self, name, start=None, stop=None):
+        """
+        Returns a list (or a numpy boolean array) which is True
+        for the records where column 'name' is NA
+        """
+        i = self._index[name]
+        start, stop = self._slice(start, stop)
+        byte, bit = i >> 3, 1 << (i & 7)
+        if self.encoding == 'delta':
+            # The bitmap follows the flags of the record
+            return [bool(ord(self._mm[self._records[r][0] + 1 + byte]) & bit) for r in range(start, stop)]
+        if numpy is not None:
+            return (self._recordArray()['_na'][start:stop, byte] & bit) != 0
+        first = self.header_size + byte
+        return [bool(ord(self._mm[first + r * self.record_size]) & bit) for r in range(start, stop)]
+
+    def row(self, index, NA=True):
+        """
+        Returns the values of record 'index'. If NA is True, the NA values
+        are replaced by the NA value of their column.
+        """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Record " + str(index) + " is out of range")
+
+        if self.encoding == 'delta':
+            bitmap, values = self._deltaRecord(index)
+            values = list(values)
+        else:
+            values = self._struct.unpack_from(self._mm, self.header_size + index * self.record_size)
+            bitmap = bytearray(values[0])
+            values = list(values[1:])
+        for i, code in enumerate(self.codes):
+            if NA and bitmap[i >> 3] & (1 << (i & 7)):
+                values[i] = self.NA_values[i]
+            elif code == 's':
+                values[i] = values[i].rstrip(b'\0')
+        return values
+
+    def rows(self, start=None, stop=None, NA=True):
+        """
+        Iterate over the records [start, stop)
+        """
+        start, stop = self._slice(start, stop)
+        for index in range(start, stop):
+            yield self.row(index, NA)
+
+    def close(self):
+        self._array = None
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._f.close()
+
+#----------------------------------------------------------------------
+def binaryToCSV(path, out, delimiter=',', precision=None):
+    """
+    Convert the binary file 'path' to the CSV layout and write it
+    in the file object 'out'. Returns the number of converted rows.
+
+    The floats are written with full precision (the shortest
+    representation which gives back the same number), unless the decimal
+    digits are limited by 'precision'.
+    """
+    formatValue = valueFormatter(precision)
+    reader = BinaryReader(path)
+    try:
+        out.write(delimiter.join(reader.columns) + "\n")
+        count = 0
+        for row in reader.rows():
+            out.write(delimiter.join(map(formatValue, row)) + "\n")
+            count += 1
+        return count
+    finally:
+        reader.close()
+
+#----------------------------------------------------------------------
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        sys.stderr.write("Usage: python -m libs.binaryformat FILE" + BINARY_EXTENSION + " [OUTPUT.csv]\n")
+        sys.exit(1)
+    if len(sys.argv) == 3:
+        with open(sys.argv[2], 'w') as out:
+            binaryToCSV(sys.argv[1], out)
+    else:
+        binaryToCSV(sys.argv[1], sys.stdout)
@@ -22,8 +22,10 @@ from time import sleep
 from platform import release
 from ConfigParser import ConfigParser
 from libs.helperfuncs import get_kernel_version
+from libs.procreader import ProcFileCache
 from distutils.version import StrictVersion
 import fnmatch
+import traceback
 
 class DataCollector(IPlugin):
     """
@@ -42,6 +44,27 @@ class DataCollector(IPlugin):
     STR   = 'string'
     INT   = 2 # Do not use 0 or 1, because False == 0 and True == 1
     FLOAT = 2.1
+    # Static var type for use in describe_fields() only. An INT which
+    # increases monotonically (i.e. a kernel counter), instead of a
+    # gauge which can go up and down.
+    COUNTER = 3
+
+    # The value returned by collect() for a value which is not available.
+    # It is written in the output as the NA_value of the plugin.
+    NA = None
+
+    # Kernel features the plugins can query with hasCapability(). Each
+    # feature is either the minimum kernel version which supports it, or a
+    # function which gets the plugin instance and returns True if the
+    # feature is available (i.e. DataCollector.pathProbe('/sys/...')).
+    # The features are resolved once, when the plugin is activated.
+    # Plugins can add their own features like this:
+    #   KERNEL_FEATURES = dict(DataCollector.KERNEL_FEATURES, my_feature='3.10')
+    KERNEL_FEATURES = {
+        'steal': '2.6.11',      # steal time in /proc/stat
+        'guest': '2.6.24',      # guest time in /proc/stat
+        'guest_nice': '2.6.33', # guest_nice time in /proc/stat
+    }
 
     def __init__(self):
         """
@@ -52,6 +75,8 @@ class DataCollector(IPlugin):
 
         # Get the headers when the plugin is initialized
         self.headers = ''
+        # The flattened headers as a list
+        self.columns = []
 
         # Get the name, version and path of this plugin
         self.name = ''
@@ -65,6 +90,20 @@ class DataCollector(IPlugin):
 
         # Get the current Linux kernel version
         self.running_kernel_version = get_kernel_version(release())[0]
+        self._running_kernel = StrictVersion(self.running_kernel_version)
+
+        # The resolved KERNEL_FEATURES (see probeCapabilities())
+        self.capabilities = {}
+
+        # The procfs/sysfs files read by readProcFile(), kept open between the samples
+        self._proc_files = ProcFileCache()
+
+        # Increase it when the layout of the results of collect() changes at
+        # runtime (i.e. new columns). After the collect() which returned the
+        # new layout, sysdata-collector takes the layout again (from
+        # describe_fields(), or from the returned results) and starts a new
+        # output segment with the new headers.
+        self.layout_version = 0
 
     def activate(self):
         """
@@ -73,6 +112,10 @@ class DataCollector(IPlugin):
         """
         super(DataCollector, self).activate()
 
+        # Resolve the kernel features once, so that no version
+        # parsing is needed while collecting data
+        self.probeCapabilities()
+
         # Initialize any user defined configuration
         self.readConfigVars()
 
@@ -82,6 +125,7 @@ class DataCollector(IPlugin):
         the `is_activated` property gets set.
         """
         super(DataCollector, self).deactivate()
+        self._proc_files.close()
 
     def readConfigVars(self):
         """
@@ -115,6 +159,13 @@ class DataCollector(IPlugin):
         ...,
         'Nth_sample_header':'Nth_sample_value'
 
+        The values must be typed: int (counters and other integers),
+        float, str (only for values which are not numbers, i.e. a version
+        string) or self.NA (None) when a value is not available. The
+        numbers are formatted only when they are written in the output
+        (with the precision configured for every output), so do not
+        convert or round them to strings in collect().
+
         prevResults: holds the results of this plugin from the previous
         run. This is particularly useful when your plugin needs to do
         some calculations based on the previous results. For instance,
@@ -122,6 +173,7 @@ class DataCollector(IPlugin):
         transmitted since the last measurement, you could do something
         like this:
           Bps = (currentTxBytes - previousTxBytes)/(currentTimestamp - prevTimestamp)
+        The values of prevResults can be self.NA as well.
 
         --------------------------------------------------------------
         Sample code:
@@ -134,20 +186,115 @@ class DataCollector(IPlugin):
 
             results = OrderedDict()
             results['1st_sample'] = 0.3
-            results['2nd_sample'] = 0.12
+            results['2nd_sample'] = 12
+            results['3rd_sample'] = self.NA
             return results
         }
         """
         raise NotImplementedError()
 
+    def getSamplingInterval(self):
+        """
+        Returns the sampling interval (in seconds) of this plugin as defined
+        by the option 'sampling_interval' in the 'Plugin' section of the
+        plugin's metaconf file (or the conf file in the active directory).
+
+        If the option is not defined, None is returned and the plugin will
+        be sampled every intervalBetweenSamples seconds.
+        """
+        interval = {}
+        self.readConfParameter(interval, 'sampling_interval', self.FLOAT)
+        if interval.get('sampling_interval', 0) > 0:
+            return interval['sampling_interval']
+        return None
+
+    def getCollectTimeout(self):
+        """
+        Returns the maximum time (in seconds) that sysdata-collector will wait
+        for the collect() of this plugin on every sample, as defined by the
+        option 'collect_timeout' in the 'Plugin' section of the plugin's
+        metaconf file (or the conf file in the active directory).
+
+        If the option is not defined, None is returned.
+        """
+        timeout = {}
+        self.readConfParameter(timeout, 'collect_timeout', self.FLOAT)
+        if timeout.get('collect_timeout', 0) > 0:
+            return timeout['collect_timeout']
+        return None
+
+    def getNAValue(self):
+        """
+        Returns the value used by this plugin when a value cannot be collected.
+        """
+        options = getattr(self, 'options', None)
+        if isinstance(options, dict) and 'NA_value' in options:
+            return options['NA_value']
+        return 'NA'
+
+    def readProcFile(self, path):
+        """
+        Returns the current contents of a procfs or sysfs file (i.e.
+        /proc/stat).
+
+        The file is opened on the first read and kept open, so the next
+        reads only seek to the start of the file and read it again in a
+        reusable buffer. If the file is removed (i.e. the device of a
+        sysfs file is unplugged), it is opened again on the next read.
+        IOError is raised if the file cannot be read.
+
+        Use it in collect() for the files which are read on every sample:
+
+            for line in self.readProcFile('/proc/net/dev').splitlines():
+                ...
+        """
+        return self._proc_files.read(path)
+
+    def describe_fields(self):
+        """
+        Optionally describe the layout of the results returned by collect(),
+        without collecting any data.
+
+        If implemented, it must return an OrderedDict with exactly the same
+        (nested) keys and order as the OrderedDict returned by collect(), and
+        the type of each value (self.INT, self.COUNTER, self.FLOAT or
+        self.STR) in place of the value. sysdata-collector will then get the
+        headers of the plugin from the returned layout, instead of running a
+        full collect().
+
+        Use self.COUNTER for integers which only increase (i.e. the counters
+        of /proc/stat), so that they can be delta encoded in the binary output.
+
+        If not implemented, None is returned and collect() will be used to
+        discover the headers.
+
+        --------------------------------------------------------------
+        Sample code:
+
+            fields = OrderedDict()
+            fields['1st_sample'] = self.FLOAT
+            fields['2nd_sample'] = self.COUNTER
+            return fields
+        """
+        return None
+
+    def getLayout(self):
+        """
+        Returns the layout of the results of this plugin. The layout is
+        described by describe_fields() if implemented, otherwise the
+        results of a collect() are used.
+        """
+        layout = self.describe_fields()
+        if layout is None:
+            layout = self.collect()
+        return layout
+
     def getHeaders(self, delimiter=","):
         """
         Get the headers of this plugin.
         """
-        self.headers = ''
-        for k in flatten_nested_dicts(self.collect()):
-            self.headers += k + delimiter
-        self.headers = self.headers[0:-1]
+        self.columns = list(flatten_nested_dicts(self.getLayout()))
+        self.headers = delimiter.join(self.columns)
         return self.headers
 
     def print_(self, headers=False):
@@ -188,35 +335,79 @@ class DataCollector(IPlugin):
         G=False, L=True, Equal=True             | <=
         G=False, L=True, Equal=False            | <
 
-        Example usage in cpu plugin:
-        if(self.runningKernelIsGLEthan('2.6.11')):
+        Example usage:
+        if(self.runningKernelIsGLEthan('2.6.11', Greater=True, Equal=True)):
             # steal (supported since Linux 2.6.11)
             #    Stolen time, which is the time spent in other operating
             #    systems when running in a virtualized environment
-            samples[cpuName]['steal'] = r.groups[8]
+            ...
+
+        The version is parsed on every call, so do not use it while
+        collecting data. Add the feature in KERNEL_FEATURES and use
+        hasCapability() instead.
         """
 
         if Greater == Less:
             if Equal:
-                if(StrictVersion(self.running_kernel_version) == StrictVersion(kernel)):
+                if(self._running_kernel == StrictVersion(kernel)):
                     return True
             else:
-                if(StrictVersion(self.running_kernel_version) is not StrictVersion(kernel)):
+                if(self._running_kernel != StrictVersion(kernel)):
                     return True
         elif Greater and Equal:
-            if(StrictVersion(self.running_kernel_version) >= StrictVersion(kernel)):
+            if(self._running_kernel >= StrictVersion(kernel)):
                 return True
         elif Greater:
-            if(StrictVersion(self.running_kernel_version) > StrictVersion(kernel)):
+            if(self._running_kernel > StrictVersion(kernel)):
                 return True
         elif Less and Equal:
-            if(StrictVersion(self.running_kernel_version) <= StrictVersion(kernel)):
+            if(self._running_kernel <= StrictVersion(kernel)):
                 return True
         elif Less:
-            if(StrictVersion(self.running_kernel_version) < StrictVersion(kernel)):
+            if(self._running_kernel < StrictVersion(kernel)):
                 return True
         return False
 
+    @staticmethod
+    def pathProbe(path):
+        """
+        Returns a KERNEL_FEATURES probe which is True if 'path' exists
+        (i.e. a file in /sys or /proc which is provided by newer kernels)
+        """
+        return lambda plugin: os.path.exists(path)
+
+    def probeCapabilities(self):
+        """
+        Resolve all of the KERNEL_FEATURES in the self.capabilities dict.
+        It is called once by activate().
+        """
+        capabilities = {}
+        for name, requirement in self.KERNEL_FEATURES.items():
+            try:
+                if callable(requirement):
+                    capabilities[name] = bool(requirement(self))
+                else:
+                    capabilities[name] = self.runningKernelIsGLEthan(requirement, Greater=True, Equal=True)
+            except:
+                self.LOG.debug("Probing the kernel feature '" + name + "' failed: " + traceback.format_exc())
+                capabilities[name] = False
+        self.capabilities = capabilities
+        self.LOG.debug("Kernel features: " + str(sorted(capabilities.items())))
+
+    def hasCapability(self, name):
+        """
+        Returns True if the kernel feature 'name' (one of KERNEL_FEATURES)
+        is available in the running kernel.
+
+        Example usage in cpu plugin:
+        if(self.hasCapability('steal')):
+            samples[cpuName]['pct_steal'] = ...
+        """
+        try:
+            return self.capabilities[name]
+        except KeyError:
+            raise KeyError("Unknown kernel feature '" + name + "'. Add it in KERNEL_FEATURES, and call hasCapability() after the plugin is activated.")
+
     def include_exclude_fields(self, fields_to_be_included, fields_to_be_excluded, all_accepted_fields, strict=True):
         """
         When it is needed to include/exclude fields, this function will do the job.
@@ -281,7 +472,7 @@ class DataCollector(IPlugin):
         the value will be assigned to the config_dict[paramname]
 
         paramname: the name of the parameter to be read
-        paramtype: str or bool is currently support
+        paramtype: one of BOOL, STR, INT or FLOAT
         multifields: if the parameter is expected to read more
                      than one value (comma separated), this should
                      be set to True. The returned value in
@@ -293,6 +484,10 @@ class DataCollector(IPlugin):
                 self.LOG.debug("Reading value for " + paramname)
                 if isinstance(paramtype, bool):
                     config_dict[paramname] = self.config.getboolean(Section, paramname)
+                elif isinstance(paramtype, float):
+                    config_dict[paramname] = self.config.getfloat(Section, paramname)
+                elif isinstance(paramtype, int):
+                    config_dict[paramname] = self.config.getint(Section, paramname)
                 elif isinstance(paramtype, str):
                     if multifields:
                         config_dict[paramname] = split_strip(self.config.get(Section, paramname))
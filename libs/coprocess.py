@@ -0,0 +1,220 @@
+# Copyright (C) 2014  Vangelis Tasoulas <vangelis@tasoulas.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import errno
+import select
+import logging
+import subprocess
+from libs.scheduler import monotonic
+
+__all__ = ['Coprocess']
+
+LOG = logging.getLogger('default.' + __name__)
+
+#----------------------------------------------------------------------
+class Coprocess(object):
+    """
+    A long-lived child process which answers requests written to its
+    stdin with lines on its stdout, up to a terminator line.
+
+    The process is started on the first request and it is kept running
+    between the requests. If it exits, or it doesn't answer a request in
+    'timeout' seconds, it is killed and started again on a later request,
+    after a backoff which is doubled on every failure (from 'min_backoff'
+    up to 'max_backoff' seconds) and reset after a successful request.
+    The requests made during the backoff return None.
+
+    A process which prints more than 'max_output' bytes for a request is
+    killed too (if max_output is given).
+
+    The stderr of the process is logged (debug level).
+
+    #### Sample code ####
+    coproc = Coprocess(['/path/to/script.sh'], timeout=5)
+    while True:
+        lines = coproc.request('sample', 'end')
+        if lines is not None:
+            ...
+    coproc.close()
+    """
+
+    def __init__(self, args, env=None, timeout=10, min_backoff=1, max_backoff=60, max_output=None):
+        self.args = args
+        self.env = env
+        self.timeout = timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.max_output = max_output
+        self._process = None
+        self._backoff = min_backoff
+        self._restart_at = 0
+        self._stdout = ''
+        self._stderr = ''
+        # Statistics
+        self.starts = 0
+        self.failures = 0
+
+    def _start(self):
+        env = None
+        if self.env:
+            env = dict(os.environ)
+            env.update(self.env)
+        self._process = subprocess.Popen(self.args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                         stderr=subprocess.PIPE, env=env, close_fds=True)
+        self._stdout = ''
+        self._stderr = ''
+        self.starts += 1
+        LOG.debug("Started '" + ' '.join(self.args) + "' with pid " + str(self._process.pid))
+
+    def _stop(self):
+        """
+        Kill the process (if it is still running) and reap it
+        """
+        process, self._process = self._process, None
+        if process is None:
+            return
+        for f in (process.stdin, process.stdout, process.stderr):
+            try:
+                f.close()
+            except (IOError, OSError):
+                pass
+        if process.poll() is None:
+            try:
+                process.terminate()
+                deadline = monotonic() + 1
+                while process.poll() is None and monotonic() < deadline:
+                    time.sleep(0.01)
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+            except OSError:
+                pass
+
+    def _exited(self, process):
+        """
+        Returns the reason of a failure of a process which closed its pipes
+        """
+        # Give the process a moment to exit, to report its return code
+        deadline = monotonic() + 0.1
+        while process.poll() is None and monotonic() < deadline:
+            time.sleep(0.01)
+        if process.returncode is None:
+            return 'closed its stdout'
+        return 'exited with return code ' + str(process.returncode)
+
+    def _fail(self, reason):
+        self.failures += 1
+        self._stop()
+        self._restart_at = monotonic() + self._backoff
+        LOG.warning("'" + ' '.join(self.args) + "' " + reason + ". It will be started again in " + str(self._backoff) + " seconds")
+        self._backoff = min(self._backoff * 2, self.max_backoff)
+
+    def _logStderr(self, final=False):
+        lines = self._stderr.split('\n')
+        self._stderr = '' if final else lines.pop()
+        for line in lines:
+            if line:
+                LOG.debug("'" + self.args[0] + "' stderr: " + line)
+
+    def request(self, request, terminator):
+        """
+        Write the line 'request' to the stdin of the process, and return the
+        lines it prints to its stdout until the line 'terminator' (without
+        the terminator), or None if the process is not running.
+        """
+        if self._process is None:
+            if monotonic() < self._restart_at:
+                return None
+            try:
+                self._start()
+            except OSError as e:
+                self._fail('cannot be started: ' + str(e))
+                return None
+
+        process = self._process
+        try:
+            process.stdin.write(request + '\n')
+            process.stdin.flush()
+        except (IOError, OSError):
+            self._fail(self._exited(process))
+            return None
+
+        stdout_fd = process.stdout.fileno()
+        stderr_fd = process.stderr.fileno()
+        fds = [stdout_fd, stderr_fd]
+        deadline = monotonic() + self.timeout
+        lines = []
+        size = 0
+        while True:
+            # Complete lines which were already read
+            if '\n' in self._stdout:
+                complete = self._stdout.split('\n')
+                self._stdout = complete.pop()
+                for i, line in enumerate(complete):
+                    if line == terminator:
+                        # Keep what was printed after the terminator
+                        self._stdout = '\n'.join(complete[i + 1:] + [self._stdout])
+                        self._backoff = self.min_backoff
+                        return lines
+                    lines.append(line)
+                    size += len(line) + 1
+
+            if self.max_output is not None and size + len(self._stdout) > self.max_output:
+                self._fail('printed more than ' + str(self.max_output) + ' bytes')
+                return None
+
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                self._fail('did not answer in ' + str(self.timeout) + ' seconds')
+                return None
+            try:
+                readable = select.select(fds, [], [], remaining)[0]
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            for fd in readable:
+                data = os.read(fd, 65536)
+                if fd == stderr_fd:
+                    self._stderr += data
+                    self._logStderr(final=not data)
+                    if not data:
+                        # stderr was closed, wait on stdout only
+                        fds.remove(stderr_fd)
+                elif data:
+                    self._stdout += data
+                else:
+                    self._logStderr(final=True)
+                    self._fail(self._exited(process))
+                    return None
+
+    def close(self):
+        """
+        Close the stdin of the process (so that it can exit cleanly) and
+        stop it
+        """
+        process = self._process
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+            deadline = monotonic() + 1
+            while process.poll() is None and monotonic() < deadline:
+                time.sleep(0.01)
+        except (IOError, OSError):
+            pass
+        self._stop()
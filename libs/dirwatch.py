@@ -0,0 +1,163 @@
+# Copyright (C) 2014  Vangelis Tasoulas <vangelis@tasoulas.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import errno
+import struct
+import ctypes
+import ctypes.util
+import logging
+
+__all__ = ['DirectoryWatcher']
+
+LOG = logging.getLogger('default.' + __name__)
+
+# Flags and events as defined in <sys/inotify.h>
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_IGNORED = 0x00008000
+# The entries of the directory were added, removed or renamed
+_IN_EVENTS = (_IN_CREATE | _IN_DELETE | _IN_MOVED_FROM | _IN_MOVED_TO |
+              _IN_DELETE_SELF | _IN_MOVE_SELF)
+# The watched directory itself is gone (from its path)
+_IN_GONE = _IN_DELETE_SELF | _IN_MOVE_SELF | _IN_IGNORED
+
+# struct inotify_event: wd, mask, cookie and the length of the name which follows
+_EVENT = struct.Struct('iIII')
+
+def _load_inotify():
+    """
+    Python 2 doesn't provide inotify, so call inotify_init1() and
+    inotify_add_watch() from libc through ctypes.
+    """
+    path = ctypes.util.find_library('c')
+    if not path:
+        return None
+    try:
+        lib = ctypes.CDLL(path, use_errno=True)
+        init1 = lib.inotify_init1
+        add_watch = lib.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    init1.argtypes = [ctypes.c_int]
+    init1.restype = ctypes.c_int
+    add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    add_watch.restype = ctypes.c_int
+    return init1, add_watch
+
+_inotify = _load_inotify()
+
+#----------------------------------------------------------------------
+class DirectoryWatcher(object):
+    """
+    Tells if the entries of a directory may have changed since the last
+    call of changed(), without listing the directory.
+
+    The directory is watched with inotify, so changed() only reads the
+    pending events (non-blocking). If inotify is not available (or the
+    watch cannot be added, i.e. the inotify limits are reached), the
+    modification time of the directory is compared on every call instead.
+
+    #### Sample code ####
+    watcher = DirectoryWatcher('/path/to/dir')
+    while True:
+        if watcher.changed():
+            entries = os.listdir('/path/to/dir')
+    watcher.close()
+    """
+
+    def __init__(self, path, use_inotify=True):
+        self.path = path
+        self._fd = None
+        self._mtime = None
+        self._checked = False
+        if use_inotify:
+            self._fd = self._addWatch(path)
+        self.method = 'inotify' if self._fd is not None else 'polling'
+        LOG.debug("Watching '" + path + "' with " + self.method)
+
+    @staticmethod
+    def _addWatch(path):
+        if _inotify is None:
+            return None
+        init1, add_watch = _inotify
+        fd = init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if fd < 0:
+            LOG.debug("inotify_init1() failed: " + os.strerror(ctypes.get_errno()))
+            return None
+        if add_watch(fd, path, _IN_EVENTS) < 0:
+            LOG.debug("inotify_add_watch('" + path + "') failed: " + os.strerror(ctypes.get_errno()))
+            os.close(fd)
+            return None
+        return fd
+
+    def _statMtime(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_ino, st.st_mtime)
+        except OSError:
+            return None
+
+    def changed(self):
+        """
+        Returns True on the first call, and then if the directory may have
+        changed since the previous call
+        """
+        first = not self._checked
+        self._checked = True
+        if self._fd is None:
+            mtime = self._statMtime()
+            changed = first or mtime != self._mtime
+            self._mtime = mtime
+            return changed
+
+        changed = first
+        while self._fd is not None:
+            try:
+                data = os.read(self._fd, 65536)
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno != errno.EAGAIN:
+                    raise
+                break
+            if not data:
+                break
+            changed = True
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size + length
+                if mask & _IN_GONE:
+                    # The directory was removed or moved, and the watch
+                    # doesn't follow its path. Compare the modification
+                    # time of the path from now on.
+                    LOG.debug("The inotify watch of '" + self.path + "' was removed, falling back to polling")
+                    self.close()
+                    self.method = 'polling'
+                    self._mtime = self._statMtime()
+                    break
+        return changed
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -78,3 +78,39 @@ delimiter = ","
 active_plugins_dir = "active-plugins"
 plugin_directories = []
 intervalBetweenSamples = 10
+# Align the samples to wall-clock boundaries (multiples of intervalBetweenSamples)
+align_samples_to_wallclock = False
+# What to do when sampling overruns: skip, catchup or coalesce
+overrun_policy = 'coalesce'
+# How plugins with different sampling intervals are written: carry_forward or split
+multirate_output = 'carry_forward'
+# Number of long-lived threads used to run the plugins' collect().
+# 0 means one thread per active plugin.
+worker_pool_size = 0
+# Maximum seconds to wait for the plugins on every sample (0 means no deadline)
+collect_deadline = 0
+# What to do with the results of plugins that missed their deadline: discard or prev_results
+late_results = 'discard'
+# Output writer stage
+writer_queue_size = 1000
+writer_overflow = 'block'
+writer_spill_size = 10000
+flush_every_rows = 0
+flush_interval = 0
+fsync_on_rotate = False
+# Format of the output files: csv or binary
+output_format = 'csv'
+# Encoding of the binary records: fixed or delta (delta encoded counters)
+binary_encoding = 'fixed'
+binary_keyframe_interval = 100
+# Compression of the output files: none, gzip, bz2 (or xz if lzma is available)
+output_compression = 'none'
+compression_level = 6
+# Rotate the output files when they reach rotate_size_mb megabytes or on
+# every rotate_interval seconds of wall-clock time (0 disables them)
+rotate_size_mb = 0
+rotate_interval = 0
+# Decimal digits of the floats written in the CSV output and in the
+# samples echoed in the console (negative for full precision)
+float_precision = 2
+console_float_precision = 2
@@ -13,13 +13,19 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
 import re
 import sys
+import time
+import errno
+import signal
+import select
 import traceback
 import logging
 import platform
 import subprocess
 import datetime
+from libs.scheduler import monotonic
 try:
     from collections import OrderedDict
 except ImportError:
@@ -41,16 +47,38 @@ class executeCommand(object):
     Custom class to execute a shell command and
     provide to the user, access to the returned
     values
+
+    If a timeout (in seconds) is given, the command is started in its own
+    process group, and if it is still running after the timeout the group
+    is sent a SIGTERM, and a SIGKILL if the command is still running
+    'kill_grace' seconds later. The output of a command which timed out is
+    what it printed until it was killed, and timedOut() returns True.
+
+    If max_output (in bytes) is given, a command which prints more on its
+    stdout is killed the same way, its output is truncated, and
+    outputTruncated() returns True.
+
+    #### Sample code ####
+    cmd = executeCommand(['/path/to/script.sh'], timeout=5)
+    if not cmd.timedOut() and cmd.getReturnCode() == 0:
+        lines = cmd.getStdout()
     """
 
-    def __init__(self, args=None, isUtc=True):
+    def __init__(self, args=None, isUtc=True, timeout=None, kill_grace=1, env=None, max_output=None):
         self._stdout = None
         self._stderr = None
         self._returncode = None
+        self._timedout = False
+        self._truncated = False
         self._timeStartedExecution = None
         self._timeFinishedExecution = None
         self._args = args
         self.isUtc = isUtc
+        self.timeout = timeout
+        self.kill_grace = kill_grace
+        self.max_output = max_output
+        # The environment of the command (the environment of this process if None)
+        self.env = env
         if(self._args != None):
             self.execute()
 
@@ -63,20 +91,124 @@ class executeCommand(object):
                 self._timeStartedExecution = datetime.datetime.utcnow()
             else:
                 self._timeStartedExecution = datetime.datetime.now()
-            p = subprocess.Popen(self._args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            self._timedout = False
+            self._truncated = False
+            if self.timeout is None and self.max_output is None:
+                p = subprocess.Popen(self._args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=self.env)
+                self._stdout, self._stderr = p.communicate()
+            else:
+                # In a new process group, so that the children of the command
+                # can be killed with it
+                p = subprocess.Popen(self._args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                     env=self.env, preexec_fn=os.setpgrp)
+                self._stdout, self._stderr = self._communicate(p, self.timeout)
             if(self.isUtc):
                 self._timeFinishedExecution = datetime.datetime.utcnow()
             else:
                 self._timeFinishedExecution = datetime.datetime.now()
-            self._stdout, self._stderr = p.communicate()
             self._returncode = p.returncode
             return 1
         else:
             self._stdout = None
             self._stderr = None
             self._returncode = None
+            self._timedout = False
+            self._truncated = False
             return 0
 
+    def _communicate(self, p, timeout):
+        """
+        Read the output of the process 'p' until it exits, the timeout
+        expires or it prints more than max_output bytes, in which case it
+        is killed. The process is always reaped. Returns the stdout and the
+        stderr.
+        """
+        stdout_fd = p.stdout.fileno()
+        stderr_fd = p.stderr.fileno()
+        output = {stdout_fd: [], stderr_fd: []}
+        stdout_size = 0
+        fds = [stdout_fd, stderr_fd]
+        deadline = None if timeout is None else monotonic() + timeout
+        while fds:
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    self._timedout = True
+                    break
+            try:
+                readable = select.select(fds, [], [], remaining)[0]
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            for fd in readable:
+                data = os.read(fd, 65536)
+                if not data:
+                    fds.remove(fd)
+                    continue
+                output[fd].append(data)
+                if fd == stdout_fd:
+                    stdout_size += len(data)
+                    if self.max_output is not None and stdout_size > self.max_output:
+                        self._truncated = True
+                        fds = []
+                        break
+        p.stdout.close()
+        p.stderr.close()
+
+        if self._timedout or self._truncated:
+            self._kill(p)
+        elif deadline is None:
+            p.wait()
+        else:
+            # The pipes were closed, the process exits (or it has closed
+            # its output and keeps running)
+            delay = 0.0005
+            while p.poll() is None and monotonic() < deadline:
+                time.sleep(delay)
+                delay = min(delay * 2, 0.05)
+            if p.poll() is None:
+                self._timedout = True
+                self._kill(p)
+
+        stdout = ''.join(output[stdout_fd])
+        if self._truncated:
+            stdout = stdout[:self.max_output]
+        return stdout, ''.join(output[stderr_fd])
+
+    def _kill(self, p):
+        """
+        Terminate the process group of 'p' (SIGTERM), kill it (SIGKILL) if
+        'p' is still running after kill_grace seconds, and reap 'p'
+        """
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.killpg(p.pid, sig)
+            except OSError:
+                # The process group has already exited
+                break
+            deadline = monotonic() + self.kill_grace
+            while p.poll() is None and monotonic() < deadline:
+                time.sleep(0.01)
+            if p.poll() is not None:
+                break
+        p.wait()
+
+    def timedOut(self):
+        """
+        Returns True if the command was killed because it didn't finish
+        in 'timeout' seconds
+        """
+        return self._timedout
+
+    def outputTruncated(self):
+        """
+        Returns True if the command was killed because it printed more than
+        'max_output' bytes
+        """
+        return self._truncated
+
     def getStdout(self, getList=True):
         """
         Get the standard output of the executed command
@@ -0,0 +1,197 @@
+# Copyright (C) 2014  Vangelis Tasoulas <vangelis@tasoulas.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import errno
+import socket
+import struct
+import logging
+
+__all__ = ['LinkStatsSocket', 'LINK_STATS64_FIELDS', 'NetlinkError']
+
+LOG = logging.getLogger('default.' + __name__)
+
+# Constants from <linux/netlink.h> and <linux/rtnetlink.h>
+NETLINK_ROUTE = 0
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+RTM_NEWLINK = 16
+RTM_GETLINK = 18
+IFLA_IFNAME = 3
+IFLA_STATS64 = 23
+
+# The fields of struct rtnl_link_stats64 from <linux/if_link.h>, in order.
+# Newer kernels append fields at the end, so only the known fields are read.
+LINK_STATS64_FIELDS = (
+    'rx_packets', 'tx_packets', 'rx_bytes', 'tx_bytes',
+    'rx_errors', 'tx_errors', 'rx_dropped', 'tx_dropped',
+    'multicast', 'collisions',
+    'rx_length_errors', 'rx_over_errors', 'rx_crc_errors',
+    'rx_frame_errors', 'rx_fifo_errors', 'rx_missed_errors',
+    'tx_aborted_errors', 'tx_carrier_errors', 'tx_fifo_errors',
+    'tx_heartbeat_errors', 'tx_window_errors',
+    'rx_compressed', 'tx_compressed',
+)
+
+_NLMSGHDR = struct.Struct('=IHHII')
+_IFINFOMSG = struct.Struct('=BxHiII')
+_RTATTR = struct.Struct('=HH')
+_STATS64 = struct.Struct('=' + 'Q' * len(LINK_STATS64_FIELDS))
+
+# Size of the receive buffer. The kernel sends the dump in messages of
+# up to 32KB (or the page size if larger).
+RECV_BUFFER_SIZE = 65536
+
+class NetlinkError(EnvironmentError):
+    pass
+
+#----------------------------------------------------------------------
+def _align(length):
+    return (length + 3) & ~3
+
+#----------------------------------------------------------------------
+class LinkStatsSocket(object):
+    """
+    Reads the statistics of the network interfaces (struct
+    rtnl_link_stats64, the counters shown in /proc/net/dev) with an
+    RTM_GETLINK dump over a NETLINK_ROUTE socket.
+
+    The kernel doesn't have to format the counters as text, and nothing
+    has to be parsed as text, which makes a difference on hosts with
+    thousands of interfaces (i.e. veth interfaces of containers).
+
+    The socket is kept open between the dumps. NetlinkError (or
+    socket.error) is raised if the statistics cannot be read.
+
+    #### Sample code ####
+    links = LinkStatsSocket()
+    for ifName, stats in links.dump().items():
+        rx_bytes = stats[LINK_STATS64_FIELDS.index('rx_bytes')]
+    """
+
+    def __init__(self):
+        self._sock = None
+        self._seq = 0
+        self._buffer = bytearray(RECV_BUFFER_SIZE)
+        # The offset of IFLA_STATS64 from the end of IFLA_IFNAME, and the
+        # header of IFLA_STATS64, in the last message where it was found
+        self._stats_hint = 0
+        self._stats_attr = None
+
+    def _open(self):
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        self._sock.bind((0, 0))
+
+    def _request(self):
+        self._seq += 1
+        ifinfomsg = _IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+        header = _NLMSGHDR.pack(_NLMSGHDR.size + len(ifinfomsg), RTM_GETLINK,
+                                NLM_F_REQUEST | NLM_F_DUMP, self._seq, 0)
+        self._sock.send(header + ifinfomsg)
+        return self._seq
+
+    def dump(self, interfaces=None):
+        """
+        Returns a dictionary with a tuple of the LINK_STATS64_FIELDS of
+        every interface, or only of the interfaces in 'interfaces'
+        (a set of interface names), if it is not None.
+        """
+        if self._sock is None:
+            self._open()
+        seq = self._request()
+
+        stats = {}
+        buf = self._buffer
+        unpack_header = _NLMSGHDR.unpack_from
+        unpack_attr = _RTATTR.unpack_from
+        unpack_stats = _STATS64.unpack_from
+        header_size = _NLMSGHDR.size
+        attrs_offset = header_size + _IFINFOMSG.size
+        stats_size = _STATS64.size
+        while True:
+            n = self._sock.recv_into(buf)
+            offset = 0
+            while offset + header_size <= n:
+                length, msg_type, flags, msg_seq, pid = unpack_header(buf, offset)
+                if length < header_size or offset + length > n:
+                    raise NetlinkError(errno.EIO, 'Truncated netlink message')
+                if msg_seq != seq:
+                    # A reply to a previous request which was not read to the end
+                    offset += _align(length)
+                    continue
+                if msg_type == NLMSG_DONE:
+                    return stats
+                if msg_type == NLMSG_ERROR:
+                    error = -struct.unpack_from('=i', buf, offset + header_size)[0]
+                    raise NetlinkError(error, os.strerror(error))
+                if msg_type == RTM_NEWLINK:
+                    end = offset + length
+                    attr = offset + attrs_offset
+                    # IFLA_IFNAME is the first attribute of the messages
+                    attr_length, attr_type = unpack_attr(buf, attr)
+                    if attr_type == IFLA_IFNAME and attr_length > 4:
+                        # NUL terminated string
+                        ifName = str(buf[attr + 4:attr + attr_length - 1])
+                        if interfaces is not None and ifName not in interfaces:
+                            offset += _align(length)
+                            continue
+                        # The interfaces of the same type have the same
+                        # attributes between IFLA_IFNAME and IFLA_STATS64, so
+                        # try where IFLA_STATS64 was in the previous message
+                        # (if the attribute header is there) before walking
+                        # through the attributes
+                        attr += _align(attr_length)
+                        hint = attr + self._stats_hint
+                        if hint + stats_size + 4 <= end and unpack_attr(buf, hint) == self._stats_attr:
+                            stats[ifName] = unpack_stats(buf, hint + 4)
+                            offset += _align(length)
+                            continue
+                        after_ifname = attr
+                    else:
+                        ifName = None
+                        after_ifname = None
+                    values = None
+                    while attr + 4 <= end:
+                        attr_length, attr_type = unpack_attr(buf, attr)
+                        if attr_length < 4:
+                            break
+                        if attr_type == IFLA_IFNAME:
+                            ifName = str(buf[attr + 4:attr + attr_length - 1])
+                            if interfaces is not None and ifName not in interfaces:
+                                break
+                            after_ifname = attr + _align(attr_length)
+                        elif attr_type == IFLA_STATS64 and attr_length - 4 >= stats_size:
+                            values = unpack_stats(buf, attr + 4)
+                            if after_ifname is not None:
+                                self._stats_attr = (attr_length, attr_type)
+                                self._stats_hint = attr - after_ifname
+                            if ifName is not None:
+                                # The rest of the attributes are not needed
+                                break
+                        attr += _align(attr_length)
+                    if ifName is not None and values is not None \
+                            and (interfaces is None or ifName in interfaces):
+                        stats[ifName] = values
+                offset += _align(length)
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except socket.error:
+                pass
+            self._sock = None
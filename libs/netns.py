@@ -0,0 +1,132 @@
+# Copyright (C) 2014  Vangelis Tasoulas <vangelis@tasoulas.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import logging
+
+__all__ = ['NetnsScanner', 'NETNS_DIRS']
+
+LOG = logging.getLogger('default.' + __name__)
+
+# Directories with the bind mounts of the named network namespaces
+# ('ip netns add', docker)
+NETNS_DIRS = ('/var/run/netns', '/var/run/docker/netns')
+
+#----------------------------------------------------------------------
+class NetnsScanner(object):
+    """
+    Discovers the network namespaces of the running processes through
+    /proc/<pid>/ns/net, and keeps one process (the representative) of
+    every namespace, so that the files of the namespace can be read from
+    /proc/<pid>/net/.
+
+    The namespaces are identified by the inode of their nsfs file. The
+    scan is incremental: only the processes which were started since the
+    previous scan are resolved, the exited processes are forgotten, and
+    the representative of every namespace is checked (its pid may have
+    been reused by a process of another namespace).
+
+    #### Sample code ####
+    scanner = NetnsScanner()
+    for inode, pid in scanner.scan().items():
+        netdev = open('/proc/' + str(pid) + '/net/dev').read()
+    """
+
+    def __init__(self, proc='/proc', netns_dirs=NETNS_DIRS):
+        self.proc = proc
+        self.netns_dirs = netns_dirs
+        # The namespace inode of every known pid (None if it cannot be read)
+        self._pid_ns = {}
+        # The pids of every namespace
+        self._members = {}
+        # The representative pid of every namespace
+        self._reps = {}
+
+    def nsInode(self, pid):
+        """
+        Returns the inode of the network namespace of 'pid', or None if
+        it cannot be read (the process exited, or permission denied)
+        """
+        try:
+            # The link is 'net:[<inode>]'
+            return int(os.readlink(os.path.join(self.proc, str(pid), 'ns', 'net'))[5:-1])
+        except (OSError, ValueError):
+            return None
+
+    def own(self):
+        """
+        Returns the inode of the network namespace of this process
+        """
+        return self.nsInode('self')
+
+    def names(self):
+        """
+        Returns the names of the named network namespaces (the bind
+        mounts in netns_dirs) by their inode
+        """
+        names = {}
+        for netns_dir in self.netns_dirs:
+            try:
+                entries = os.listdir(netns_dir)
+            except OSError:
+                continue
+            for name in sorted(entries):
+                try:
+                    names.setdefault(os.stat(os.path.join(netns_dir, name)).st_ino, name)
+                except OSError:
+                    pass
+        return names
+
+    def _add(self, pid, inode):
+        self._pid_ns[pid] = inode
+        if inode is not None:
+            self._members.setdefault(inode, set()).add(pid)
+            self._reps.setdefault(inode, pid)
+
+    def _remove(self, pid):
+        inode = self._pid_ns.pop(pid)
+        if inode is None:
+            return
+        members = self._members[inode]
+        members.discard(pid)
+        if not members:
+            del self._members[inode]
+            del self._reps[inode]
+        elif self._reps[inode] == pid:
+            self._reps[inode] = next(iter(members))
+
+    def scan(self):
+        """
+        Update the namespaces with the processes started or exited since
+        the previous scan, and return the representative pid of every
+        network namespace by its inode. The returned dictionary must not
+        be modified.
+        """
+        pids = set(int(entry) for entry in os.listdir(self.proc) if entry.isdigit())
+        known = set(self._pid_ns)
+        for pid in known - pids:
+            self._remove(pid)
+        for pid in pids - known:
+            self._add(pid, self.nsInode(pid))
+
+        # A pid of an exited representative may be reused by a process of
+        # another namespace, or the representative may have moved to another
+        # namespace (setns, unshare)
+        for inode, pid in list(self._reps.items()):
+            current = self.nsInode(pid)
+            if current != inode:
+                self._remove(pid)
+                self._add(pid, current)
+        return self._reps
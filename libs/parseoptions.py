@@ -22,6 +22,9 @@ import traceback
 import datetime
 from libs import globalvars
 import helperfuncs
+from libs.scheduler import OVERRUN_POLICIES
+from libs.writer import OVERFLOW_POLICIES, OUTPUT_FORMATS, COMPRESSIONS
+from libs.binaryformat import BINARY_ENCODINGS
 
 LOG = logging.getLogger('default.' + __name__)
 LOG_CONSOLE = logging.getLogger('console.' + __name__)
@@ -354,6 +357,129 @@ def _read_config_file(opts):
                     globalvars.intervalBetweenSamples = config.getfloat(CurrentSection, "intervalBetweenSamples")
                     LOG.debug("intervalBetweenSamples = " + str(globalvars.intervalBetweenSamples))
 
+                if(config.has_option(CurrentSection, "align_samples_to_wallclock")):
+                    globalvars.align_samples_to_wallclock = config.getboolean(CurrentSection, "align_samples_to_wallclock")
+                    LOG.debug("align_samples_to_wallclock = " + str(globalvars.align_samples_to_wallclock))
+
+                if(config.has_option(CurrentSection, "overrun_policy")):
+                    globalvars.overrun_policy = config.get(CurrentSection, "overrun_policy").strip().lower()
+                    if(globalvars.overrun_policy not in OVERRUN_POLICIES):
+                        LOG.error("overrun_policy must be one of: " + ", ".join(OVERRUN_POLICIES))
+                        exit(globalvars.exitCode.INCORRECT_USAGE)
+                    LOG.debug("overrun_policy = " + globalvars.overrun_policy)
+
+                if(config.has_option(CurrentSection, "multirate_output")):
+                    globalvars.multirate_output = config.get(CurrentSection, "multirate_output").strip().lower()
+                    if(globalvars.multirate_output not in ('carry_forward', 'split')):
+                        LOG.error("multirate_output must be one of: carry_forward, split")
+                        exit(globalvars.exitCode.INCORRECT_USAGE)
+                    LOG.debug("multirate_output = " + globalvars.multirate_output)
+
+                if(config.has_option(CurrentSection, "worker_pool_size")):
+                    globalvars.worker_pool_size = config.getint(CurrentSection, "worker_pool_size")
+                    if(globalvars.worker_pool_size < 0):
+                        LOG.error("worker_pool_size must be 0 or a positive integer.")
+                        exit(globalvars.exitCode.INCORRECT_USAGE)
+                    LOG.debug("worker_pool_size = " + str(globalvars.worker_pool_size))
+
+                if(config.has_option(CurrentSection, "collect_deadline")):
+                    globalvars.collect_deadline = config.getfloat(CurrentSection, "collect_deadline")
+                    if(globalvars.collect_deadline < 0):
+                        LOG.error("collect_deadline must be 0 or a positive number.")
+                        exit(globalvars.exitCode.INCORRECT_USAGE)
+                    LOG.debug("collect_deadline = " + str(globalvars.collect_deadline))
+
+                if(config.has_option(CurrentSection, "late_results")):
+                    globalvars.late_results = config.get(CurrentSection, "late_results").strip().lower()
+                    if(globalvars.late_results not in ('discard', 'prev_results')):
+                        LOG.error("late_results must be one of: discard, prev_results")
+                        exit(globalvars.exitCode.INCORRECT_USAGE)
+                    LOG.debug("late_results = " + globalvars.late_results)
+
+                if(config.has_option(CurrentSection, "writer_queue_size")):
+                    globalvars.writer_queue_size = config.getint(CurrentSection, "writer_queue_size")
+                    if(globalvars.writer_queue_size < 1):
+                        LOG.error("writer_queue_size must be a positive integer.")
+                        exit(globalvars.exitCode.INCORRECT_USAGE)
+                    LOG.debug("writer_queue_size = " + str(globalvars.writer_queue_size))
+
+                if(config.has_option(CurrentSection, "writer_overflow")):
+                    globalvars.writer_overflow = config.get(CurrentSection, "writer_overflow").strip().lower()
+                    if(globalvars.writer_overflow not in OVERFLOW_POLICIES):
+                        LOG.error("writer_overflow must be one of: " + ", ".join(OVERFLOW_POLICIES))
+                        exit(globalvars.exitCode.INCORRECT_USAGE)
+                    LOG.debug("writer_overflow = " + globalvars.writer_overflow)
+
+                if(config.has_option(CurrentSection, "writer_spill_size")):
+                    globalvars.writer_spill_size = config.getint(CurrentSection, "writer_spill_size")
+                    if(globalvars.writer_spill_size < 1):
+                        LOG.error("writer_spill_size must be a positive integer.")
+                        exit(globalvars.exitCode.INCORRECT_USAGE)
+                    LOG.debug("writer_spill_size = " + str(globalvars.writer_spill_size))
+
+                if(config.has_option(CurrentSection, "flush_every_rows")):
+                    globalvars.flush_every_rows = config.getint(CurrentSection, "flush_every_rows")
+                    LOG.debug("flush_every_rows = " + str(globalvars.flush_every_rows))
+
+                if(config.has_option(CurrentSection, "flush_interval")):
+                    globalvars.flush_interval = config.getfloat(CurrentSection, "flush_interval")
+                    LOG.debug("flush_interval = " + str(globalvars.flush_interval))
+
+                if(config.has_option(CurrentSection, "fsync_on_rotate")):
+                    globalvars.fsync_on_rotate = config.getboolean(CurrentSection, "fsync_on_rotate")
+                    LOG.debug("fsync_on_rotate = " + str(globalvars.fsync_on_rotate))
+
+                if(config.has_option(CurrentSection, "output_format")):
+                    globalvars.output_format = config.get(CurrentSection, "output_format").strip().lower()
+                    if(globalvars.output_format not in OUTPUT_FORMATS):
+                        LOG.error("output_format must be one of: " + ", ".join(OUTPUT_FORMATS))
+                        exit(globalvars.exitCode.INCORRECT_USAGE)
+                    LOG.debug("output_format = " + globalvars.output_format)
+
+                if(config.has_option(CurrentSection, "binary_encoding")):
+                    globalvars.binary_encoding = config.get(CurrentSection, "binary_encoding").strip().lower()
+                    if(globalvars.binary_encoding not in BINARY_ENCODINGS):
+                        LOG.error("binary_encoding must be one of: " + ", ".join(BINARY_ENCODINGS))
+                        exit(globalvars.exitCode.INCORRECT_USAGE)
+                    LOG.debug("binary_encoding = " + globalvars.binary_encoding)
+
+                if(config.has_option(CurrentSection, "binary_keyframe_interval")):
+                    globalvars.binary_keyframe_interval = config.getint(CurrentSection, "binary_keyframe_interval")
+                    if(globalvars.binary_keyframe_interval < 1):
+                        LOG.error("binary_keyframe_interval must be 1 or greater")
+                        exit(globalvars.exitCode.INCORRECT_USAGE)
+                    LOG.debug("binary_keyframe_interval = " + str(globalvars.binary_keyframe_interval))
+
+                if(config.has_option(CurrentSection, "output_compression")):
+                    globalvars.output_compression = config.get(CurrentSection, "output_compression").strip().lower()
+                    if(globalvars.output_compression not in COMPRESSIONS):
+                        LOG.error("output_compression must be one of: " + ", ".join(sorted(COMPRESSIONS)))
+                        exit(globalvars.exitCode.INCORRECT_USAGE)
+                    LOG.debug("output_compression = " + globalvars.output_compression)
+
+                if(config.has_option(CurrentSection, "compression_level")):
+                    globalvars.compression_level = config.getint(CurrentSection, "compression_level")
+                    if(not 1 <= globalvars.compression_level <= 9):
+                        LOG.error("compression_level must be between 1 and 9")
+                        exit(globalvars.exitCode.INCORRECT_USAGE)
+                    LOG.debug("compression_level = " + str(globalvars.compression_level))
+
+                if(config.has_option(CurrentSection, "rotate_size_mb")):
+                    globalvars.rotate_size_mb = config.getfloat(CurrentSection, "rotate_size_mb")
+                    LOG.debug("rotate_size_mb = " + str(globalvars.rotate_size_mb))
+
+                if(config.has_option(CurrentSection, "rotate_interval")):
+                    globalvars.rotate_interval = config.getint(CurrentSection, "rotate_interval")
+                    LOG.debug("rotate_interval = " + str(globalvars.rotate_interval))
+
+                if(config.has_option(CurrentSection, "float_precision")):
+                    globalvars.float_precision = config.getint(CurrentSection, "float_precision")
+                    LOG.debug("float_precision = " + str(globalvars.float_precision))
+
+                if(config.has_option(CurrentSection, "console_float_precision")):
+                    globalvars.console_float_precision = config.getint(CurrentSection, "console_float_precision")
+                    LOG.debug("console_float_precision = " + str(globalvars.console_float_precision))
+
             ##################################################################################
             ##################################################################################
             ##################################################################################
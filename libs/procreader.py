@@ -0,0 +1,147 @@
+# Copyright (C) 2014  Vangelis Tasoulas <vangelis@tasoulas.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import errno
+import logging
+
+__all__ = ['ProcFile', 'ProcFileCache']
+
+LOG = logging.getLogger('default.' + __name__)
+
+# The errors after which a file is opened again: the file was removed
+# (i.e. the device was unplugged) and it may have been created again,
+# or the handle went stale (NFS)
+_REOPEN_ERRNOS = (errno.ENOENT, errno.ESTALE, errno.ENODEV)
+
+# Initial size of the read buffers. The buffers grow (and stay grown)
+# when a file doesn't fit in them.
+BUFFER_SIZE = 4096
+
+#----------------------------------------------------------------------
+class ProcFile(object):
+    """
+    A procfs/sysfs file which is kept open between the samples.
+
+    The files of /proc and /sys generate their contents when they are
+    read, so instead of opening the file on every sample, the file
+    descriptor is kept open and read() seeks to the start and reads the
+    fresh contents in a reusable buffer.
+
+    If the file was removed (i.e. a hotplugged device was unplugged), or
+    it did not exist when it was first read, it is opened again on the
+    next read(). IOError is raised while the file cannot be read.
+
+    #### Sample code ####
+    stat = ProcFile('/proc/stat')
+    while True:
+        for line in stat.read().splitlines():
+            ...
+    """
+
+    def __init__(self, path, size=BUFFER_SIZE):
+        self.path = path
+        self._buffer = bytearray(size)
+        self._f = None
+        # Statistics
+        self.reads = 0
+        self.reopens = 0
+
+    def _open(self):
+        self._f = io.open(self.path, 'rb', buffering=0)
+
+    def _readInto(self):
+        """
+        Read the whole file in the buffer and return its size
+        """
+        f = self._f
+        f.seek(0)
+        n = 0
+        while True:
+            if n == len(self._buffer):
+                # The buffer is full. Double its size and continue reading.
+                self._buffer.extend(bytearray(len(self._buffer)))
+            # Reads of procfs files may return less than requested,
+            # so read until the end of the file
+            count = f.readinto(memoryview(self._buffer)[n:])
+            if not count:
+                return n
+            n += count
+
+    def read(self):
+        """
+        Returns the current contents of the file
+        """
+        if self._f is None:
+            self._open()
+        try:
+            n = self._readInto()
+        except (IOError, OSError) as e:
+            if e.errno not in _REOPEN_ERRNOS:
+                raise
+            # The file was removed, try to open it again
+            self.close()
+            self._open()
+            self.reopens += 1
+            LOG.debug("'" + self.path + "' was opened again after: " + str(e))
+            n = self._readInto()
+        self.reads += 1
+        return memoryview(self._buffer)[:n].tobytes()
+
+    def close(self):
+        if self._f is not None:
+            try:
+                self._f.close()
+            except (IOError, OSError):
+                pass
+            self._f = None
+
+#----------------------------------------------------------------------
+class ProcFileCache(object):
+    """
+    Keeps a ProcFile open for every path which is read.
+
+    The files are not locked, so a cache must not be shared by code which
+    reads the same files concurrently (every plugin has its own cache, and
+    the collect() of a plugin never runs in parallel with itself).
+    """
+
+    def __init__(self):
+        self._files = {}
+
+    def read(self, path):
+        """
+        Returns the current contents of the file 'path'
+        """
+        f = self._files.get(path)
+        if f is None:
+            f = self._files[path] = ProcFile(path)
+        return f.read()
+
+    def forget(self, path):
+        """
+        Close the file 'path' and remove it from the cache
+        """
+        f = self._files.pop(path, None)
+        if f is not None:
+            f.close()
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+    def __len__(self):
+        return len(self._files)
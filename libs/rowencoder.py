@@ -0,0 +1,176 @@
+# Copyright (C) 2014  Vangelis Tasoulas <vangelis@tasoulas.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+
+__all__ = ['RowEncoder', 'INT', 'COUNTER', 'FLOAT', 'STR']
+
+# Column types
+INT = 'int'
+COUNTER = 'counter'
+FLOAT = 'float'
+STR = 'str'
+
+# The value of DataCollector.COUNTER, used in the layouts returned by
+# describe_fields() (libs.collector is not imported, to avoid a circular
+# import through yapsy and libs.parseoptions)
+_DESCRIBED_COUNTER = 3
+
+LOG = logging.getLogger('default.' + __name__)
+
+#----------------------------------------------------------------------
+class RowEncoder(object):
+    """
+    Encodes the results of the plugins in delimiter separated output lines.
+
+    The encoder is compiled once from the layout of the results of each
+    plugin (the nested dictionaries returned by collect()). Every column
+    gets a fixed slot in a preallocated list, so encoding a row only walks
+    the compiled layout, fills the slots and joins them once.
+
+    Values missing from the results of a plugin (or all of the values of a
+    plugin, if its results are None) are filled with the NA value of the
+    plugin, so the columns never get misaligned.
+
+    The type of every column (INT, COUNTER, FLOAT or STR) is kept in self.types. It
+    is taken from the layout returned by describe_fields(), or guessed from
+    the values of the template if the plugin doesn't describe its fields.
+
+    #### Sample code ####
+    encoder = RowEncoder(['datetime', 'timestamp'], delimiter=',')
+    encoder.addSegment('cpu', cpu_results, NA_value='NA')
+    encoder.addSegment('net', net_results, NA_value='NA')
+    print(encoder.getHeaderLine())
+    print(encoder.encode([cpu_results, net_results], ['2014-01-01_00:00:00', '1388534400000000']))
+    """
+
+    def __init__(self, leading_columns=None, delimiter=",", leading_types=None):
+        self.delimiter = delimiter
+        self.columns = list(leading_columns) if leading_columns else []
+        self.types = list(leading_types) if leading_types else [STR] * len(self.columns)
+        # The NA value of every column
+        self.NA_values = [None] * len(self.columns)
+        self._num_leading = len(self.columns)
+        # One (name, tree, slots, NA_value) tuple per segment
+        self._segments = []
+        self._slots = [None] * len(self.columns)
+
+    def addSegment(self, name, template, NA_value='NA', described=False):
+        """
+        Compile the layout of the results of a plugin.
+
+        name:      A name for the segment (used only for debugging)
+        template:  A sample of the results of the plugin (nested dictionaries),
+                   or the layout returned by its describe_fields()
+        NA_value:  The value used to fill missing values
+        described: True if the template was returned by describe_fields()
+        """
+        first_slot = len(self.columns)
+        tree = self._compile(template, None, NA_value, described)
+        slots = range(first_slot, len(self.columns))
+        self._slots.extend([NA_value] * len(slots))
+        self.NA_values.extend([NA_value] * len(slots))
+        self._segments.append((name, tree, slots, NA_value))
+        LOG.debug("Row encoder segment '" + str(name) + "' compiled with " + str(len(slots)) + " column(s)")
+
+    @staticmethod
+    def _getType(value, NA_value, described):
+        """
+        Returns the column type of a value of the template
+        """
+        if described:
+            # describe_fields() uses the DataCollector.INT, COUNTER,
+            # FLOAT and STR constants
+            if isinstance(value, float):
+                return FLOAT
+            if isinstance(value, int) and not isinstance(value, bool):
+                return COUNTER if value == _DESCRIBED_COUNTER else INT
+            return STR
+
+        # Guess from the value. Numbers are stored as floats because
+        # the type of the values of undescribed plugins may change
+        # from sample to sample (i.e. '0' and later '0.5')
+        if value is None or value == NA_value:
+            return FLOAT
+        try:
+            float(value)
+            return FLOAT
+        except (TypeError, ValueError):
+            return STR
+
+    def _compile(self, template, parent_key, NA_value, described):
+        """
+        Returns a list of (key, node) tuples, where node is either the slot
+        number of a value, or a (subtree, slots) tuple for nested dictionaries
+        """
+        tree = []
+        if not isinstance(template, dict):
+            return tree
+
+        for k, v in template.items():
+            new_key = "{0}_{1}".format(parent_key, k) if parent_key else str(k)
+            if isinstance(v, dict):
+                first_slot = len(self.columns)
+                subtree = self._compile(v, new_key, NA_value, described)
+                tree.append((k, (subtree, range(first_slot, len(self.columns)))))
+            else:
+                tree.append((k, len(self.columns)))
+                self.columns.append(new_key)
+                self.types.append(self._getType(v, NA_value, described))
+        return tree
+
+    def getHeaderLine(self):
+        """
+        Returns the header line (without a trailing new line)
+        """
+        return self.delimiter.join(self.columns)
+
+    def _fill(self, slots, tree, results, NA_value):
+        for k, node in tree:
+            v = results.get(k, NA_value)
+            if node.__class__ is int:
+                slots[node] = NA_value if v is None else v
+            elif isinstance(v, dict):
+                self._fill(slots, node[0], v, NA_value)
+            else:
+                for slot in node[1]:
+                    slots[slot] = NA_value
+
+    def fill(self, results, leading_values=None):
+        """
+        Fill the slots with the leading values and the results of each
+        segment (in the order the segments were added) and return them.
+
+        The returned list is reused for every row, so copy it if it needs
+        to be kept.
+        """
+        slots = self._slots
+        if leading_values:
+            slots[0:self._num_leading] = leading_values
+
+        for (name, tree, segment_slots, NA_value), segment_results in zip(self._segments, results):
+            if isinstance(segment_results, dict):
+                self._fill(slots, tree, segment_results, NA_value)
+            else:
+                for slot in segment_slots:
+                    slots[slot] = NA_value
+        return slots
+
+    def encode(self, results, leading_values=None):
+        """
+        Returns an output line (without a trailing new line) for the
+        given results
+        """
+        return self.delimiter.join(map(str, self.fill(results, leading_values)))
@@ -0,0 +1,255 @@
+# Copyright (C) 2014  Vangelis Tasoulas <vangelis@tasoulas.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import math
+import ctypes
+import ctypes.util
+import logging
+
+__all__ = ['monotonic', 'Tick', 'TickScheduler', 'OVERRUN_POLICIES']
+
+LOG = logging.getLogger('default.' + __name__)
+
+# Accepted values for the overrun_policy
+OVERRUN_POLICIES = ('skip', 'catchup', 'coalesce')
+
+#----------------------------------------------------------------------
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+# CLOCK_MONOTONIC as defined in <linux/time.h>
+_CLOCK_MONOTONIC = 1
+
+def _load_clock_gettime():
+    """
+    Python 2 doesn't provide time.monotonic(), so call clock_gettime()
+    from libc (or librt for older glibc versions) through ctypes.
+    """
+    for libname in ('c', 'rt'):
+        path = ctypes.util.find_library(libname)
+        if not path:
+            continue
+        try:
+            lib = ctypes.CDLL(path, use_errno=True)
+            clock_gettime = lib.clock_gettime
+        except (OSError, AttributeError):
+            continue
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+        clock_gettime.restype = ctypes.c_int
+        return clock_gettime
+    return None
+
+_clock_gettime = _load_clock_gettime()
+
+def monotonic():
+    """
+    Returns the value (in fractional seconds) of a monotonic clock, which
+    cannot go backwards and it is not affected by system clock updates
+    (NTP steps, manual changes etc.)
+
+    If the monotonic clock is not available, time.time() is returned.
+    """
+    if _clock_gettime is not None:
+        ts = _timespec()
+        if _clock_gettime(_CLOCK_MONOTONIC, ctypes.byref(ts)) == 0:
+            return ts.tv_sec + ts.tv_nsec * 1e-9
+    return time.time()
+
+if _clock_gettime is None:
+    LOG.warning("Monotonic clock is not available. Falling back to the wall-clock time.")
+
+#----------------------------------------------------------------------
+class Tick(object):
+    """
+    Describes a single tick returned by TickScheduler.wait()
+
+    index:          The number of the tick on the schedule grid. The grid
+                    starts when the schedule starts, or from the UNIX epoch if
+                    the ticks are aligned to the wall-clock (so that the
+                    index is the number of intervals since 1970-01-01)
+    scheduled_time: The wall-clock time (UNIX timestamp) at which the tick
+                    was scheduled to run
+    missed:         The number of deadlines missed right before this tick
+    """
+    __slots__ = ('index', 'scheduled_time', 'missed')
+
+    def __init__(self, index, scheduled_time, missed=0):
+        self.index = index
+        self.scheduled_time = scheduled_time
+        self.missed = missed
+
+#----------------------------------------------------------------------
+class TickScheduler(object):
+    """
+    Drift-free scheduler for the main collection loop.
+
+    The deadline of every tick is calculated from the start of the
+    schedule (anchor + index * interval) on a monotonic clock, so the
+    time spent collecting or sleeping inaccurately never accumulates.
+    The first tick is due one interval after the first call of wait(),
+    or on the next wall-clock boundary if aligned.
+
+    interval:       Seconds between the ticks. If 0 or negative, the
+                    ticks are returned immediately one after the other.
+    align:          If True, the ticks are aligned to wall-clock boundaries
+                    which are multiple of the interval (i.e. a 10 seconds
+                    interval will tick exactly at :00, :10, :20 ...)
+    overrun_policy: What to do when a tick is late by one or more whole
+                    intervals (the previous tick took too long):
+                      skip      drop all the missed ticks (even the late one)
+                                and wait for the next tick on the grid
+                      catchup   run all the missed ticks back to back until
+                                the schedule is caught up
+                      coalesce  run a single tick immediately in place of all
+                                the missed ones and continue on the grid
+
+    #### Sample code ####
+    scheduler = TickScheduler(10, align=True)
+    while True:
+        tick = scheduler.wait()
+        collect()
+    """
+
+    def __init__(self, interval, align=False, overrun_policy='coalesce', clock=monotonic, wallclock=time.time):
+        if overrun_policy not in OVERRUN_POLICIES:
+            raise ValueError("Unknown overrun policy '" + str(overrun_policy) + "'. Use one of " + str(OVERRUN_POLICIES))
+
+        self.interval = float(interval) if interval > 0 else 0.0
+        self.align = align
+        self.overrun_policy = overrun_policy
+        self._clock = clock
+        self._wallclock = wallclock
+
+        # If the wall-clock moves relatively to the monotonic clock more
+        # than this threshold (i.e. NTP step), the aligned grid is re-anchored.
+        self.resync_threshold = min(1.0, self.interval / 2)
+
+        # Statistics
+        self.ticks = 0
+        self.late_ticks = 0
+        self.missed_deadlines = 0
+
+        self._anchor = None
+        self._offset = None
+        self._next_index = 0
+        # The missed deadlines of the catchup policy are counted up to
+        # this tick, so that the ticks run back to back count them once
+        self._missed_until = 0
+
+    def _start(self):
+        """
+        Anchor the schedule grid on the monotonic clock
+        """
+        now = self._clock()
+        wall_now = self._wallclock()
+        self._offset = wall_now - now
+        if self.align and self.interval:
+            self._align_grid(now, wall_now)
+        else:
+            # The first tick is one interval after the start
+            self._anchor = now
+            self._next_index = 1
+
+    def _align_grid(self, now, wall_now):
+        """
+        Anchor the grid on the UNIX epoch, mapped on the monotonic clock,
+        and place the next tick on the next wall-clock boundary
+        """
+        self._anchor = now - wall_now
+        self._next_index = int(math.ceil(wall_now / self.interval))
+        self._missed_until = 0
+
+    def _resync(self, now):
+        """
+        Re-anchor the aligned grid if the wall-clock has been stepped
+        """
+        offset = self._wallclock() - now
+        if abs(offset - self._offset) > self.resync_threshold:
+            LOG.warning("Wall-clock time changed by " + str(round(offset - self._offset, 6)) + " seconds. Re-aligning the sampling schedule.")
+            self._offset = offset
+            self._align_grid(now, now + offset)
+
+    def deadline(self, index):
+        """
+        Returns the deadline of tick 'index' on the monotonic clock
+        """
+        return self._anchor + index * self.interval
+
+    def wait(self):
+        """
+        Sleep until the next tick is due and return a Tick instance
+        """
+        if self._anchor is None:
+            self._start()
+
+        if not self.interval:
+            self.ticks += 1
+            index = self._next_index
+            self._next_index += 1
+            return Tick(index, self._wallclock())
+
+        now = self._clock()
+        if self.align:
+            self._resync(now)
+
+        index = self._next_index
+        missed = 0
+        deadline = self.deadline(index)
+        if now > deadline:
+            # Number of whole intervals passed since the deadline of this tick
+            passed = int((now - deadline) // self.interval)
+            if passed == 0:
+                # Late but still inside its own interval. Run it now.
+                self.late_ticks += 1
+            elif self.overrun_policy == 'catchup':
+                # Run the missed ticks one by one, without sleeping.
+                # They are counted as missed by the first late tick only.
+                missed = max(0, index + passed - max(index, self._missed_until))
+                self._missed_until = max(self._missed_until, index + passed)
+                self.late_ticks += 1
+            elif self.overrun_policy == 'coalesce':
+                # Run one tick now in place of all the missed ones
+                missed = passed
+                index += passed
+                self.late_ticks += 1
+            else:
+                # skip: wait for the next tick on the grid
+                missed = passed + 1
+                index += passed + 1
+
+            if missed:
+                self.missed_deadlines += missed
+                LOG.warning("Sampling overran by " + str(round(now - deadline, 6)) + " seconds: " + str(missed) + " deadline(s) missed (" + str(self.missed_deadlines) + " in total)")
+
+        self._sleep_until(self.deadline(index))
+        self._next_index = index + 1
+        self.ticks += 1
+        return Tick(index, self.deadline(index) + self._offset, missed)
+
+    def _sleep_until(self, deadline):
+        # time.sleep() may return earlier than requested if
+        # a signal is received, so loop until the deadline
+        while True:
+            remaining = deadline - self._clock()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def stats(self):
+        """
+        Returns a string with the scheduling statistics
+        """
+        return "ticks: " + str(self.ticks) + ", late ticks: " + str(self.late_ticks) + ", missed deadlines: " + str(self.missed_deadlines)
@@ -0,0 +1,151 @@
+# Copyright (C) 2014  Vangelis Tasoulas <vangelis@tasoulas.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import logging
+import threading
+import Queue
+
+__all__ = ['Future', 'WorkerPool']
+
+LOG = logging.getLogger('default.' + __name__)
+
+# When waiting without a timeout, wake up periodically so that
+# KeyboardInterrupt can still be delivered to the main thread
+# (python 2 does not deliver signals while blocked in Event.wait())
+_WAIT_SLICE = 0.5
+
+#----------------------------------------------------------------------
+class Future(object):
+    """
+    Holds the result of a job submitted to a WorkerPool.
+
+    #### Sample code ####
+    future = pool.submit(plugin.collect, prevResults)
+    results = future.result()
+    """
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+
+    def done(self):
+        """
+        Returns True if the job has finished (successfully or not)
+        """
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the job to finish for at most 'timeout' seconds.
+        If timeout is None, wait forever.
+
+        Returns True if the job has finished
+        """
+        if timeout is None:
+            while not self._done.is_set():
+                self._done.wait(_WAIT_SLICE)
+            return True
+
+        self._done.wait(timeout)
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """
+        Return the value returned by the job. If the job raised an
+        exception, the same exception is raised here.
+
+        If the job has not finished within 'timeout' seconds, a
+        Queue.Empty exception is raised.
+        """
+        if not self.wait(timeout):
+            raise Queue.Empty()
+
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def _set_result(self, result):
+        self._result = result
+        self._done.set()
+
+    def _set_exception(self, exc_info):
+        self._exc_info = exc_info
+        self._done.set()
+
+#----------------------------------------------------------------------
+class WorkerPool(object):
+    """
+    A fixed size pool of long-lived worker threads.
+
+    The threads are started once and reused for every submitted job,
+    so that the collection loop doesn't pay for creating and tearing
+    down a thread per plugin on every sample.
+    """
+
+    def __init__(self, size, name='worker'):
+        if size < 1:
+            size = 1
+        self.size = size
+        self.name = name
+        self._jobs = Queue.Queue()
+        self._threads = []
+        self._shutdown = False
+
+        for i in range(self.size):
+            t = threading.Thread(target=self._worker, name="{0}-{1}".format(self.name, i))
+            # Daemon threads do not prevent the program from exiting if
+            # a plugin never returns.
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+
+        LOG.debug("Started a pool of " + str(self.size) + " '" + self.name + "' worker thread(s)")
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedule fn(*args, **kwargs) to run on one of the worker
+        threads and return a Future for its result.
+        """
+        if self._shutdown:
+            raise RuntimeError("Cannot submit jobs to a WorkerPool that has been shut down")
+
+        future = Future()
+        self._jobs.put((future, fn, args, kwargs))
+        return future
+
+    def shutdown(self, wait=True):
+        """
+        Stop the worker threads once the already submitted jobs are done.
+        """
+        self._shutdown = True
+        for t in self._threads:
+            self._jobs.put(None)
+        if wait:
+            for t in self._threads:
+                t.join()
+
+    def _worker(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+
+            future, fn, args, kwargs = job
+            try:
+                future._set_result(fn(*args, **kwargs))
+            except:
+                future._set_exception(sys.exc_info())
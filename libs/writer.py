@@ -0,0 +1,565 @@
+# Copyright (C) 2014  Vangelis Tasoulas <vangelis@tasoulas.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import bz2
+import gzip
+import time
+import zlib
+import logging
+import threading
+import traceback
+from collections import deque
+from libs.scheduler import monotonic
+
+try:
+    import lzma
+except ImportError:
+    # python 2 doesn't have lzma (unless the backports.lzma module is installed)
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+__all__ = ['AsyncWriter', 'CSVFormat', 'OutputFile', 'openOutputFile', 'valueFormatter', 'OVERFLOW_POLICIES', 'OUTPUT_FORMATS', 'COMPRESSIONS']
+
+LOG = logging.getLogger('default.' + __name__)
+
+# Accepted values for the writer_overflow option
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'spill')
+
+# Accepted values for the output_format option
+OUTPUT_FORMATS = ('csv', 'binary')
+
+# Accepted values for the output_compression option and their file extensions
+COMPRESSIONS = {'none': '', 'gzip': '.gz', 'bz2': '.bz2'}
+if lzma is not None:
+    COMPRESSIONS['xz'] = '.xz'
+
+# Compressed output is written in independently compressed blocks (complete
+# gzip members, bz2 or xz streams). A block is written on every flush, or
+# when this many uncompressed bytes are waiting.
+COMPRESSION_BLOCK_SIZE = 1024 * 1024
+
+# Maximum time the writer thread sleeps when there is nothing to do.
+# Also used when waiting without a timeout, so that KeyboardInterrupt
+# can still be delivered to the main thread.
+_WAIT_SLICE = 0.5
+
+#----------------------------------------------------------------------
+def valueFormatter(precision=None):
+    """
+    Returns a function which formats a value of a row as text.
+
+    The plugins return typed values (int, float or str), so the numbers
+    are formatted only when they are written. Floats are rounded to
+    'precision' decimal digits (i.e. 2 writes 33.333333 as 33.33), or
+    written with full precision if 'precision' is None or negative.
+    Everything else is written with str().
+    """
+    if precision is None or precision < 0:
+        formatFloat = repr
+    else:
+        formatFloat = lambda v: repr(round(v, precision))
+
+    def formatValue(v):
+        if v.__class__ is float:
+            return formatFloat(v)
+        return str(v)
+    return formatValue
+
+#----------------------------------------------------------------------
+class CSVFormat(object):
+    """
+    Formats rows (lists of values, or already joined lines) as
+    delimiter separated lines.
+
+    precision: The decimal digits of the float values (None or
+               negative for full precision). See valueFormatter().
+
+    Every output format provides header(), rows() and line(). See
+    libs.binaryformat.BinaryFormat for the binary output format.
+    """
+
+    # The output files are opened in text mode
+    binary = False
+
+    def __init__(self, delimiter=",", columns=None, precision=None):
+        self.delimiter = delimiter
+        self.columns = list(columns) if columns else []
+        self.precision = precision
+        self._format = valueFormatter(precision)
+
+    def header(self):
+        """
+        Returns the header line
+        """
+        return self.delimiter.join(self.columns) + "\n"
+
+    def line(self, row):
+        """
+        Returns a row as a line (without a trailing new line)
+        """
+        if isinstance(row, basestring):
+            return row
+        return self.delimiter.join(map(self._format, row))
+
+    def rows(self, rows):
+        """
+        Returns the lines of a list of rows
+        """
+        return "\n".join(map(self.line, rows)) + "\n"
+
+#----------------------------------------------------------------------
+def _compressor(compression, level):
+    """
+    Returns a function which compresses a block of data in a self-contained
+    member, which can be concatenated with the previous ones
+    """
+    if compression == 'gzip':
+        def compress(data):
+            # wbits = 16 + MAX_WBITS writes a gzip header and trailer
+            c = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            return c.compress(data) + c.flush()
+        return compress
+    if compression == 'bz2':
+        return lambda data: bz2.compress(data, max(1, level))
+    if compression == 'xz':
+        return lambda data: lzma.compress(data, preset=min(level, 9))
+    return None
+
+#----------------------------------------------------------------------
+def openOutputFile(path, compression='none'):
+    """
+    Open a (possibly compressed) output file for reading
+    """
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'bz2':
+        return bz2.BZ2File(path, 'rb')
+    if compression == 'xz':
+        return lzma.open(path, 'rb')
+    return open(path, 'rb')
+
+#----------------------------------------------------------------------
+class OutputFile(object):
+    """
+    A file object which compresses the written data and rotates the
+    output in segments.
+
+    Compressed data are written in blocks, which are compressed
+    independently of each other. A block is written on every flush() (or
+    when COMPRESSION_BLOCK_SIZE bytes are buffered), so if the collector
+    crashes, only the block which was not flushed yet is lost and the rest
+    of the file can still be decompressed.
+
+    path:            The path of the first segment
+    binary:          Open the segments in binary mode
+    compression:     One of COMPRESSIONS
+    level:           The compression level (1-9)
+    rotate_size:     Start a new segment when the current one reaches
+                     this size in bytes, as written on the disk (0 to disable)
+    rotate_interval: Start a new segment on every wall-clock boundary
+                     which is a multiple of this many seconds (i.e. 3600 to
+                     start a new segment every hour at :00) (0 to disable)
+
+    The rotated segments are named after the first one, with an increasing
+    '.NNN' number before the extension (i.e. data.csv.gz, data.001.csv.gz,
+    data.002.csv.gz ...). The rotation itself is driven by AsyncWriter,
+    which checks needsRotation() before writing a batch, and starts every
+    segment with the header of the output format.
+    """
+
+    def __init__(self, path, binary=False, compression='none', level=6, rotate_size=0, rotate_interval=0):
+        if compression not in COMPRESSIONS:
+            raise ValueError("Unknown compression '" + str(compression) + "'. Use one of " + str(sorted(COMPRESSIONS)))
+
+        self.name = path
+        self.binary = binary
+        self.compression = compression
+        self.rotate_size = rotate_size
+        self.rotate_interval = rotate_interval
+        self.segments = 1
+        self._compress = _compressor(compression, level)
+        self._buffer = []
+        self._buffered = 0
+
+        # Split the path in root + ext + compression extension, to name the next segments
+        suffix = COMPRESSIONS[compression]
+        base = path[:-len(suffix)] if suffix and path.endswith(suffix) else path
+        self._root, self._ext = os.path.splitext(base)
+        self._ext += suffix
+
+        self._open(path)
+
+    def _open(self, path):
+        self.path = path
+        self._f = open(path, 'ab' if self.binary or self._compress else 'a')
+        self.size = os.path.getsize(path)
+        self._period = self._currentPeriod()
+
+    def _currentPeriod(self):
+        if not self.rotate_interval:
+            return None
+        return int(time.time() // self.rotate_interval)
+
+    def _writeBlock(self):
+        if not self._buffer:
+            return
+        data = self._compress(b''.join(self._buffer))
+        self._buffer = []
+        self._buffered = 0
+        self._f.write(data)
+        self.size += len(data)
+
+    def write(self, data):
+        if self._compress is None:
+            self._f.write(data)
+            self.size += len(data)
+            return
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= COMPRESSION_BLOCK_SIZE:
+            self._writeBlock()
+
+    def tell(self):
+        """
+        Returns the size of the current segment, including the data
+        which are not compressed yet
+        """
+        return self.size + self._buffered
+
+    def flush(self):
+        self._writeBlock()
+        self._f.flush()
+
+    def fileno(self):
+        return self._f.fileno()
+
+    def needsRotation(self):
+        """
+        Returns True if a new segment must be started
+        """
+        if self.rotate_size and self.tell() >= self.rotate_size:
+            return True
+        return self._period is not None and self._currentPeriod() != self._period
+
+    def rotate(self):
+        """
+        Close the current segment and open the next one. The caller
+        should flush (and fsync) the current segment first.
+        """
+        self.close()
+        path = self.path
+        while os.path.exists(path):
+            path = self._root + "." + str(self.segments).zfill(3) + self._ext
+            self.segments += 1
+        self._open(path)
+        LOG.info("Output rotated to '" + path + "'")
+
+    def close(self):
+        self._writeBlock()
+        self._f.close()
+
+#----------------------------------------------------------------------
+class _FormatChange(object):
+    """
+    Queued by AsyncWriter.setFormat() between the rows of the old and
+    the new format
+    """
+    __slots__ = ('fmt', 'echo_fmt')
+
+    def __init__(self, fmt, echo_fmt):
+        self.fmt = fmt
+        self.echo_fmt = echo_fmt
+
+#----------------------------------------------------------------------
+class AsyncWriter(object):
+    """
+    Writes rows to a file from a dedicated writer thread.
+
+    The sampling thread only appends the rows in a bounded queue, so
+    slow storage never delays the sampling. The writer thread drains the
+    queue, formats the rows and writes them in batches.
+
+    f:                 The file object to write the rows to
+    fmt:               The output format (CSVFormat by default)
+    write_header:      Write the header of the format before any row
+    max_queue:         The maximum number of rows waiting in the queue
+    overflow:          What to do when the queue is full:
+                         block        wait until there is space in the queue
+                         drop_oldest  drop the oldest row in the queue
+                         spill        keep the rows in an in-memory overflow
+                                      buffer of up to max_spill rows, which
+                                      is drained (in order) after the queue.
+                                      The rows beyond max_spill are dropped.
+    max_spill:         The maximum number of rows in the overflow buffer
+    flush_every_rows:  Flush the file every N written rows (0 to disable)
+    flush_interval:    Flush the file every T seconds (0 to disable)
+    fsync_on_rotate:   fsync() the file when it is closed or rotated
+                       (files are rotated only if 'f' is an OutputFile)
+    echo:              Optional function called with every written row,
+                       formatted as a CSV line (i.e. to print the samples
+                       in the console)
+    echo_fmt:          The CSVFormat of the echoed lines (by default the
+                       line() of fmt is used)
+    close_file:        Close the file object when the writer is closed
+    """
+
+    def __init__(self, f, fmt=None, write_header=False, max_queue=1000, overflow='block', max_spill=10000, flush_every_rows=0,
+                 flush_interval=0, fsync_on_rotate=False, echo=None, echo_fmt=None, close_file=True):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy '" + str(overflow) + "'. Use one of " + str(OVERFLOW_POLICIES))
+
+        self.f = f
+        self.name = getattr(f, 'name', str(f))
+        self.fmt = fmt if fmt is not None else CSVFormat()
+        self.write_header = write_header
+        self.max_queue = max(1, max_queue)
+        self.overflow = overflow
+        self.max_spill = max(1, max_spill)
+        self.flush_every_rows = flush_every_rows
+        self.flush_interval = flush_interval
+        self.fsync_on_rotate = fsync_on_rotate
+        self.echo = echo
+        self.echo_fmt = echo_fmt if echo_fmt is not None else self.fmt
+        self.close_file = close_file
+
+        # Counters
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.rows_spilled = 0
+        self.max_queue_depth = 0
+        self.flushes = 0
+        self.rotations = 0
+        self.format_changes = 0
+
+        self._queue = deque()
+        self._spill = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._rows_since_flush = 0
+        self._last_flush = monotonic()
+        self._rotating = isinstance(f, OutputFile)
+        self._rows_in_segment = 0
+
+        self._thread = threading.Thread(target=self._run, name='writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, row):
+        """
+        Queue a row to be written. The row is either a list of values
+        (which must not be modified after it is queued), or a line
+        without the trailing new line.
+        """
+        with self._cond:
+            if self._closed:
+                raise ValueError("Cannot write to a closed AsyncWriter")
+
+            if self._spill:
+                # Keep the order of the rows while the overflow buffer is drained
+                self._spillRow(row)
+            elif len(self._queue) >= self.max_queue:
+                if self.overflow == 'block':
+                    while len(self._queue) >= self.max_queue:
+                        self._cond.wait(_WAIT_SLICE)
+                    self._queue.append(row)
+                elif self.overflow == 'drop_oldest':
+                    self._dropOldest()
+                    self._queue.append(row)
+                else:
+                    self._spillRow(row)
+            else:
+                self._queue.append(row)
+
+            depth = len(self._queue) + len(self._spill)
+            if depth > self.max_queue_depth:
+                self.max_queue_depth = depth
+            self._cond.notify_all()
+
+    def _spillRow(self, row):
+        """
+        Append a row to the overflow buffer, or drop it if the buffer is full
+        """
+        if len(self._spill) >= self.max_spill:
+            self.rows_dropped += 1
+            return
+        self._spill.append(row)
+        self.rows_spilled += 1
+
+    def _dropOldest(self):
+        """
+        Drop the oldest row of the queue (but not a format change)
+        """
+        for i, row in enumerate(self._queue):
+            if row.__class__ is not _FormatChange:
+                del self._queue[i]
+                self.rows_dropped += 1
+                return
+
+    def setFormat(self, fmt, echo_fmt=None):
+        """
+        Write the rows queued after this call in the format 'fmt' (i.e. when
+        the columns changed). The rows queued before are written in the
+        old format. The new format starts in a new segment of the output
+        (if 'f' is an OutputFile), or with its header.
+        """
+        change = _FormatChange(fmt, echo_fmt if echo_fmt is not None else fmt)
+        with self._cond:
+            if self._closed:
+                raise ValueError("Cannot change the format of a closed AsyncWriter")
+            if self._spill:
+                self._spill.append(change)
+            else:
+                # It may exceed max_queue by one, a format change is never dropped
+                self._queue.append(change)
+            self._cond.notify_all()
+
+    def queueDepth(self):
+        """
+        Returns the number of rows waiting to be written
+        """
+        with self._cond:
+            return len(self._queue) + len(self._spill)
+
+    def _flush(self, fsync=False):
+        self.f.flush()
+        if fsync:
+            try:
+                os.fsync(self.f.fileno())
+            except (AttributeError, OSError, IOError):
+                # i.e. sys.stdout, pipes
+                pass
+        self.flushes += 1
+        self._rows_since_flush = 0
+        self._last_flush = monotonic()
+
+    def _rotate(self):
+        """
+        Close the current segment of the output and start a new one
+        with the header of the output format
+        """
+        self._flush(fsync=self.fsync_on_rotate)
+        self.f.rotate()
+        self.f.write(self.fmt.header())
+        self.rotations += 1
+        self._rows_in_segment = 0
+
+    def _writeRows(self, rows):
+        if not rows:
+            return
+        # Every segment gets at least one batch, even if the header alone exceeds rotate_size
+        if self._rotating and self._rows_in_segment and self.f.needsRotation():
+            self._rotate()
+
+        self.f.write(self.fmt.rows(rows))
+        self.rows_written += len(rows)
+        self._rows_in_segment += len(rows)
+        self._rows_since_flush += len(rows)
+        if self.echo is not None:
+            for row in rows:
+                self.echo(self.echo_fmt.line(row))
+
+    def _changeFormat(self, change):
+        self.fmt = change.fmt
+        self.echo_fmt = change.echo_fmt
+        self.format_changes += 1
+        if self._rotating:
+            # _rotate() starts the new segment with the new header
+            self._rotate()
+        else:
+            self.f.write(self.fmt.header())
+            self._flush()
+
+    def _run(self):
+        if self.write_header:
+            try:
+                self.f.write(self.fmt.header())
+            except:
+                LOG.error("Failed to write the header in '" + self.name + "'")
+                LOG.error(traceback.format_exc())
+
+        while True:
+            with self._cond:
+                while not self._queue and not self._spill and not self._closed:
+                    timeout = _WAIT_SLICE
+                    if self.flush_interval and self._rows_since_flush:
+                        timeout = self._last_flush + self.flush_interval - monotonic()
+                        if timeout <= 0:
+                            break
+                        timeout = min(timeout, _WAIT_SLICE)
+                    self._cond.wait(timeout)
+
+                if self._queue:
+                    batch = self._queue
+                    self._queue = deque()
+                else:
+                    batch = self._spill
+                    self._spill = deque()
+                closing = self._closed and not self._queue and not self._spill
+                # Wake up any producer blocked on a full queue
+                self._cond.notify_all()
+
+            try:
+                rows = []
+                for row in batch:
+                    if row.__class__ is _FormatChange:
+                        self._writeRows(rows)
+                        rows = []
+                        self._changeFormat(row)
+                    else:
+                        rows.append(row)
+                self._writeRows(rows)
+
+                if closing:
+                    self._flush(fsync=self.fsync_on_rotate)
+                    return
+                if self._rows_since_flush:
+                    if self.flush_every_rows and self._rows_since_flush >= self.flush_every_rows:
+                        self._flush()
+                    elif self.flush_interval and monotonic() - self._last_flush >= self.flush_interval:
+                        self._flush()
+            except:
+                LOG.error("Failed to write in '" + self.name + "'")
+                LOG.error(traceback.format_exc())
+                if closing:
+                    return
+
+    def close(self):
+        """
+        Write all of the queued rows, flush and close the file
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+
+        while self._thread.is_alive():
+            self._thread.join(_WAIT_SLICE)
+
+        if self.close_file:
+            self.f.close()
+        LOG.debug("Writer for '" + self.name + "' closed. " + self.stats())
+
+    def stats(self):
+        """
+        Returns a string with the writer statistics
+        """
+        return ("rows written: " + str(self.rows_written) + ", max queue depth: " + str(self.max_queue_depth) +
+                ", rows dropped: " + str(self.rows_dropped) + ", rows spilled: " + str(self.rows_spilled) +
+                ", flushes: " + str(self.flushes) + ", rotations: " + str(self.rotations) +
+                ", format changes: " + str(self.format_changes))
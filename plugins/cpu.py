@@ -13,16 +13,23 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from libs.helperfuncs import quick_regexp
 from libs.collector import DataCollector
 import sys
 import traceback
+from array import array
 try:
     from collections import OrderedDict
 except ImportError:
     # python 2.6 or earlier, use backport
     from ordereddict import OrderedDict
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NAN = float('nan')
+
 ########################################################################
 class cpu_stats(DataCollector):
     """
@@ -50,6 +57,9 @@ class cpu_stats(DataCollector):
         'ctxt', 'btime', 'processes', 'procs_running', 'procs_blocked'
     )
 
+    # The file the statistics are read from
+    PROC_STAT_PATH = '/proc/stat'
+
     # Store the CPU core names to collect data from
     cpu_cores_to_collect_data_from = []
 
@@ -57,27 +67,36 @@ class cpu_stats(DataCollector):
     # All of the available fields can be seen in PROC_STAT_FIELDS
     fields_to_collect_data_from = []
 
+    # The percentages calculated for every cpu core, in the order they are returned
+    PCT_FIELDS = ('total_used', 'total_idle', 'user', 'system', 'nice', 'idle', 'iowait', 'irq', 'softirq')
+
     def __init__(self):
         super(cpu_stats, self).__init__()
+        self.available_cpu_fields = self.PROC_STAT_FIELDS[0:10]
+        # The results returned by the last collect() and their counters,
+        # so that the counters of the prevResults are not parsed again
+        self._last_samples = None
+        self._last_counters = None
 
+    #----------------------------------------------------------------------
+    def removeUnsupportedFields(self):
         # If the kernel is older, some of the PROC_STAT_FIELDS needs
         # to be removed (they do not exist in older kernels)
-        self.available_cpu_fields = self.PROC_STAT_FIELDS[0:10]
-        if(self.runningKernelIsGLEthan('2.6.33', Less=True)):
+        if(not self.hasCapability('guest_nice')):
             # guest_nice (supported since Linux 2.6.33)
             if('guest_nice' in self.PROC_STAT_FIELDS):
                 fields_list = list(self.PROC_STAT_FIELDS)
                 fields_list.remove('guest_nice')
                 self.PROC_STAT_FIELDS = tuple(fields_list)
                 self.available_cpu_fields = self.PROC_STAT_FIELDS[0:9]
-        if(self.runningKernelIsGLEthan('2.6.24', Less=True)):
+        if(not self.hasCapability('guest')):
             # guest (supported since Linux 2.6.24)
             if('guest' in self.PROC_STAT_FIELDS):
                 fields_list = list(self.PROC_STAT_FIELDS)
                 fields_list.remove('guest')
                 self.PROC_STAT_FIELDS = tuple(fields_list)
                 self.available_cpu_fields = self.PROC_STAT_FIELDS[0:8]
-        if(self.runningKernelIsGLEthan('2.6.11', Less=True)):
+        if(not self.hasCapability('steal')):
             # steal (supported since Linux 2.6.11)
             if('steal' in self.PROC_STAT_FIELDS):
                 fields_list = list(self.PROC_STAT_FIELDS)
@@ -87,6 +106,9 @@ class cpu_stats(DataCollector):
 
     #----------------------------------------------------------------------
     def readConfigVars(self):
+        # The kernel features are resolved by activate() before readConfigVars()
+        self.removeUnsupportedFields()
+
         # Default is to calculate CPU usage percentage
         self.options = {
             'include_cpu_cores': ['*'],
@@ -109,19 +131,12 @@ class cpu_stats(DataCollector):
         # Store them in self.cpu_cores_to_collect_data_from
         try:
             available_cpu_cores = []
-            r = quick_regexp()
-            # Open /proc/stat for get all available cpu cores
-            with open('/proc/stat') as f:
-                for line in f.readlines():
-                    if(r.search('cpu(\d+)?\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s*(\d+)?\s*(\d+)?\s*(\d+)?', line)):
-                        if(r.groups[0]):
-                            # Each "cpuN" line holds statistics for this specific core/thread.
-                            cpuName = 'cpu' + r.groups[0]
-                        else:
-                            # The very first "cpu" line aggregates the numbers in all of the other "cpuN" lines.
-                            cpuName = 'cpu_all'
-                        # Append the available cpu core in available_cpu_cores list
-                        available_cpu_cores.append(cpuName)
+            # Read /proc/stat for get all available cpu cores
+            for line in self.readProcFile(self.PROC_STAT_PATH).splitlines():
+                tokens = line.split()
+                if tokens and tokens[0].startswith('cpu'):
+                    # Append the available cpu core in available_cpu_cores list
+                    available_cpu_cores.append(self._cpuName(tokens[0]))
 
             # remove or add the included or excluded cpu core names read from the configuration file.
             # store them in self.cpu_cores_to_collect_data_from
@@ -149,160 +164,297 @@ class cpu_stats(DataCollector):
 
         self.LOG.debug('/proc/stat fields to be used for data collection: ' + str(self.fields_to_collect_data_from))
 
+        # Build the tables which drive the parsing of /proc/stat in collect(),
+        # so that every line is split once and only the needed tokens are read.
+        # The first token of the "cpu" lines is the cpu name, and the
+        # per cpu fields follow in the order of PROC_STAT_FIELDS.
+        self.cpu_field_index = [(i + 1, field) for i, field in enumerate(self.available_cpu_fields)
+                                if field in self.fields_to_collect_data_from]
+        # ctxt, btime, processes, procs_running, procs_blocked
+        self.stat_fields = frozenset(field for field in self.PROC_STAT_FIELDS
+                                     if field not in self.available_cpu_fields and field in self.fields_to_collect_data_from)
+        self.cpu_cores = frozenset(self.cpu_cores_to_collect_data_from)
+        self.sorted_cpu_cores = sorted(self.cpu_cores)
+
+        # The names of the cpu percentages. The guest_nice, guest and steal
+        # percentages exist only if the kernel supports the fields
+        self.pct_fields = ['pct_' + field for field in self.PCT_FIELDS]
+        for field in ('guest_nice', 'guest', 'steal'):
+            if field in self.available_cpu_fields:
+                self.pct_fields.append('pct_' + field)
+        # The position of the fields in the counter arrays
+        self._counter_index = dict((field, i) for i, field in enumerate(self.available_cpu_fields))
+        # The cached counters do not match the new layout
+        self._last_samples = None
+        self._last_counters = None
+
+    #----------------------------------------------------------------------
+    @staticmethod
+    def _cpuName(token):
+        """
+        Returns the name of a cpu line of /proc/stat
+        """
+        # The very first "cpu" line aggregates the numbers in all of the other "cpuN" lines.
+        # That's why we call it 'cpu_all'. Each "cpuN" line holds statistics for this specific core/thread.
+        return 'cpu_all' if token == 'cpu' else token
+
+    #----------------------------------------------------------------------
+    def describe_fields(self):
+        """
+        Returns the layout of the results of collect() without reading /proc/stat
+        """
+        fields = OrderedDict()
+        for cpuName in sorted(self.cpu_cores_to_collect_data_from):
+            fields[cpuName] = OrderedDict()
+            for field in self.available_cpu_fields:
+                if field in self.fields_to_collect_data_from:
+                    fields[cpuName][field] = self.COUNTER
+
+            if self.options['calc_cpu_perc']:
+                for field in self.pct_fields:
+                    fields[cpuName][field] = self.FLOAT
+
+        # ctxt, btime, processes, procs_running, procs_blocked
+        for field in self.PROC_STAT_FIELDS:
+            if field not in self.available_cpu_fields and field in self.fields_to_collect_data_from:
+                # procs_running and procs_blocked are gauges, btime is the boot time
+                fields[field] = self.COUNTER if field in ('ctxt', 'processes') else self.INT
+
+        return fields
+
+    #----------------------------------------------------------------------
+    @staticmethod
+    def _parseValues(tokens):
+        """
+        Returns the values of the tokens of a /proc/stat line as ints
+        (NA for the tokens which are not integers)
+        """
+        try:
+            return [int(token) for token in tokens]
+        except ValueError:
+            values = []
+            for token in tokens:
+                try:
+                    values.append(int(token))
+                except ValueError:
+                    values.append(cpu_stats.NA)
+            return values
+
+    #----------------------------------------------------------------------
+    def parseCounters(self, cpu_values):
+        """
+        Returns the per cpu counters of the cpu cores to collect data from,
+        as a cores x fields array of floats (in the order of sorted_cpu_cores
+        and available_cpu_fields), and a list which is True for the cores
+        whose counters are complete. The counters of the missing or
+        incomplete cores are NaN.
+
+        cpu_values holds the parsed values of every cpu core (or None).
+        """
+        nfields = len(self.available_cpu_fields)
+        counters = array('d')
+        complete = []
+        for values in cpu_values:
+            if values is not None and len(values) >= nfields and self.NA not in values[:nfields]:
+                counters.extend(values[:nfields])
+                complete.append(True)
+            else:
+                counters.extend([NAN] * nfields)
+                complete.append(False)
+        return counters, complete
+
+    #----------------------------------------------------------------------
+    def prevCounters(self, prevResults):
+        """
+        Returns the counters of prevResults (see parseCounters()).
+        The counters of the results of the last collect() are reused.
+        """
+        if prevResults is self._last_samples and self._last_counters is not None:
+            return self._last_counters
+
+        nfields = len(self.available_cpu_fields)
+        counters = array('d')
+        complete = []
+        for cpuName in self.sorted_cpu_cores:
+            try:
+                values = prevResults[cpuName]
+                counters.extend([float(values[field]) for field in self.available_cpu_fields])
+                complete.append(True)
+            except (KeyError, TypeError, ValueError):
+                counters.extend([NAN] * nfields)
+                complete.append(False)
+        return counters, complete
+
+    #----------------------------------------------------------------------
+    def cpuTimes(self, counters):
+        """
+        Returns the total time and the times the percentages are calculated
+        from (in the order of self.pct_fields, with the total idle time in
+        place of the total used time).
+
+        counters is indexed by the position of the fields in
+        available_cpu_fields, and holds either the floats of a single cpu
+        core, or the columns (numpy arrays) of all of the cores.
+        """
+        index = self._counter_index
+        Steal = Guest = Guest_nice = 0
+        if 'guest_nice' in index:
+            # guest_nice (supported since Linux 2.6.33)
+            Guest_nice = counters[index['guest_nice']]
+        if 'guest' in index:
+            # guest (supported since Linux 2.6.24)
+            Guest = counters[index['guest']]
+        if 'steal' in index:
+            # steal (supported since Linux 2.6.11)
+            Steal = counters[index['steal']]
+
+        User = counters[index['user']] - Guest
+        Nice = counters[index['nice']] - Guest_nice
+        System = counters[index['system']]
+        Irq = counters[index['irq']]
+        SoftIrq = counters[index['softirq']]
+        Idle = counters[index['idle']]
+        Iowait = counters[index['iowait']]
+
+        TotalIdle = Idle + Iowait
+        Virtual = Guest + Guest_nice
+        TotalSystem = System + Irq + SoftIrq
+        Total = User + Nice + TotalSystem + Virtual + TotalIdle + Steal
+
+        times = [TotalIdle, Idle, User, System, Nice, Idle, Iowait, Irq, SoftIrq]
+        if 'guest_nice' in index:
+            times.append(Guest_nice)
+        if 'guest' in index:
+            times.append(Guest)
+        if 'steal' in index:
+            times.append(Steal)
+        return Total, times
+
+    #----------------------------------------------------------------------
+    def calcPercentages(self, counters, complete, prevResults):
+        """
+        Returns the values of self.pct_fields for every cpu core
+        (in the order of sorted_cpu_cores).
+
+        The percentages of all of the cores are calculated in one batched
+        step over the counter arrays if numpy is available. The cores whose
+        total time did not increase are masked out of the division.
+        """
+        npct = len(self.pct_fields)
+        na_row = [self.NA] * npct
+        # If the total time did not increase, the cpu is reported as idle
+        idle_row = [0.0, 1.0, 0.0, 0.0, 0.0, 1.0] + [0.0] * (npct - 6)
+        ncores = len(self.sorted_cpu_cores)
+        if not prevResults or not ncores:
+            return [na_row] * ncores
+
+        prev_counters, prev_complete = self.prevCounters(prevResults)
+        nfields = len(self.available_cpu_fields)
+
+        if numpy is not None:
+            cur = numpy.frombuffer(counters, dtype=numpy.float64).reshape(ncores, nfields)
+            prev = numpy.frombuffer(prev_counters, dtype=numpy.float64).reshape(ncores, nfields)
+            Total, times = self.cpuTimes([cur[:, i] for i in range(nfields)])
+            prevTotal, prevTimes = self.cpuTimes([prev[:, i] for i in range(nfields)])
+            delta = Total - prevTotal
+            valid = numpy.array(complete) & numpy.array(prev_complete)
+            # The total time of the incomplete cores is NaN
+            with numpy.errstate(invalid='ignore'):
+                increased = valid & (delta > 0)
+            # Divide by 1 where the total time did not increase (or is NaN)
+            divisor = numpy.where(increased, delta, 1.0)
+            deltas = [delta - (times[0] - prevTimes[0])] + [t - p for t, p in zip(times[1:], prevTimes[1:])]
+            rows = numpy.column_stack([100 * d / divisor for d in deltas]).tolist()
+            increased = increased.tolist()
+            valid = valid.tolist()
+        else:
+            rows = []
+            increased = []
+            valid = []
+            for c in range(ncores):
+                if not (complete[c] and prev_complete[c]):
+                    rows.append(None)
+                    increased.append(False)
+                    valid.append(False)
+                    continue
+                Total, times = self.cpuTimes(counters[c * nfields:(c + 1) * nfields])
+                prevTotal, prevTimes = self.cpuTimes(prev_counters[c * nfields:(c + 1) * nfields])
+                delta = Total - prevTotal
+                valid.append(True)
+                if delta > 0:
+                    rows.append([100 * (delta - (times[0] - prevTimes[0])) / delta] +
+                                [100 * (t - p) / delta for t, p in zip(times[1:], prevTimes[1:])])
+                    increased.append(True)
+                else:
+                    rows.append(None)
+                    increased.append(False)
+
+        percentages = []
+        for row, row_increased, row_valid in zip(rows, increased, valid):
+            if row_increased:
+                percentages.append(row)
+            elif row_valid:
+                percentages.append(idle_row)
+            else:
+                percentages.append(na_row)
+        return percentages
+
     #----------------------------------------------------------------------
     def collect(self, prevResults = {}):
         # The returned numbers identify the amount of time the CPU has spent performing different kinds of work.
         # Time units are in USER_HZ or Jiffies (typically hundredths of a second).
         samples = OrderedDict()
 
-        # Add all of the-cpu core names in self.cpu_cores_to_collect_data_from to the samples.
-        # We do that here, because if any of the cores do not exist in the beginning of the
-        # data collection, we still want to collect NA values (it might be hotplugged later)
-        for cpuName in sorted(self.cpu_cores_to_collect_data_from):
-            if cpuName not in samples.keys():
-                samples[cpuName] = OrderedDict()
-                for field in self.available_cpu_fields:
-                    if field in self.fields_to_collect_data_from:
-                        samples[cpuName][field] = self.options['NA_value']
-
+        # The split lines of the cpu cores, and the ctxt, btime, processes,
+        # procs_running and procs_blocked values in the order they are read
+        cpu_lines = {}
+        stat_values = []
         try:
-            r = quick_regexp()
-            with open('/proc/stat') as f:
-                for line in f.readlines():
-                    if(r.search('cpu(\d+)?\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s*(\d+)?\s*(\d+)?\s*(\d+)?', line)):
-                        if(r.groups[0]):
-                            # Each "cpuN" line holds statistics for this specific core/thread.
-                            cpuName = 'cpu' + r.groups[0]
-                        else:
-                            # The very first "cpu" line aggregates the numbers in all of the other "cpuN" lines.
-                            # That's why we call it 'cpu_all'
-                            cpuName = 'cpu_all'
-
-                        # If the cpuName is listed in self.cpu_cores_to_collect_data_from
-                        # then we need to collect data for this cpu core
-                        if cpuName in self.cpu_cores_to_collect_data_from:
-                            # r.groups[0] stores the cpu core name, so
-                            # the fields start from r.groups[1]....r.groups[10]
-                            for i in range(1, len(r.groups)):
-                                field = self.PROC_STAT_FIELDS[i-1]
-                                if field in self.fields_to_collect_data_from:
-                                    samples[cpuName][field] = r.groups[i]
-                    else:
-                        # Read ctxt, btime, processes, procs_running, procs_blocked
-                        if(r.search('^(\S+)\s+(\d+)$', line)):
-                            if r.groups[0] in self.fields_to_collect_data_from:
-                                samples[r.groups[0]] = r.groups[1]
+            # Single pass over /proc/stat. Every line is split once and
+            # the needed tokens are picked by the precompiled index tables.
+            for line in self.readProcFile(self.PROC_STAT_PATH).splitlines():
+                tokens = line.split()
+                if not tokens:
+                    continue
+                name = tokens[0]
+                if name.startswith('cpu'):
+                    cpu_lines[self._cpuName(name)] = tokens
+                elif name in self.stat_fields and len(tokens) == 2:
+                    stat_values.append((name, self._parseValues(tokens[1:])[0]))
         except:
             self.LOG.debug(traceback.format_exc())
 
-        # cpu percentage (needs to be calculated) if self.options['calc_cpu_perc'] == True
+        # The values of every cpu core as ints, or None if the core is missing
+        cpu_values = []
+        for cpuName in self.sorted_cpu_cores:
+            tokens = cpu_lines.get(cpuName)
+            cpu_values.append(None if tokens is None else self._parseValues(tokens[1:]))
+
         if self.options['calc_cpu_perc']:
-            for key in samples:
-                # Get only the values with a cpu* header
-                if(r.search('(cpu\S+)', key)):
-                    # Create the header with a 'Not calculated' value
-                    samples[r.groups[0]]['pct_total_used'] = self.options['NA_value']
-                    samples[r.groups[0]]['pct_total_idle'] = self.options['NA_value']
-                    samples[r.groups[0]]['pct_user'] = self.options['NA_value']
-                    samples[r.groups[0]]['pct_system'] = self.options['NA_value']
-                    samples[r.groups[0]]['pct_nice'] = self.options['NA_value']
-                    samples[r.groups[0]]['pct_idle'] = self.options['NA_value']
-                    samples[r.groups[0]]['pct_iowait'] = self.options['NA_value']
-                    samples[r.groups[0]]['pct_irq'] = self.options['NA_value']
-                    samples[r.groups[0]]['pct_softirq'] = self.options['NA_value']
-                    if(self.runningKernelIsGLEthan('2.6.33', Greater=True, Equal=True)):
-                        samples[r.groups[0]]['pct_guest_nice'] = self.options['NA_value']
-                    if(self.runningKernelIsGLEthan('2.6.24', Greater=True, Equal=True)):
-                        samples[r.groups[0]]['pct_guest'] = self.options['NA_value']
-                    if(self.runningKernelIsGLEthan('2.6.11', Greater=True, Equal=True)):
-                        samples[r.groups[0]]['pct_steal'] = self.options['NA_value']
-
-                    if prevResults:
-                        # If prevResults are present, calculate the CPU usage percentage
-                        try:
-                            PrevSteal = PrevGuest = PrevGuest_nice = 0
-                            Steal = Guest = Guest_nice = 0
-
-                            if(self.runningKernelIsGLEthan('2.6.33', Greater=True, Equal=True)):
-                                # guest_nice (supported since Linux 2.6.33)
-                                PrevGuest_nice = float(prevResults[r.groups[0]]['guest_nice'])
-                                Guest_nice = float(samples[r.groups[0]]['guest_nice'])
-                            if(self.runningKernelIsGLEthan('2.6.24', Greater=True, Equal=True)):
-                                # guest (supported since Linux 2.6.24)
-                                PrevGuest = float(prevResults[r.groups[0]]['guest'])
-                                Guest = float(samples[r.groups[0]]['guest'])
-                            if(self.runningKernelIsGLEthan('2.6.11', Greater=True, Equal=True)):
-                                # steal (supported since Linux 2.6.11)
-                                PrevSteal = float(prevResults[r.groups[0]]['steal'])
-                                Steal = float(samples[r.groups[0]]['steal'])
-
-                            prevUser = float(prevResults[r.groups[0]]['user']) - PrevGuest
-                            prevNice = float(prevResults[r.groups[0]]['nice']) - PrevGuest_nice
-                            prevSystem = float(prevResults[r.groups[0]]['system'])
-                            prevIrq = float(prevResults[r.groups[0]]['irq'])
-                            prevSoftIrq = float(prevResults[r.groups[0]]['softirq'])
-                            prevIdle = float(prevResults[r.groups[0]]['idle'])
-                            prevIowait = float(prevResults[r.groups[0]]['iowait'])
-
-                            prevTotalIdle = prevIdle + prevIowait
-                            prevVirtual = PrevGuest + PrevGuest_nice
-                            prevTotalSystem = prevSystem + prevIrq + prevSoftIrq
-                            prevTotal = prevUser + prevNice + prevTotalSystem + prevVirtual + prevTotalIdle + PrevSteal
-
-
-                            User = float(samples[r.groups[0]]['user']) - Guest
-                            Nice = float(samples[r.groups[0]]['nice']) - Guest_nice
-                            System = float(samples[r.groups[0]]['system'])
-                            Irq = float(samples[r.groups[0]]['irq'])
-                            SoftIrq = float(samples[r.groups[0]]['softirq'])
-                            Idle = float(samples[r.groups[0]]['idle'])
-                            Iowait = float(samples[r.groups[0]]['iowait'])
-
-                            TotalIdle = Idle + Iowait
-                            Virtual = Guest + Guest_nice
-                            TotalSystem = System + Irq + SoftIrq
-                            Total = User + Nice + TotalSystem + Virtual + TotalIdle + Steal
-
-                            if Total - prevTotal > 0:
-                                samples[r.groups[0]]['pct_total_used'] = str(round(100 * (( Total - prevTotal ) - ( TotalIdle - prevTotalIdle )) / ( Total - prevTotal ), 2))
-                                samples[r.groups[0]]['pct_total_idle'] = str(round(100 * ( Idle - prevIdle ) / ( Total - prevTotal ), 2))
-                                samples[r.groups[0]]['pct_user'] = str(round((100 * ( User - prevUser ) / ( Total - prevTotal )), 2))
-                                samples[r.groups[0]]['pct_system'] = str(round((100 * ( System - prevSystem ) / ( Total - prevTotal )), 2))
-                                samples[r.groups[0]]['pct_nice'] = str(round((100 * ( Nice - prevNice ) / ( Total - prevTotal )), 2))
-                                samples[r.groups[0]]['pct_idle'] = str(round((100 * ( Idle - prevIdle ) / ( Total - prevTotal )), 2))
-                                samples[r.groups[0]]['pct_iowait'] = str(round((100 * ( Iowait - prevIowait ) / ( Total - prevTotal )), 2))
-                                samples[r.groups[0]]['pct_irq'] = str(round((100 * ( Irq - prevIrq ) / ( Total - prevTotal )), 2))
-                                samples[r.groups[0]]['pct_softirq'] = str(round((100 * ( SoftIrq - prevSoftIrq ) / ( Total - prevTotal )), 2))
-                                if(self.runningKernelIsGLEthan('2.6.33', Greater=True, Equal=True)):
-                                    samples[r.groups[0]]['pct_guest_nice'] = str(round((100 * ( Guest_nice - PrevGuest_nice ) / ( Total - prevTotal )), 2))
-                                if(self.runningKernelIsGLEthan('2.6.24', Greater=True, Equal=True)):
-                                    samples[r.groups[0]]['pct_guest'] = str(round((100 * ( Guest - PrevGuest ) / ( Total - prevTotal )), 2))
-                                if(self.runningKernelIsGLEthan('2.6.11', Greater=True, Equal=True)):
-                                    samples[r.groups[0]]['pct_steal'] = str(round((100 * ( Steal - PrevSteal ) / ( Total - prevTotal )), 2))
-                            else:
-                                samples[r.groups[0]]['pct_total_used'] = str(0)
-                                samples[r.groups[0]]['pct_total_idle'] = str(1)
-                                samples[r.groups[0]]['pct_user'] = str(0)
-                                samples[r.groups[0]]['pct_system'] = str(0)
-                                samples[r.groups[0]]['pct_nice'] = str(0)
-                                samples[r.groups[0]]['pct_idle'] = str(1)
-                                samples[r.groups[0]]['pct_iowait'] = str(0)
-                                samples[r.groups[0]]['pct_irq'] = str(0)
-                                samples[r.groups[0]]['pct_softirq'] = str(0)
-                                if(self.runningKernelIsGLEthan('2.6.33', Greater=True, Equal=True)):
-                                    samples[r.groups[0]]['pct_guest_nice'] = str(0)
-                                if(self.runningKernelIsGLEthan('2.6.24', Greater=True, Equal=True)):
-                                    samples[r.groups[0]]['pct_guest'] = str(0)
-                                if(self.runningKernelIsGLEthan('2.6.11', Greater=True, Equal=True)):
-                                    samples[r.groups[0]]['pct_steal'] = str(0)
-
-                        except ZeroDivisionError:
-                            # If the calculation returns ZeroDivisionError
-                            # continue quietly
-                            pass
-                        except ValueError:
-                            # If the previous value is not available, a ValueError
-                            # will be raised when the numbers are parsed
-                            pass
+            # cpu percentage (needs to be calculated) if self.options['calc_cpu_perc'] == True
+            counters, complete = self.parseCounters(cpu_values)
+            percentages = self.calcPercentages(counters, complete, prevResults)
+            self._last_samples = samples
+            self._last_counters = (counters, complete)
+        else:
+            percentages = None
+
+        # Add all of the-cpu core names in self.cpu_cores_to_collect_data_from to the samples.
+        # We do that on every sample, because if any of the cores do not exist in the beginning of the
+        # data collection, we still want to collect NA values (it might be hotplugged later)
+        NA = self.NA
+        for c, cpuName in enumerate(self.sorted_cpu_cores):
+            values = cpu_values[c]
+            if values is None:
+                fields = [(field, NA) for i, field in self.cpu_field_index]
+            else:
+                # The fields which are missing from the line are NA
+                nvalues = len(values)
+                fields = [(field, values[i - 1] if i <= nvalues else NA) for i, field in self.cpu_field_index]
+            if percentages is not None:
+                fields.extend(zip(self.pct_fields, percentages[c]))
+            samples[cpuName] = OrderedDict(fields)
+        for name, value in stat_values:
+            samples[name] = value
 
         return samples
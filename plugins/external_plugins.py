@@ -18,9 +18,13 @@ from libs.helperfuncs import *
 from libs.collector import DataCollector
 import os
 import glob
+import fnmatch
 import threading
-import thread
+import Queue
 from libs.globalvars import active_plugins_dir
+from libs.scheduler import monotonic
+from libs.coprocess import Coprocess
+from libs.dirwatch import DirectoryWatcher
 try:
     from collections import OrderedDict
 except ImportError:
@@ -37,9 +41,12 @@ class external_plugins(DataCollector):
     The collected values should be printed to the standard output (STDOUT)
     and the plugin should have an exit status value of 0 (successfully executed).
 
-    The only disadvantage of writing external scripts is that 'prevResults' cannot
-    be passed back to the plugin, so additional calculations (if needed) based on
-    results collected in the previous run will have to be post processed.
+    The previous results of a script are passed back to it in the environment
+    variable SYSDATA_COLLECTOR_PREV_SAMPLE (the lines it printed on its last
+    successful run), and the seconds elapsed since that run in the variable
+    SYSDATA_COLLECTOR_INTERVAL. Both are empty on the first run. The per
+    second rates of counters can also be calculated by the plugin, for the
+    headers which match the 'rate_headers' in the configuration.
 
     One pair of header/value per line should be printed in STDOUT by the external
     plugins as in the following example:
@@ -54,11 +61,71 @@ class external_plugins(DataCollector):
     sample['header1'] = 'value1'
     sample['header2'] = 'value2'
     sample['header3'] = 'value3'
+
+    Scripts which are expensive to start (an interpreter start-up on every
+    sample) can be run as coprocesses instead, if they match one of the
+    'coprocess_plugins' in the configuration. A coprocess is started once,
+    with the environment variable SYSDATA_COLLECTOR_COPROCESS=1, and kept
+    running. On every sample the line 'sample' is written to its STDIN,
+    and it has to print its header/value lines followed by the line 'end':
+
+    while read request; do
+        echo header1 value1
+        echo end
+    done
+
+    A coprocess keeps its previous results itself, the environment
+    variables above are not set for it. A coprocess should exit when its
+    STDIN is closed. If it exits or doesn't answer in 'coprocess_timeout'
+    seconds, its values are not available and it is started again after
+    a backoff.
+
+    The scripts are run by up to 'max_concurrent_scripts' threads. A
+    script which is still running after 'script_timeout' seconds, or which
+    prints more than 'max_output_bytes', is killed (SIGTERM, then SIGKILL),
+    and the values it returned on its last successful run are 'Not
+    Available' for this sample. The runtime of every script is logged
+    every 'script_stats_interval' seconds.
+
+    The results of the scripts are merged in the order of their paths. If
+    a header is returned by more than one script (or twice by a script),
+    the first value is kept and the duplicate is logged as an error.
+
+    Scripts added to (or removed from) the active plugins directory while
+    sysdata-collector is running are picked up on the next sample, if
+    'discover_scripts' is enabled. When the headers of the scripts change,
+    the output continues in a new segment with the new headers.
     """
 
-    # Used for thread locking
-    LOCK = threading.Lock()
-    external_plugins_list = []
+    # The lines of the coprocess protocol
+    SAMPLE_REQUEST = 'sample'
+    SAMPLE_END = 'end'
+
+    # The environment variables with the previous results of a script
+    PREV_SAMPLE_VAR = 'SYSDATA_COLLECTOR_PREV_SAMPLE'
+    INTERVAL_VAR = 'SYSDATA_COLLECTOR_INTERVAL'
+    # Larger previous results are not passed (the kernel limits the size of
+    # every environment variable to 128KiB)
+    PREV_SAMPLE_MAX = 65536
+
+    # The suffix of the headers of the rates calculated by the plugin
+    RATE_SUFFIX = '_per_s'
+
+    # The seconds to wait for a script to exit after the SIGTERM, before
+    # it is killed with a SIGKILL
+    KILL_GRACE = 1
+
+    def __init__(self):
+        super(external_plugins, self).__init__()
+        # The paths of the scripts to run, sorted
+        self.external_plugins_list = []
+        # The coprocess of every script which is run as a coprocess
+        self.coprocesses = {}
+        # Notices the changes of the active plugins directory
+        self._watcher = None
+        # The (inode, mtime) of the active plugins directory when the
+        # external_plugins_list was discovered
+        self._scripts_key = None
 
     #----------------------------------------------------------------------
     def readConfigVars(self):
@@ -68,7 +135,15 @@ class external_plugins(DataCollector):
         """
         self.options = {
             'load_extensions': ['.sh', '.pl'],
-            'header_prepend_plugin_name': True
+            'header_prepend_plugin_name': True,
+            'coprocess_plugins': [],
+            'coprocess_timeout': 10.0,
+            'max_concurrent_scripts': 8,
+            'script_timeout': 10.0,
+            'script_stats_interval': 300.0,
+            'rate_headers': [],
+            'discover_scripts': True,
+            'max_output_bytes': 1048576
         }
 
         Section = 'Plugin'
@@ -85,85 +160,361 @@ class external_plugins(DataCollector):
                 self.options[VarToRead] = self.config.getboolean(Section, VarToRead)
                 LOG.debug(VarToRead + ' = ' + str(self.options[VarToRead]))
 
-        extensions = {}
-        if(os.path.exists(active_plugins_dir)):
-            for extension in self.options['load_extensions']:
-                if extension:
-                    # Make sure the extension has a leading dot '.'
-                    if extension[0] != '.':
-                        extenstion = '.' + extension
+        self.readConfParameter(self.options, 'coprocess_plugins', self.STR, True)
+        self.readConfParameter(self.options, 'coprocess_timeout', self.FLOAT)
+        self.readConfParameter(self.options, 'max_concurrent_scripts', self.INT)
+        self.readConfParameter(self.options, 'script_timeout', self.FLOAT)
+        self.readConfParameter(self.options, 'script_stats_interval', self.FLOAT)
+        self.readConfParameter(self.options, 'rate_headers', self.STR, True)
+        self.options['rate_headers'] = [pattern for pattern in self.options['rate_headers'] if pattern]
+        self.readConfParameter(self.options, 'discover_scripts', self.BOOL)
+        self.readConfParameter(self.options, 'max_output_bytes', self.INT)
+
+        if self.options['max_concurrent_scripts'] < 1:
+            LOG.error("max_concurrent_scripts must be at least 1 for plugin '" + self.name + " " + "v" + str(self.version) + "'")
+            exit(1)
+        if self.options['script_timeout'] <= 0:
+            LOG.error("script_timeout must be greater than 0 for plugin '" + self.name + " " + "v" + str(self.version) + "'")
+            exit(1)
+        if self.options['max_output_bytes'] < 1:
+            LOG.error("max_output_bytes must be at least 1 for plugin '" + self.name + " " + "v" + str(self.version) + "'")
+            exit(1)
+
+        # Make sure the extensions have a leading dot '.' and they are unique
+        self._extensions = []
+        for extension in self.options['load_extensions']:
+            if extension:
+                if extension[0] != '.':
+                    extension = '.' + extension
+                if extension not in self._extensions:
+                    self._extensions.append(extension)
 
-                    # Make sure extension is unique until now
-                    if extension not in extensions.keys():
-                        # Add the extension in a dictionary key, to be able to quickly identify unique values
-                        extensions[extension] = True
-                        self.external_plugins_list.extend(glob.glob(active_plugins_dir + "/*" + extension))
+        # The headers returned by the last successful run of every script,
+        # to be 'Not Available' when the script fails
+        self._script_headers = {}
+        # The runtime statistics of every script since they were last logged:
+        # [runs, total seconds, max seconds, timeouts, failures]
+        self._script_stats = {}
+        self._stats_logged = monotonic()
+        # The time of the last successful run of every script, the lines it
+        # printed and the values of its rate_headers
+        self._script_prev = {}
+        # Whether a header matches the rate_headers (see isRateHeader())
+        self._rate_header_cache = {}
+        # The headers of the layout of the results (see collect())
+        self._layout_headers = None
+        self._new_headers = False
+        # The (header, script) duplicates which were already reported
+        self._duplicates = set()
+
+        # readConfigVars() runs again when the plugin's .conf file is loaded,
+        # so start over with the scripts
+        self.stopCoprocesses()
+        self.external_plugins_list = []
+        if self._watcher is not None:
+            self._watcher.close()
+        self._watcher = DirectoryWatcher(active_plugins_dir)
+        self._scripts_key = None
+        self.discoverScripts()
+
+    #----------------------------------------------------------------------
+    def discoverScripts(self):
+        """
+        Update the external_plugins_list with the scripts in the active
+        plugins directory, if the directory changed since the last call.
+        Returns True if the scripts changed.
+        """
+        if not self._watcher.changed():
+            return False
+        try:
+            st = os.stat(active_plugins_dir)
+            key = (st.st_ino, st.st_mtime)
+        except OSError:
+            key = None
+        if key == self._scripts_key and key is not None:
+            return False
+        self._scripts_key = key
+
+        scripts = set()
+        for extension in self._extensions:
+            scripts.update(glob.glob(active_plugins_dir + "/*" + extension))
+        scripts = sorted(scripts)
+        if scripts == self.external_plugins_list:
+            return False
+
+        old = set(self.external_plugins_list)
+        for externalScriptPath in old.difference(scripts):
+            LOG.info("External plugin '" + externalScriptPath + "' was removed")
+            coprocess = self.coprocesses.pop(externalScriptPath, None)
+            if coprocess is not None:
+                coprocess.close()
+            for state in (self._script_stats, self._script_headers, self._script_prev):
+                state.pop(externalScriptPath, None)
+
+        for externalScriptPath in scripts:
+            if externalScriptPath in old:
+                continue
+            if self._layout_headers is not None:
+                LOG.info("External plugin '" + externalScriptPath + "' was added")
+            self._script_stats[externalScriptPath] = [0, 0.0, 0.0, 0, 0]
+            # Start the scripts which match the coprocess_plugins as coprocesses
+            basename = os.path.basename(externalScriptPath)
+            if any(fnmatch.fnmatch(basename, pattern) for pattern in self.options['coprocess_plugins'] if pattern):
+                self.coprocesses[externalScriptPath] = Coprocess([externalScriptPath],
+                                                                 env={'SYSDATA_COLLECTOR_COPROCESS': '1'},
+                                                                 timeout=self.options['coprocess_timeout'],
+                                                                 max_output=self.options['max_output_bytes'])
+                LOG.debug("'" + externalScriptPath + "' will be run as a coprocess")
+
+        self.external_plugins_list = scripts
+        return True
+
+    #----------------------------------------------------------------------
+    def stopCoprocesses(self):
+        for coprocess in self.coprocesses.values():
+            coprocess.close()
+        self.coprocesses = {}
+
+    #----------------------------------------------------------------------
+    def deactivate(self):
+        super(external_plugins, self).deactivate()
+        self.stopCoprocesses()
+        if self._watcher is not None:
+            self._watcher.close()
+            self._watcher = None
+
+    #----------------------------------------------------------------------
+    def isRateHeader(self, header):
+        """
+        Returns True if the per second rate of the header has to be calculated
+        """
+        rate = self._rate_header_cache.get(header)
+        if rate is None:
+            rate = self._rate_header_cache[header] = \
+                any(fnmatch.fnmatchcase(header, pattern) for pattern in self.options['rate_headers'])
+        return rate
+
+    #----------------------------------------------------------------------
+    def scriptEnvironment(self, externalScriptPath, now):
+        """
+        Returns the environment of a script, with its previous results and
+        the seconds elapsed since its previous successful run
+        """
+        env = dict(os.environ)
+        prev = self._script_prev.get(externalScriptPath)
+        if prev is None:
+            env[self.PREV_SAMPLE_VAR] = ''
+            env[self.INTERVAL_VAR] = ''
+        else:
+            env[self.PREV_SAMPLE_VAR] = '\n'.join(prev[1])
+            if len(env[self.PREV_SAMPLE_VAR]) > self.PREV_SAMPLE_MAX:
+                LOG.debug("The previous results of '" + externalScriptPath + "' are too large to be passed to it")
+                env[self.PREV_SAMPLE_VAR] = ''
+            env[self.INTERVAL_VAR] = '{0:.6f}'.format(now - prev[0])
+        return env
+
+    #----------------------------------------------------------------------
+    def logScriptStats(self):
+        """
+        Log the runtime statistics of every script since they were last
+        logged, and reset them
+        """
+        self._stats_logged = monotonic()
+        for externalScriptPath in self.external_plugins_list:
+            stats = self._script_stats[externalScriptPath]
+            runs, total, longest, timeouts, failures = stats
+            if runs:
+                LOG.info("'" + externalScriptPath + "': " + str(runs) + " runs, " +
+                         "{0:.3f}".format(total / runs) + " seconds mean, " +
+                         "{0:.3f}".format(longest) + " seconds max, " +
+                         str(timeouts) + " timeouts, " + str(failures) + " failures")
+            stats[:] = [0, 0.0, 0.0, 0, 0]
 
     #----------------------------------------------------------------------
     def collect(self, prevResults = None):
 
-        # Run the external plugins in different threads parallely to speed up execution.
+        # Pick up the scripts added or removed since the last sample
+        scripts_changed = self.options['discover_scripts'] and self.discoverScripts()
+        self._new_headers = False
+
+        # Run the external plugins in a bounded number of threads
+        # parallely to speed up execution.
 
-        samples = OrderedDict()
-        threads = {}
+        results = {}
+        scripts = Queue.Queue()
+        for external_plugin in self.external_plugins_list:
+            scripts.put(external_plugin)
+
+        threads = []
         try:
-            for external_plugin in self.external_plugins_list:
-                # Collect data from each external plugin in a separate thread
-                threads[external_plugin] = threading.Thread(target=self.runCollectThreaded, args=(samples, external_plugin))
-                threads[external_plugin].start()
+            for i in range(min(self.options['max_concurrent_scripts'], len(self.external_plugins_list))):
+                # Every thread runs the next script of the queue until it is empty
+                threads.append(threading.Thread(target=self.runScripts, args=(results, scripts)))
+                threads[-1].start()
 
-            for external_plugin in self.external_plugins_list:
+            for t in threads:
                 # Wait for all of the threads to finish execution
-                threads[external_plugin].join()
-                del threads[external_plugin]
+                t.join()
         except:
             traceback.print_exc()
             exit(1)
 
+        samples = self.mergeResults(results)
+
+        if self.options['script_stats_interval'] > 0 and \
+                monotonic() - self._stats_logged >= self.options['script_stats_interval']:
+            self.logScriptStats()
+
+        # The layout changes when the scripts changed, or when a script
+        # returned its headers for the first time (i.e. its first runs
+        # failed). Headers which come and go otherwise are not followed.
+        headers = frozenset(samples)
+        if self._layout_headers is None:
+            self._layout_headers = headers
+        elif headers != self._layout_headers and (scripts_changed or self._new_headers):
+            self._layout_headers = headers
+            self.layout_version += 1
+
         return samples
 
-    def runCollectThreaded(self, result, externalScriptPath):
+    def runScripts(self, results, scripts):
+        """
+        Run the scripts of the queue 'scripts' until it is empty, and store
+        the results of every script in 'results' by its path
+        """
+        while True:
+            try:
+                externalScriptPath = scripts.get_nowait()
+            except Queue.Empty:
+                return
+            # Every script has its own key, no locking is needed
+            results[externalScriptPath] = self.runScript(externalScriptPath)
+
+    def mergeResults(self, results):
+        """
+        Returns the results of all of the scripts in one OrderedDict, in the
+        order of the scripts. The values of a script which failed are 'Not
+        Available'. A header which was already returned by a previous script
+        is reported, and its value is dropped.
+        """
+        # The script which returned every header
+        owners = {}
+        merged = []
+        for externalScriptPath in self.external_plugins_list:
+            result = results.get(externalScriptPath)
+            if result is None:
+                # The values of the last successful run are not available
+                result = [(header, self.NA) for header in self._script_headers.get(externalScriptPath, ())]
+            for header, value in result:
+                owner = owners.setdefault(header, externalScriptPath)
+                if owner is externalScriptPath:
+                    merged.append((header, value))
+                else:
+                    self.reportDuplicate(header, externalScriptPath, owner)
+        return OrderedDict(merged)
+
+    def reportDuplicate(self, header, externalScriptPath, owner):
+        """
+        Log (once) that a header of a script was already returned by the
+        script 'owner' (or by the same script)
+        """
+        if (header, externalScriptPath) in self._duplicates:
+            return
+        self._duplicates.add((header, externalScriptPath))
+        LOG.error("Header '" + header + "' of the external script '" + externalScriptPath + "' is already returned by '" +
+                  owner + "'. Its value is dropped. Please check that your external scripts have different basenames and/or headers.")
+
+    def runScript(self, externalScriptPath):
         """
-        Function ro run the collect jobs in threads.
-        results:              The dictionary to store the result
-        externalScriptPath:   The key in dict results to store the result
-                              and the path to the external script to execute
+        Run an external script (or request a sample from its coprocess), and
+        return its results as a list of (header, value) tuples, or None if
+        it failed.
+        The script's own state (statistics, previous results) is updated
+        only by the thread which runs it.
         """
 
-        # Execute the script
-        cmd = executeCommand([externalScriptPath])
+        started = monotonic()
+        timedout = False
+        coprocess = self.coprocesses.get(externalScriptPath)
+        if coprocess is not None:
+            # Request a sample from the running script
+            lines = coprocess.request(self.SAMPLE_REQUEST, self.SAMPLE_END)
+        else:
+            # Execute the script
+            cmd = executeCommand([externalScriptPath], timeout=self.options['script_timeout'],
+                                 kill_grace=self.KILL_GRACE, env=self.scriptEnvironment(externalScriptPath, started),
+                                 max_output=self.options['max_output_bytes'])
+            lines = cmd.getStdout()
 
-        # Check if the return code is zero (which means that the script was executed successfully)
-        if (cmd.getReturnCode() != 0):
-            LOG.warn("Execution return code of the external script '" + externalScriptPath + "' is '" + str(cmd.getReturnCode()) + "'")
-            LOG.warn("Please check what went wrong with the script. Aborting execution.")
-            # Use thread.interrupt_main() if you want to kill the parent who started the thread, and exit from the program
-            #thread.interrupt_main()
+            if cmd.timedOut():
+                timedout = True
+                LOG.warn("The external script '" + externalScriptPath + "' did not finish in " +
+                         str(self.options['script_timeout']) + " seconds and it was killed")
+                lines = None
+            elif cmd.outputTruncated():
+                LOG.warn("The external script '" + externalScriptPath + "' printed more than " +
+                         str(self.options['max_output_bytes']) + " bytes and it was killed")
+                lines = None
+            # Check if the return code is zero (which means that the script was executed successfully)
+            elif (cmd.getReturnCode() != 0):
+                LOG.warn("Execution return code of the external script '" + externalScriptPath + "' is '" + str(cmd.getReturnCode()) + "'")
+                LOG.warn("Please check what went wrong with the script.")
+        read_time = monotonic()
+        runtime = read_time - started
 
+        stats = self._script_stats[externalScriptPath]
+        stats[0] += 1
+        stats[1] += runtime
+        stats[2] = max(stats[2], runtime)
+        if timedout:
+            stats[3] += 1
+        elif lines is None:
+            stats[4] += 1
 
-        # Get the basename of the script without the extension
-        name = os.path.basename(os.path.splitext(externalScriptPath)[0])
+        if lines is None:
+            return None
 
-        r = quick_regexp()
-        for line in cmd.getStdout():
+        # In the header, prepend the basename of the script without the
+        # extension to avoid conficts
+        prefix = ''
+        if self.options['header_prepend_plugin_name']:
+            prefix = os.path.basename(os.path.splitext(externalScriptPath)[0]) + '_'
+
+        prev = self._script_prev.get(externalScriptPath)
+        counters = {}
+        result = []
+        headers = set()
+        for line in lines:
             # Each line should have two space separated values.
             # First is the header and second is the actual value
-            if(r.search('(\S+)\s+(\S+)', line)):
+            fields = line.split(None, 2)
+            if len(fields) < 2:
+                continue
+            header = prefix + fields[0]
+            if header in headers:
+                self.reportDuplicate(header, externalScriptPath, externalScriptPath)
+                continue
+            headers.add(header)
+            value = fields[1]
+            result.append((header, value))
 
-                if self.options['header_prepend_plugin_name']:
-                    # In the header, prepend the name of the script to avoid conficts
-                    header = "{0}_{1}".format(name, r.groups[0])
-                else:
-                    header = r.groups[0]
-                value = r.groups[1]
-
-                # Acquire the Lock when accessing 'result' (which is pointing to the sample and other threads
-                # will try to access it as well)
-                with self.LOCK:
-                    #print "'" + name + "' ('" + threading.current_thread().name + "') acquired lock"
-                    # If the header exists, raise an error and exit.
-                    if result.has_key(header):
-                        LOG.critical("Header '" + header + "' which is generated by script '" + externalScriptPath + "' already exists!!")
-                        LOG.critical("Please check that your external scripts have different basenames and/or headers. Aborting execution.")
-                        thread.interrupt_main()
-                    result[header] = value
+            if self.isRateHeader(header):
+                # The per second rate since the previous successful run.
+                # It is not available on the first run, for values which
+                # are not numbers, and for counters which went back.
+                rate = self.NA
+                try:
+                    counters[header] = float(value)
+                    last = prev[2][header]
+                    if counters[header] >= last and read_time > prev[0]:
+                        rate = (counters[header] - last) / (read_time - prev[0])
+                except (ValueError, TypeError, KeyError):
+                    pass
+                result.append((header + self.RATE_SUFFIX, rate))
+                headers.add(header + self.RATE_SUFFIX)
+
+        if result and externalScriptPath not in self._script_headers:
+            self._new_headers = True
+        self._script_headers[externalScriptPath] = [header for header, value in result]
+        self._script_prev[externalScriptPath] = (read_time, [line for line in lines if line], counters)
+        return result
@@ -0,0 +1,343 @@
+# Copyright (C) 2014  Vangelis Tasoulas <vangelis@tasoulas.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from libs.collector import DataCollector
+import os
+import glob
+import traceback
+try:
+    from collections import OrderedDict
+except ImportError:
+    # python 2.6 or earlier, use backport
+    from ordereddict import OrderedDict
+
+########################################################################
+class irq_stats(DataCollector):
+    """
+    Plugin to read the per CPU interrupt and softirq counters from Linux
+    based hosts.
+
+    --------------------------------------------------
+
+    Read the interrupt counters from /proc/interrupts and the softirq
+    counters from /proc/softirqs
+
+    Both files are tables with one column per online CPU (the first line
+    is the header with the CPU names) and one line per interrupt:
+
+                   CPU0       CPU1
+          0:         45          0   IO-APIC   2-edge      timer
+        LOC:    2214382    2098442   Local timer interrupts
+
+    The counters can be aggregated per NUMA node, so that machines with
+    many CPUs do not get one column per CPU for every interrupt.
+
+    # More information/documentation on /proc/interrupts and /proc/softirqs
+    https://www.kernel.org/doc/Documentation/filesystems/proc.txt    #(Search for /proc/interrupts)
+    """
+
+    # The files the counters are read from, in the order they are collected
+    SOURCES = OrderedDict([
+        ('interrupts', '/proc/interrupts'),
+        ('softirqs', '/proc/softirqs'),
+    ])
+
+    # The CPUs of every NUMA node are listed in NODE_PATH/node*/cpulist
+    NODE_PATH = '/sys/devices/system/node'
+
+    def __init__(self):
+        super(irq_stats, self).__init__()
+        # The raw counters of the last two collect() calls, so that the
+        # deltas can be calculated from the prevResults
+        self._history = []
+
+    #----------------------------------------------------------------------
+    def readConfigVars(self):
+        # Default is to collect the number of interrupts per sampling interval
+        self.options = {
+            'include_cpus': ['*'],
+            'exclude_cpus': [],
+            'include_interrupts': ['*'],
+            'exclude_interrupts': [],
+            'include_softirqs': ['*'],
+            'exclude_softirqs': [],
+            'aggregate_numa_nodes': False,
+            'calc_rates': True,
+            'NA_value': 'NA'
+        }
+
+        # Read parameters from the configuration file
+        self.readConfParameter(self.options, 'include_cpus', self.STR, True)
+        self.readConfParameter(self.options, 'exclude_cpus', self.STR, True)
+        self.readConfParameter(self.options, 'include_interrupts', self.STR, True)
+        self.readConfParameter(self.options, 'exclude_interrupts', self.STR, True)
+        self.readConfParameter(self.options, 'include_softirqs', self.STR, True)
+        self.readConfParameter(self.options, 'exclude_softirqs', self.STR, True)
+        self.readConfParameter(self.options, 'aggregate_numa_nodes', self.BOOL)
+        self.readConfParameter(self.options, 'calc_rates', self.BOOL)
+        self.readConfParameter(self.options, 'NA_value', self.STR)
+
+        # Discover the available CPUs and interrupts of every source
+        available_cpus = []
+        available_irqs = {}
+        for source, path in self.SOURCES.items():
+            available_irqs[source] = []
+            try:
+                lines = self.readProcFile(path).splitlines()
+                for cpuName in self._cpuNames(lines[0]):
+                    if cpuName not in available_cpus:
+                        available_cpus.append(cpuName)
+                for line in lines[1:]:
+                    name, sep, rest = line.partition(':')
+                    if sep:
+                        available_irqs[source].append(name.strip())
+            except:
+                self.LOG.debug(traceback.format_exc())
+
+        # The CPUs which are offline when the data collection starts
+        # are still included (they might be brought online later)
+        self.cpus = sorted(self.include_exclude_fields(self.options['include_cpus'],
+                                                       self.options['exclude_cpus'],
+                                                       available_cpus,
+                                                       strict=False), key=self._numberedKey)
+        self.LOG.debug('CPUs to be used for data collection: ' + str(self.cpus))
+
+        # The interrupts to collect from every source, in the order of the file
+        self.irqs = OrderedDict()
+        self._irq_sets = {}
+        for source in self.SOURCES:
+            irqs = self.include_exclude_fields(self.options['include_' + source],
+                                               self.options['exclude_' + source],
+                                               available_irqs[source],
+                                               strict=False)
+            if irqs:
+                order = dict((name, i) for i, name in enumerate(available_irqs[source]))
+                self.irqs[source] = sorted(irqs, key=lambda name: (order.get(name, len(order)), name))
+                self._irq_sets[source] = frozenset(irqs)
+                self.LOG.debug(source + ' to be used for data collection: ' + str(self.irqs[source]))
+
+        # The output columns are either the CPUs or their NUMA nodes
+        if self.options['aggregate_numa_nodes']:
+            nodes = self.readNumaNodes()
+            # CPUs which are not listed in any node (i.e. no NUMA support) belong to node0
+            self.column_of_cpu = dict((cpuName, nodes.get(cpuName, 'node0')) for cpuName in self.cpus)
+            self.output_columns = sorted(set(self.column_of_cpu.values()), key=self._numberedKey)
+        else:
+            self.column_of_cpu = dict((cpuName, cpuName) for cpuName in self.cpus)
+            self.output_columns = list(self.cpus)
+
+        # The positions of the header CPUs in the columns, compiled
+        # again whenever the online CPUs change (see _compileHeader())
+        self._headers = {}
+        self._history = []
+
+    #----------------------------------------------------------------------
+    @staticmethod
+    def _cpuNames(header):
+        """
+        Returns the names of the CPUs in the header line of the tables
+        (CPU0 CPU1 ... becomes cpu0 cpu1 ...)
+        """
+        return [token.lower() for token in header.split()]
+
+    #----------------------------------------------------------------------
+    @staticmethod
+    def _numberedKey(name):
+        """
+        Sort key which puts cpu2 before cpu10 (and node2 before node10)
+        """
+        digits = name.lstrip('abcdefghijklmnopqrstuvwxyz_')
+        return (name[:len(name) - len(digits)], int(digits) if digits.isdigit() else -1, name)
+
+    #----------------------------------------------------------------------
+    def readNumaNodes(self):
+        """
+        Returns a dictionary with the NUMA node of every CPU,
+        i.e. {'cpu0': 'node0', 'cpu1': 'node0', 'cpu2': 'node1', ...}
+        """
+        nodes = {}
+        for path in glob.glob(os.path.join(self.NODE_PATH, 'node[0-9]*', 'cpulist')):
+            node = os.path.basename(os.path.dirname(path))
+            try:
+                with open(path) as f:
+                    cpulist = f.read().strip()
+            except (IOError, OSError):
+                self.LOG.debug(traceback.format_exc())
+                continue
+            # i.e. 0-3,8-11
+            for cpu_range in cpulist.split(','):
+                if not cpu_range:
+                    continue
+                first, sep, last = cpu_range.partition('-')
+                for cpu in range(int(first), int(last if sep else first) + 1):
+                    nodes['cpu' + str(cpu)] = node
+        self.LOG.debug('NUMA nodes of the CPUs: ' + str(sorted(nodes.items())))
+        return nodes
+
+    #----------------------------------------------------------------------
+    def describe_fields(self):
+        """
+        Returns the layout of the results of collect() without reading the files
+        """
+        # Rates are gauges, the raw counters only increase
+        value_type = self.INT if self.options['calc_rates'] else self.COUNTER
+        fields = OrderedDict()
+        for source, irqs in self.irqs.items():
+            fields[source] = OrderedDict()
+            for name in irqs:
+                fields[source][name] = OrderedDict((column, value_type) for column in self.output_columns)
+        return fields
+
+    #----------------------------------------------------------------------
+    def _compileHeader(self, header):
+        """
+        Returns the positions of the CPUs of a header line in every column
+        (a slice if they are next to each other, a list otherwise, or None if
+        none of the CPUs of the column is in the header), the number of the
+        CPUs in the header, and True if every CPU of the header is a column
+        in the same order (so the counters can be used as they are).
+        """
+        compiled = self._headers.get(header)
+        if compiled is None:
+            cpuNames = self._cpuNames(header)
+            positions = OrderedDict((column, []) for column in self.output_columns)
+            for position, cpuName in enumerate(cpuNames):
+                column = self.column_of_cpu.get(cpuName)
+                if column is not None:
+                    positions[column].append(position)
+
+            columns = []
+            for column_positions in positions.values():
+                if not column_positions:
+                    columns.append(None)
+                elif column_positions == range(column_positions[0], column_positions[-1] + 1):
+                    columns.append(slice(column_positions[0], column_positions[-1] + 1))
+                else:
+                    columns.append(column_positions)
+            identity = [self.column_of_cpu.get(cpuName) for cpuName in cpuNames] == self.output_columns
+            compiled = self._headers[header] = (columns, len(cpuNames), identity)
+        return compiled
+
+    #----------------------------------------------------------------------
+    def parseTable(self, text, irqs):
+        """
+        Parse a /proc/interrupts or /proc/softirqs table in a single pass.
+
+        Returns a dictionary with the list of the counters (one per column,
+        or NA) of every interrupt in 'irqs' (a set of interrupt names) which
+        is present in the table. Only the lines of the collected interrupts
+        are split, and only up to the last CPU, so the descriptions at the
+        end of the lines are skipped. The CPUs of every NUMA node are summed
+        with one sum() over a slice of the counters.
+        """
+        NA = self.NA
+        lines = text.splitlines()
+        if not lines:
+            return {}
+        columns, ncpus, identity = self._compileHeader(lines[0])
+
+        table = {}
+        for line in lines[1:]:
+            name, sep, rest = line.partition(':')
+            if not sep:
+                continue
+            name = name.strip()
+            if name not in irqs:
+                continue
+            tokens = rest.split(None, ncpus)[:ncpus]
+            try:
+                counts = map(int, tokens)
+            except ValueError:
+                # Lines with less counters than CPUs (i.e. ERR and MIS)
+                counts = []
+                for token in tokens:
+                    if not token.isdigit():
+                        break
+                    counts.append(int(token))
+
+            if len(counts) == ncpus:
+                if identity:
+                    table[name] = counts
+                    continue
+                values = []
+                for positions in columns:
+                    if positions is None:
+                        values.append(NA)
+                    elif positions.__class__ is slice:
+                        values.append(sum(counts[positions]))
+                    else:
+                        values.append(sum([counts[position] for position in positions]))
+            else:
+                # The columns with CPUs which have no counter are NA
+                ncounts = len(counts)
+                values = []
+                for positions in columns:
+                    if positions is None:
+                        values.append(NA)
+                    else:
+                        if positions.__class__ is slice:
+                            positions = range(positions.start, positions.stop)
+                        if positions[-1] < ncounts:
+                            values.append(sum([counts[position] for position in positions]))
+                        else:
+                            values.append(NA)
+            table[name] = values
+        return table
+
+    #----------------------------------------------------------------------
+    def collect(self, prevResults = {}):
+        NA = self.NA
+        counters = {}
+        for source, irqs in self.irqs.items():
+            try:
+                counters[source] = self.parseTable(self.readProcFile(self.SOURCES[source]), self._irq_sets[source])
+            except:
+                self.LOG.debug(traceback.format_exc())
+                counters[source] = {}
+
+        prevCounters = None
+        if self.options['calc_rates']:
+            # The raw counters of the prevResults (if they were returned
+            # by one of the last two collect() calls)
+            for results, raw in self._history:
+                if results is prevResults:
+                    prevCounters = raw
+                    break
+
+        # Add all of the interrupts in the samples, even if they are not present
+        # in the tables (the device of an interrupt might be hotplugged later)
+        na_row = [NA] * len(self.output_columns)
+        samples = OrderedDict()
+        for source, irqs in self.irqs.items():
+            samples[source] = OrderedDict()
+            table = counters[source]
+            prevTable = prevCounters.get(source, {}) if prevCounters is not None else {}
+            for name in irqs:
+                values = table.get(name, na_row)
+                if self.options['calc_rates']:
+                    prevValues = prevTable.get(name)
+                    if prevValues is None:
+                        values = na_row
+                    else:
+                        # The number of interrupts since the previous sample.
+                        # The counters are reset if a CPU is brought offline
+                        # and back online, so negative values are NA.
+                        values = [cur - prev if cur is not NA and prev is not NA and cur >= prev else NA
+                                  for cur, prev in zip(values, prevValues)]
+                samples[source][name] = OrderedDict(zip(self.output_columns, values))
+
+        if self.options['calc_rates']:
+            self._history = [(samples, counters)] + self._history[:1]
+        return samples
@@ -36,6 +36,15 @@ class kernel_version(DataCollector):
         """
         pass
 
+    #----------------------------------------------------------------------
+    def describe_fields(self):
+        """
+        The layout of the results of collect()
+        """
+        fields = OrderedDict()
+        fields['running_kernel_version'] = self.STR
+        return fields
+
     #----------------------------------------------------------------------
     def collect(self, prevResults = None):
         """
@@ -0,0 +1,19 @@
+#!/bin/bash
+#
+# The load_avg.sh external plugin, written as a coprocess: it is started
+# once, and it prints a sample every time it reads a line from its stdin.
+# Add 'load_avg_coprocess.sh' in the coprocess_plugins of the
+# external_plugins.metaconf to run it as a coprocess.
+
+print_load_avg () {
+    for i in 1 5 15; do
+        echo $i $1
+	shift
+    done
+}
+
+while read request; do
+    read loadavg < /proc/loadavg
+    print_load_avg $loadavg
+    echo end
+done
@@ -19,6 +19,9 @@ import sys
 import time
 import traceback
 import fnmatch
+from libs.scheduler import monotonic
+from libs.netlink import LinkStatsSocket
+from libs.netns import NetnsScanner
 try:
     from collections import OrderedDict
 except ImportError:
@@ -32,7 +35,12 @@ class net_stats(DataCollector):
 
     --------------------------------------------------
 
-    Read Network Statistics from /proc/net/dev
+    Read Network Statistics from /proc/net/dev, or with an RTM_GETLINK
+    netlink dump (stats_source = netlink)
+
+    With network_namespaces = True, the statistics of the interfaces of
+    the other network namespaces (i.e. of containers) are read from
+    /proc/<pid>/net/dev of a process in every namespace.
 
     # More information/documentation on /proc/stat
     http://www.linuxhowtos.org/manpages/5/proc.htm    #(Search for /proc/net/dev)
@@ -46,6 +54,28 @@ class net_stats(DataCollector):
         'tx_fifo', 'colls', 'carrier', 'tx_compressed'
     )
 
+    # The per second rates of the NETDEV_FIELDS (i.e. rx_bytes_per_s),
+    # calculated from the previous sample
+    RATE_FIELDS = tuple(field + '_per_s' for field in NETDEV_FIELDS)
+
+    # The file the statistics are read from
+    NETDEV_PATH = '/proc/net/dev'
+
+    # The file the statistics of the namespace of a process are read from
+    PID_NETDEV_PATH = '/proc/{0}/net/dev'
+
+    # The results of the other network namespaces are under this prefix
+    # and the name (or the inode) of the namespace
+    NETNS_PREFIX = 'netns_'
+
+    # The sources the counters can be read from
+    STATS_SOURCES = ('procfs', 'netlink')
+
+    # The counters of /proc/net/dev are unsigned longs (32 bit on 32 bit
+    # kernels), and some drivers still report 32 bit hardware counters
+    COUNTER_32_MAX = 2 ** 32
+    COUNTER_64_MAX = 2 ** 64
+
     # Store the network interface names to collect data from
     interfaces_to_collect_data_from = []
 
@@ -53,6 +83,16 @@ class net_stats(DataCollector):
     # All of the available fields can be seen in NETDEV_FIELDS
     fields_to_collect_data_from = []
 
+    def __init__(self):
+        super(net_stats, self).__init__()
+        # The read time and the raw counters of the last two collect()
+        # calls, so that the rates can be calculated from the prevResults
+        self._history = []
+        # The netlink socket, if stats_source is netlink
+        self._links = None
+        # The network namespaces scanner, if network_namespaces is True
+        self._netns = None
+
     #----------------------------------------------------------------------
     def readConfigVars(self):
         # Default is to include all of the interfaces
@@ -62,6 +102,10 @@ class net_stats(DataCollector):
             'fields_to_collect': ['bytes', 'packets', 'errs', 'drop'],
             'fields_to_exclude': [],
             'calculate_totals': True,
+            'stats_source': 'procfs',
+            'network_namespaces': False,
+            'include_namespaces': ['*'],
+            'exclude_namespaces': [],
             'NA_value': 'NA'
         }
 
@@ -71,17 +115,32 @@ class net_stats(DataCollector):
         self.readConfParameter(self.options, 'fields_to_exclude', self.STR, True)
         self.readConfParameter(self.options, 'NA_value', self.STR)
         self.readConfParameter(self.options, 'calculate_totals', self.BOOL)
+        self.readConfParameter(self.options, 'stats_source', self.STR)
+        self.readConfParameter(self.options, 'network_namespaces', self.BOOL)
+        self.readConfParameter(self.options, 'include_namespaces', self.STR, True)
+        self.readConfParameter(self.options, 'exclude_namespaces', self.STR, True)
+
+        if self.options['stats_source'] not in self.STATS_SOURCES:
+            self.LOG.error("stats_source must be one of " + ', '.join(self.STATS_SOURCES) + " for plugin '" + self.name + " " + "v" + str(self.version) + "'")
+            exit(1)
+
+        if self._links is not None:
+            self._links.close()
+            self._links = None
+        if self.options['stats_source'] == 'netlink':
+            self._links = LinkStatsSocket()
+            try:
+                self._links.dump(set())
+            except:
+                LOG.debug(traceback.format_exc())
+                self.LOG.warning("Cannot read the network statistics with netlink, falling back to " + self.NETDEV_PATH)
+                self._links.close()
+                self._links = None
 
         # Discover which network interfaces will be logged and log only these interfaces for the rest of the experiment
         # Store them in self.interface_to_collect_data_from
         try:
-            available_interfaces = []
-            r = quick_regexp()
-            with open('/proc/net/dev') as f:
-                for line in f.readlines():
-                    if(r.search('(\S+):\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)', line)):
-                        ifName = r.groups[0]
-                        available_interfaces.append(ifName)
+            available_interfaces = list(self.readCounters())
 
             self.interfaces_to_collect_data_from = sorted(
                 self.include_exclude_fields(
@@ -94,16 +153,255 @@ class net_stats(DataCollector):
             LOG.debug('Network interfaces to be used for data collection: ' + str(self.interfaces_to_collect_data_from))
         except:
             LOG.debug(traceback.format_exc())
+        self._interfaces = set(self.interfaces_to_collect_data_from)
+
+        # The interfaces to collect data from, of every other network namespace
+        self.namespaces_to_collect_data_from = OrderedDict()
+        self._netns = None
+        if self.options['network_namespaces']:
+            try:
+                self.discoverNamespaces()
+            except:
+                LOG.debug(traceback.format_exc())
 
         self.fields_to_collect_data_from = self.include_exclude_fields(
             self.options['fields_to_collect'],
             self.options['fields_to_exclude'],
-            self.NETDEV_FIELDS
+            self.NETDEV_FIELDS + self.RATE_FIELDS
         )
 
+        # The counters (in NETDEV_FIELDS order) and the rates to collect
+        self._counter_fields = [(i, field) for i, field in enumerate(self.NETDEV_FIELDS)
+                                if field in self.fields_to_collect_data_from]
+        self._rate_fields = [(i, field + '_per_s') for i, field in enumerate(self.NETDEV_FIELDS)
+                             if field + '_per_s' in self.fields_to_collect_data_from]
+
+        # Totals are added for the rx/tx fields which have their pairs
+        self._total_fields = []
+        if self.options['calculate_totals']:
+            collected = [field for i, field in self._counter_fields + self._rate_fields]
+            for field in collected:
+                if field[0:3] in ('rx_', 'tx_'):
+                    pair = ('tx_' if field[0] == 'r' else 'rx_') + field[3:]
+                    total = 'total_' + field[3:]
+                    if pair in collected and total not in [t for t, f, p in self._total_fields]:
+                        self._total_fields.append((total, field, pair))
+        self._history = []
+
         self.LOG.debug('/proc/net/dev fields to be used for data collection: ' + str(self.fields_to_collect_data_from))
 
 
+    #----------------------------------------------------------------------
+    def discoverNamespaces(self):
+        """
+        Find the network namespaces (and their interfaces) to collect
+        data from. The namespaces which are given by name in
+        include_namespaces are included even if they are not present.
+        The namespaces which appear later (i.e. containers started after
+        the collector) are added by readNamespaces().
+        """
+        self._netns = NetnsScanner()
+        # The label of every namespace inode, and the last file read for every label
+        self._ns_labels = {}
+        self._ns_paths = {}
+        self._ns_own = self._netns.own()
+        reps = self._netns.scan()
+        labels = self.namespaceLabels(reps)
+        labels.pop(self._ns_labels.get(self._ns_own), None)
+
+        selected = self.include_exclude_fields(
+            self.options['include_namespaces'],
+            self.options['exclude_namespaces'],
+            list(labels), strict=False
+        )
+        # The labels which were matched against include_namespaces and
+        # exclude_namespaces, so that only the new labels are matched later
+        self._ns_checked = set(labels) | set(selected)
+        for label in sorted(selected):
+            interfaces = None
+            if label in labels:
+                interfaces = self.namespaceInterfaces(self.PID_NETDEV_PATH.format(reps[labels[label]]))
+            if not interfaces:
+                # The interfaces of the namespaces which are not present are
+                # the included interfaces given by name
+                interfaces = [ifName for ifName in self.options['include_interfaces']
+                              if not set('*?[') & set(ifName) and ifName not in self.options['exclude_interfaces']]
+            self.namespaces_to_collect_data_from[label] = interfaces
+
+        LOG.debug('Network namespaces to be used for data collection: ' + str(self.namespaces_to_collect_data_from))
+
+    #----------------------------------------------------------------------
+    def namespaceInterfaces(self, path):
+        """
+        Returns the sorted interfaces to collect data from, of the
+        namespace of the /proc/<pid>/net/dev file 'path', or None if it
+        cannot be read
+        """
+        try:
+            available_interfaces = list(self.readNetdev(path))
+        except (IOError, OSError):
+            LOG.debug(traceback.format_exc())
+            self._proc_files.forget(path)
+            return None
+        return sorted(self.include_exclude_fields(
+            self.options['include_interfaces'],
+            self.options['exclude_interfaces'],
+            available_interfaces, strict=False
+        ))
+
+    #----------------------------------------------------------------------
+    def addNamespaces(self, labels, reps):
+        """
+        Add the namespaces of 'labels' (see namespaceLabels()) which were
+        not seen before and pass include_namespaces/exclude_namespaces, and
+        switch the layout of the results if any of them was added
+        """
+        new = [label for label in labels if label not in self._ns_checked and labels[label] != self._ns_own]
+        if not new:
+            return
+        added = False
+        selected = self.include_exclude_fields(
+            self.options['include_namespaces'],
+            self.options['exclude_namespaces'],
+            new, strict=False
+        )
+        for label in new:
+            if label not in selected:
+                # Not included, it is not matched again
+                self._ns_checked.add(label)
+                continue
+            interfaces = self.namespaceInterfaces(self.PID_NETDEV_PATH.format(reps[labels[label]]))
+            if interfaces is None:
+                # The process exited after the scan, try again on the next sample
+                continue
+            self._ns_checked.add(label)
+            self.namespaces_to_collect_data_from[label] = interfaces
+            added = True
+            LOG.info("Network namespace '" + label + "' added, with interfaces " + str(interfaces))
+        if added:
+            self.namespaces_to_collect_data_from = OrderedDict(sorted(self.namespaces_to_collect_data_from.items()))
+            self.layout_version += 1
+
+    #----------------------------------------------------------------------
+    def namespaceLabels(self, reps):
+        """
+        Returns the inode of every network namespace in 'reps' (the result
+        of NetnsScanner.scan()) by its label: the name of the namespace if
+        it is a named namespace, or the inode.
+        """
+        if not set(reps) <= set(self._ns_labels):
+            # The names are only looked up for the namespaces not seen before
+            names = self._netns.names()
+            for inode in reps:
+                if inode not in self._ns_labels:
+                    self._ns_labels[inode] = names.get(inode, str(inode))
+        return dict((self._ns_labels[inode], inode) for inode in reps)
+
+    #----------------------------------------------------------------------
+    def deactivate(self):
+        super(net_stats, self).deactivate()
+        if self._links is not None:
+            self._links.close()
+            self._links = None
+
+    #----------------------------------------------------------------------
+    @staticmethod
+    def netdevCounters(stats):
+        """
+        Returns the NETDEV_FIELDS of a struct rtnl_link_stats64 (a tuple of
+        libs.netlink.LINK_STATS64_FIELDS), summed the way the kernel shows
+        them in /proc/net/dev
+        """
+        (rx_packets, tx_packets, rx_bytes, tx_bytes, rx_errors, tx_errors,
+         rx_dropped, tx_dropped, multicast, collisions, rx_length_errors,
+         rx_over_errors, rx_crc_errors, rx_frame_errors, rx_fifo_errors,
+         rx_missed_errors, tx_aborted_errors, tx_carrier_errors, tx_fifo_errors,
+         tx_heartbeat_errors, tx_window_errors, rx_compressed, tx_compressed) = stats
+        return [
+            rx_bytes, rx_packets, rx_errors, rx_dropped + rx_missed_errors,
+            rx_fifo_errors, rx_length_errors + rx_over_errors + rx_crc_errors + rx_frame_errors,
+            rx_compressed, multicast,
+            tx_bytes, tx_packets, tx_errors, tx_dropped,
+            tx_fifo_errors, collisions,
+            tx_carrier_errors + tx_aborted_errors + tx_window_errors + tx_heartbeat_errors,
+            tx_compressed
+        ]
+
+    #----------------------------------------------------------------------
+    def readCounters(self, interfaces=None):
+        """
+        Returns a dictionary with the list of the counters (in NETDEV_FIELDS
+        order) of every interface, or only of the interfaces in 'interfaces'
+        (a set of interface names), if it is not None.
+        """
+        counters = {}
+        if self._links is not None:
+            for ifName, stats in self._links.dump(interfaces).items():
+                counters[ifName] = self.netdevCounters(stats)
+            return counters
+
+        return self.readNetdev(self.NETDEV_PATH, interfaces)
+
+    #----------------------------------------------------------------------
+    def readNetdev(self, path, interfaces=None):
+        """
+        Like readCounters(), from the /proc/net/dev file 'path'
+        """
+        counters = {}
+        r = quick_regexp()
+        for line in self.readProcFile(path).splitlines():
+            if(r.search('(\S+):\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)', line)):
+                ifName = r.groups[0]
+                if interfaces is None or ifName in interfaces:
+                    counters[ifName] = [int(value) for value in r.groups[1:]]
+        return counters
+
+    #----------------------------------------------------------------------
+    def describe_fields(self):
+        """
+        Returns the layout of the results of collect() without reading /proc/net/dev
+        """
+        fields = self.interfaceFields(self.interfaces_to_collect_data_from)
+        for label, interfaces in self.namespaces_to_collect_data_from.items():
+            fields[self.NETNS_PREFIX + label] = self.interfaceFields(interfaces)
+        return fields
+
+    #----------------------------------------------------------------------
+    def interfaceFields(self, interfaces):
+        fields = OrderedDict()
+        for ifName in interfaces:
+            fields[ifName] = OrderedDict()
+            for i, field in self._counter_fields:
+                fields[ifName][field] = self.COUNTER
+            for i, field in self._rate_fields:
+                fields[ifName][field] = self.FLOAT
+
+            for total, field, pair in self._total_fields:
+                fields[ifName][total] = fields[ifName][field]
+
+        return fields
+
+    #----------------------------------------------------------------------
+    def counterDelta(self, cur, prev):
+        """
+        Returns the increase of a counter from 'prev' to 'cur', or NA if
+        the counter was reset.
+
+        A counter which went back either wrapped around, or it was reset
+        (i.e. the interface was removed and added again, or the driver was
+        reloaded). It is taken as a wrapped 32 bit counter if 'prev' fits in
+        32 bits (or a 64 bit counter otherwise) when the increase through the
+        wrap is less than half of the range of the counter. Otherwise the
+        counter was reset, and the increase in the interval is unknown.
+        """
+        if cur >= prev:
+            return cur - prev
+        counter_max = self.COUNTER_32_MAX if prev < self.COUNTER_32_MAX else self.COUNTER_64_MAX
+        delta = cur + counter_max - prev
+        if delta < counter_max // 2:
+            return delta
+        return self.NA
+
     #----------------------------------------------------------------------
     def collect(self, prevResults = {}):
         """
@@ -117,74 +415,105 @@ class net_stats(DataCollector):
               ppp0: 1622270    5552    1    0    0     0          0         0   354130    5669    0    0    0     0       0          0
               tap0:    7714      81    0    0    0     0          0         0     7714      81    0    0    0     0       0          0
         """
-        samples = OrderedDict()
+        # The read time and the raw counters of every namespace (None is
+        # the namespace of the collector)
+        raw = {}
+        try:
+            counters = self.readCounters(self._interfaces)
+            # The rates are calculated with the time the counters were read,
+            # not the time collect() was called
+            raw[None] = (monotonic(), counters)
+        except:
+            LOG.debug(traceback.format_exc())
 
-        # Initiate the samples dict for all the interfaces that we will
-        # collect data from
-        for ifName in self.interfaces_to_collect_data_from:
-            samples[ifName] = OrderedDict()
-            for field in self.NETDEV_FIELDS:
-                if field in self.fields_to_collect_data_from:
-                    samples[ifName][field] = self.options['NA_value']
+        if self._netns is not None:
+            self.readNamespaces(raw)
 
+        prevRaw = {}
+        if self._rate_fields:
+            # The raw counters of the prevResults (if they were returned
+            # by one of the last two collect() calls)
+            for results, history in self._history:
+                if results is prevResults:
+                    prevRaw = history
+                    break
+
+        # Add all of the interfaces in the samples, even if they are not
+        # present (they might be hotplugged later)
+        samples = self.interfaceSamples(self.interfaces_to_collect_data_from, raw.get(None), prevRaw.get(None))
+        for label, interfaces in self.namespaces_to_collect_data_from.items():
+            samples[self.NETNS_PREFIX + label] = self.interfaceSamples(interfaces, raw.get(label), prevRaw.get(label))
+
+        if self._rate_fields:
+            self._history = [(samples, raw)] + self._history[:1]
+        return samples
+
+    #----------------------------------------------------------------------
+    def readNamespaces(self, raw):
+        """
+        Read the counters of the interfaces of the other network namespaces
+        in 'raw' (by the label of the namespace)
+        """
         try:
-            r = quick_regexp()
-            with open('/proc/net/dev') as f:
-                for line in f.readlines():
-                    if(r.search('(\S+):\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)\s*(\d+)', line)):
-                        ifName = r.groups[0]
-                        if ifName in self.interfaces_to_collect_data_from:
-                            for i in range(1, len(r.groups)):
-                                field = self.NETDEV_FIELDS[i-1]
-                                if field in self.fields_to_collect_data_from:
-                                    samples[ifName][field] = r.groups[i]
+            reps = self._netns.scan()
+            labels = self.namespaceLabels(reps)
         except:
             LOG.debug(traceback.format_exc())
+            return
 
-        # If totals are to be calculated, find which values have their pairs
-        if self.options['calculate_totals']:
-            for ifName in samples:
-                for key in samples[ifName]:
-                    if r.search('(r|t)x_(\w+)', key):
-                        if r.groups[0] == 'r':
-                            pair='tx_' + r.groups[1]
-                        elif r.groups[0] == 't':
-                            pair='rx_' + r.groups[1]
-
-                        if pair in samples[ifName].keys():
-                            try:
-                                samples[ifName]['total_' + r.groups[1]] = str(int(samples[ifName][key]) + int(samples[ifName][pair]))
-                            except ValueError:
-                                # If you get a ValueError, most likely the collected
-                                # value is NA, so continue quietly
-                                samples[ifName]['total_' + r.groups[1]] = self.options['NA_value']
-
-        ## TODO: Add an option to calculate speed/second from previous collection
-                    ## Similar to the way
-                    ## cpu percentage (needs to be calculated) if self.calc_cpu_perc == True
-                    #if self.calc_cpu_perc:
-                        #for key in samples:
-                            ## Get only the values with a cpu* header
-                            #if(r.search('(cpu\S+)', key)):
-                                ## Create the header with a 'Not calculated' value
-                                #samples[r.groups[0]]['percent'] = 'Not calculated'
-                                #if prevResults:
-                                    ## If prevResults are present, calculate the CPU usage percentage
-                                    #prevUser = float(prevResults[r.groups[0]]['user'])
-                                    #prevNice = float(prevResults[r.groups[0]]['nice'])
-                                    #prevSystem = float(prevResults[r.groups[0]]['system'])
-                                    #prevIdle = float(prevResults[r.groups[0]]['idle'])
-                                    #prevTotal = prevUser + prevNice + prevSystem + prevIdle
-
-                                    #User = float(samples[r.groups[0]]['user'])
-                                    #Nice = float(samples[r.groups[0]]['nice'])
-                                    #System = float(samples[r.groups[0]]['system'])
-                                    #Idle = float(samples[r.groups[0]]['idle'])
-                                    #Total = User + Nice + System + Idle
-
-                                    #try:
-                                        #samples[r.groups[0]]['percent']=round(100 * (( Total - prevTotal ) - ( Idle - prevIdle )) / ( Total - prevTotal ), 2)
-                                    #except ZeroDivisionError:
-                                        #pass
+        self.addNamespaces(labels, reps)
+        for label, interfaces in self.namespaces_to_collect_data_from.items():
+            inode = labels.get(label)
+            path = self.PID_NETDEV_PATH.format(reps[inode]) if inode is not None else None
+            if self._ns_paths.get(label) != path:
+                # The namespace is read through another process
+                if label in self._ns_paths:
+                    self._proc_files.forget(self._ns_paths.pop(label))
+                if path is not None:
+                    self._ns_paths[label] = path
+            if path is None:
+                continue
+            try:
+                counters = self.readNetdev(path, interfaces)
+                raw[label] = (monotonic(), counters)
+            except (IOError, OSError):
+                # The process exited after the scan
+                LOG.debug(traceback.format_exc())
+                self._proc_files.forget(self._ns_paths.pop(label))
+
+    #----------------------------------------------------------------------
+    def interfaceSamples(self, interfaces, raw, prevRaw):
+        """
+        Returns the samples of the 'interfaces' from the read time and the
+        counters 'raw' (or None if they could not be read), and the read
+        time and the counters of the previous sample 'prevRaw'
+        """
+        NA = self.NA
+        read_time, counters = raw if raw is not None else (None, {})
+        samples = OrderedDict()
+        for ifName in interfaces:
+            samples[ifName] = OrderedDict()
+            values = counters.get(ifName)
+            for i, field in self._counter_fields:
+                samples[ifName][field] = values[i] if values is not None else NA
+
+            if self._rate_fields:
+                prevValues = None
+                if prevRaw is not None and values is not None:
+                    prev_time, prevTable = prevRaw
+                    prevValues = prevTable.get(ifName)
+                    elapsed = read_time - prev_time
+                for i, field in self._rate_fields:
+                    samples[ifName][field] = NA
+                    if prevValues is not None and elapsed > 0:
+                        delta = self.counterDelta(values[i], prevValues[i])
+                        if delta is not NA:
+                            samples[ifName][field] = delta / elapsed
 
+            for total, field, pair in self._total_fields:
+                if samples[ifName][field] is NA or samples[ifName][pair] is NA:
+                    # The interface disappeared or it was not present yet
+                    samples[ifName][total] = NA
+                else:
+                    samples[ifName][total] = samples[ifName][field] + samples[ifName][pair]
         return samples
@@ -0,0 +1,239 @@
+# Copyright (C) 2014  Vangelis Tasoulas <vangelis@tasoulas.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from libs.collector import DataCollector
+from libs.scheduler import monotonic
+import traceback
+try:
+    from collections import OrderedDict
+except ImportError:
+    # python 2.6 or earlier, use backport
+    from ordereddict import OrderedDict
+
+########################################################################
+class proto_stats(DataCollector):
+    """
+    Plugin to read the network protocol counters from Linux based hosts
+
+    --------------------------------------------------
+
+    Read the IP, ICMP, TCP and UDP counters from /proc/net/snmp, the
+    extended counters (TcpExt, IpExt ...) from /proc/net/netstat, and
+    the number of sockets from /proc/net/sockstat.
+
+    /proc/net/snmp and /proc/net/netstat have pairs of header/value lines:
+        Tcp: RtoAlgorithm RtoMin RtoMax MaxConn ActiveOpens PassiveOpens ...
+        Tcp: 1 200 120000 -1 41 31 ...
+
+    /proc/net/sockstat has name/value pairs:
+        TCP: inuse 4 orphan 0 tw 0 alloc 4 mem 0
+
+    The fields are named after the line and the name of the value,
+    i.e. Tcp_RetransSegs, TcpExt_ListenDrops, sockstat_TCP_inuse
+
+    # More information/documentation on /proc/net/snmp
+    https://www.kernel.org/doc/Documentation/networking/snmp_counter.rst
+    """
+
+    # The files the counters are read from, and their format
+    PAIRED = 'paired'
+    NAMED = 'named'
+    SOURCES = OrderedDict([
+        ('snmp', ('/proc/net/snmp', PAIRED)),
+        ('netstat', ('/proc/net/netstat', PAIRED)),
+        ('sockstat', ('/proc/net/sockstat', NAMED)),
+    ])
+
+    # The fields which are not counters. All of the sockstat fields are
+    # gauges too.
+    GAUGES = frozenset([
+        'Ip_Forwarding', 'Ip_DefaultTTL',
+        'Tcp_RtoAlgorithm', 'Tcp_RtoMin', 'Tcp_RtoMax', 'Tcp_MaxConn', 'Tcp_CurrEstab',
+    ])
+
+    # Accepted values for the counter_values option
+    COUNTER_VALUES = ('raw', 'delta', 'rate')
+
+    def __init__(self):
+        super(proto_stats, self).__init__()
+        # The read time and the raw values of the last two collect()
+        # calls, so that the deltas can be calculated from the prevResults
+        self._history = []
+
+    #----------------------------------------------------------------------
+    def readConfigVars(self):
+        # Default is to collect the TCP and UDP counters per sampling interval
+        self.options = {
+            'fields_to_collect': ['Tcp_*', 'Udp_*', 'TcpExt_ListenOverflows', 'TcpExt_ListenDrops',
+                                  'TcpExt_TCPTimeouts', 'TcpExt_TCPLostRetransmit', 'sockstat_*'],
+            'fields_to_exclude': [],
+            'counter_values': 'delta',
+            'NA_value': 'NA'
+        }
+
+        self.readConfParameter(self.options, 'fields_to_collect', self.STR, True)
+        self.readConfParameter(self.options, 'fields_to_exclude', self.STR, True)
+        self.readConfParameter(self.options, 'counter_values', self.STR)
+        self.readConfParameter(self.options, 'NA_value', self.STR)
+
+        if self.options['counter_values'] not in self.COUNTER_VALUES:
+            self.LOG.error("counter_values must be one of " + ', '.join(self.COUNTER_VALUES) + " for plugin '" + self.name + " " + "v" + str(self.version) + "'")
+            exit(1)
+
+        # Discover the available fields of every source, in the order of the files
+        available_fields = []
+        for source, (path, fmt) in self.SOURCES.items():
+            try:
+                for section, names, values in self.parseSections(source, self.readProcFile(path)):
+                    available_fields.extend(section + '_' + name for name in names)
+            except:
+                self.LOG.debug(traceback.format_exc())
+
+        # Fields which are not present in this kernel are still included if
+        # they are given by name, and they will be 'Not Available'
+        fields = self.include_exclude_fields(self.options['fields_to_collect'],
+                                             self.options['fields_to_exclude'],
+                                             available_fields, strict=False)
+        order = dict((field, i) for i, field in enumerate(available_fields))
+        self.fields = sorted([field for field in fields if field in order or not set('*?[') & set(field)],
+                             key=lambda field: (order.get(field, len(order)), field))
+        self.LOG.debug('Protocol fields to be used for data collection: ' + str(self.fields))
+
+        # The position of every field in the values, and the layout of the
+        # results: the fields are split in their section and name
+        self._slots = dict((field, i) for i, field in enumerate(self.fields))
+        self._counters = [i for i, field in enumerate(self.fields)
+                          if field not in self.GAUGES and not field.startswith('sockstat_')]
+        self._layout = []
+        for field in self.fields:
+            section, sep, name = field.rpartition('_')
+            self._layout.append((section, name))
+
+        # The value positions of the fields of every header line, compiled
+        # once for every header (see _compileHeader())
+        self._headers = {}
+        self._history = []
+
+    #----------------------------------------------------------------------
+    def parseSections(self, source, text):
+        """
+        Returns a list with the section, the value names and the values
+        (as strings) of every line (or pair of lines) of a source
+        """
+        sections = []
+        lines = text.splitlines()
+        if self.SOURCES[source][1] == self.PAIRED:
+            for header, values in zip(lines[0::2], lines[1::2]):
+                names = header.split()
+                sections.append((names[0].rstrip(':'), names[1:], values.split()[1:]))
+        else:
+            for line in lines:
+                tokens = line.split()
+                if tokens:
+                    sections.append(('sockstat_' + tokens[0].rstrip(':'), tokens[1::2], tokens[2::2]))
+        return sections
+
+    #----------------------------------------------------------------------
+    def _compileHeader(self, header):
+        """
+        Returns the positions of the collected values in the value line
+        of a header line, and their positions in the results
+        """
+        compiled = self._headers.get(header)
+        if compiled is None:
+            names = header.split()
+            section = names[0].rstrip(':')
+            compiled = []
+            for i, name in enumerate(names[1:]):
+                slot = self._slots.get(section + '_' + name)
+                if slot is not None:
+                    compiled.append((i + 1, slot))
+            compiled = self._headers[header] = tuple(compiled)
+        return compiled
+
+    #----------------------------------------------------------------------
+    def describe_fields(self):
+        """
+        Returns the layout of the results of collect() without reading the files
+        """
+        counters = set(self._counters)
+        if self.options['counter_values'] == 'raw':
+            counter_type = self.COUNTER
+        elif self.options['counter_values'] == 'delta':
+            counter_type = self.INT
+        else:
+            counter_type = self.FLOAT
+
+        fields = OrderedDict()
+        for i, (section, name) in enumerate(self._layout):
+            fields.setdefault(section, OrderedDict())[name] = counter_type if i in counters else self.INT
+        return fields
+
+    #----------------------------------------------------------------------
+    def collect(self, prevResults = {}):
+        NA = self.NA
+        values = [NA] * len(self.fields)
+        for source, (path, fmt) in self.SOURCES.items():
+            try:
+                text = self.readProcFile(path)
+                if fmt == self.PAIRED:
+                    lines = text.splitlines()
+                    for header, line in zip(lines[0::2], lines[1::2]):
+                        compiled = self._compileHeader(header)
+                        if compiled:
+                            tokens = line.split()
+                            for i, slot in compiled:
+                                values[slot] = int(tokens[i])
+                else:
+                    for section, names, tokens in self.parseSections(source, text):
+                        for name, token in zip(names, tokens):
+                            slot = self._slots.get(section + '_' + name)
+                            if slot is not None:
+                                values[slot] = int(token)
+            except:
+                self.LOG.debug(traceback.format_exc())
+        read_time = monotonic()
+
+        mode = self.options['counter_values']
+        results = list(values)
+        if mode != 'raw':
+            prev = None
+            # The raw values of the prevResults (if they were returned by
+            # one of the last two collect() calls)
+            for samples, raw in self._history:
+                if samples is prevResults:
+                    prev = raw
+                    break
+
+            for i in self._counters:
+                results[i] = NA
+                if prev is not None:
+                    cur, last = values[i], prev[1][i]
+                    # Counters going back (i.e. 32 bit counters which wrapped) are NA
+                    if cur is not NA and last is not NA and cur >= last:
+                        if mode == 'delta':
+                            results[i] = cur - last
+                        elif read_time > prev[0]:
+                            results[i] = (cur - last) / (read_time - prev[0])
+
+        samples = OrderedDict()
+        for (section, name), value in zip(self._layout, results):
+            if section not in samples:
+                samples[section] = OrderedDict()
+            samples[section][name] = value
+
+        if mode != 'raw':
+            self._history = [(samples, (read_time, values))] + self._history[:1]
+        return samples
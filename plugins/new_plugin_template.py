@@ -35,6 +35,16 @@ class uptime(DataCollector):
         """
         pass
 
+    #----------------------------------------------------------------------
+    def describe_fields(self):
+        """
+        Optional: describe the layout of the results of collect(), so that
+        sysdata-collector doesn't need to collect any data to get the headers.
+        """
+        fields = OrderedDict()
+        fields['uptime'] = self.FLOAT
+        return fields
+
     #----------------------------------------------------------------------
     def collect(self, prevResults = None):
         """
@@ -47,10 +57,12 @@ class uptime(DataCollector):
         samples = OrderedDict()
         try:
             r = quick_regexp()
-            with open('/proc/uptime') as f:
-                for line in f.readlines():
-                    if(r.search('(\S+)\s+(\d+)', line)):
-                        samples['uptime'] = r.groups[0]
+            # readProcFile() keeps the file open between the samples
+            for line in self.readProcFile('/proc/uptime').splitlines():
+                if(r.search('(\S+)\s+(\d+)', line)):
+                    # Return the value as a number. It is formatted
+                    # when it is written in the output.
+                    samples['uptime'] = float(r.groups[0])
 
         except:
             traceback.print_exc()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014  Vangelis Tasoulas <vangelis@tasoulas.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark the collect() of the cpu_stats plugin on many-core systems.
+
+Synthetic /proc/stat files with 8, 64, 256 and 1024 CPUs are generated
+and the cpu_stats plugin collects from them. The microseconds per collect()
+are reported with and without the calculation of the cpu percentages.
+
+If numpy is installed, the percentages are calculated both with numpy and
+with the plain python fallback, and the results are checked to be equal.
+
+Usage: python support-scripts/benchmark_cpu_stats.py [collects]
+"""
+
+import os
+import sys
+import imp
+import time
+import shutil
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+CPUS = (8, 64, 256, 1024)
+
+def make_proc_stat(path, cpus, tick):
+    lines = []
+    for cpu in ['cpu'] + ['cpu' + str(i) for i in range(cpus)]:
+        n = tick * (cpus if cpu == 'cpu' else 1)
+        lines.append(cpu + ' ' + ' '.join(str(n * (i + 1) + i) for i in range(10)))
+    lines.append('intr 123456789 ' + ' '.join('0' for i in range(256)))
+    lines.append('ctxt ' + str(1000000 + tick))
+    lines.append('btime 1388534400')
+    lines.append('processes ' + str(5000 + tick))
+    lines.append('procs_running 2')
+    lines.append('procs_blocked 0')
+    lines.append('softirq 123 1 2 3 4 5 6 7 8 9 10')
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+def bench(func, collects):
+    started = time.time()
+    for i in range(collects):
+        func()
+    return (time.time() - started) * 1e6 / collects
+
+def main():
+    collects = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    cpu = imp.load_source('cpu', os.path.join(ROOT, 'plugins', 'cpu.py'))
+    numpy = cpu.numpy
+    tmpdir = tempfile.mkdtemp()
+    try:
+        print("{0:>6} {1:>14} {2:>17} {3:>20}".format('cpus', 'collect() us', 'without numpy us', 'without pct_* us'))
+        for cpus in CPUS:
+            path = os.path.join(tmpdir, 'stat' + str(cpus))
+            make_proc_stat(path, cpus, 1)
+
+            plugin = cpu.cpu_stats()
+            plugin.PROC_STAT_PATH = path
+            plugin.activate()
+            prev = plugin.collect()
+            make_proc_stat(path, cpus, 2)
+
+            collect_us = bench(lambda: plugin.collect(prev), collects)
+            if numpy is not None:
+                results = plugin.collect(prev)
+                cpu.numpy = None
+                fallback_us = bench(lambda: plugin.collect(prev), collects)
+                assert plugin.collect(prev) == results, 'The percentages of the numpy and python calculations differ'
+                cpu.numpy = numpy
+            else:
+                fallback_us = collect_us
+            plugin.options['calc_cpu_perc'] = False
+            parse_us = bench(lambda: plugin.collect(prev), collects)
+            print("{0:>6} {1:>14.1f} {2:>17.1f} {3:>20.1f}".format(cpus, collect_us, fallback_us, parse_us))
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014  Vangelis Tasoulas <vangelis@tasoulas.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark the external plugins run on every sample (plugins/load_avg.sh)
+against the same plugin run as a coprocess (plugins/load_avg_coprocess.sh).
+
+The milliseconds per sample and the CPU time (of the collector and the
+scripts) per sample are reported, and the output of both is checked to
+be the same.
+
+Usage: python support-scripts/benchmark_external_plugins.py [samples]
+"""
+
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from libs.helperfuncs import executeCommand
+from libs.coprocess import Coprocess
+
+ONE_SHOT = os.path.join(ROOT, 'plugins', 'load_avg.sh')
+COPROCESS = os.path.join(ROOT, 'plugins', 'load_avg_coprocess.sh')
+
+def cpu_time():
+    # The CPU time of this process and of its children which exited
+    times = os.times()
+    return sum(times[:4])
+
+def bench(func, samples, close=None):
+    started = time.time()
+    started_cpu = cpu_time()
+    for i in range(samples):
+        func()
+    elapsed = time.time() - started
+    if close is not None:
+        # The CPU time of a coprocess is counted after it exits
+        close()
+    return elapsed * 1e3 / samples, (cpu_time() - started_cpu) * 1e3 / samples
+
+def main():
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    coprocess = Coprocess([COPROCESS])
+    one_shot_lines = [line for line in executeCommand([ONE_SHOT]).getStdout() if line]
+    if coprocess.request('sample', 'end') != one_shot_lines:
+        raise AssertionError('The coprocess returned different values')
+
+    print("{0:<12} {1:>14} {2:>18}".format('', 'ms per sample', 'cpu ms per sample'))
+    results = [
+        ('one-shot', bench(lambda: executeCommand([ONE_SHOT]).getStdout(), samples)),
+        ('coprocess', bench(lambda: coprocess.request('sample', 'end'), samples, coprocess.close)),
+    ]
+    for name, (wall_ms, cpu_ms) in results:
+        print("{0:<12} {1:>14.3f} {2:>18.3f}".format(name, wall_ms, cpu_ms))
+
+if __name__ == '__main__':
+    main()
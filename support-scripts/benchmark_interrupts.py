@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014  Vangelis Tasoulas <vangelis@tasoulas.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark the collect() of the irq_stats plugin on many-core systems.
+
+Synthetic /proc/interrupts and /proc/softirqs tables with 32, 128 and 256
+CPUs (and 300 interrupts) are generated, with one NUMA node per 16 CPUs.
+The microseconds per collect() are reported with one column per CPU and
+with the CPUs aggregated per NUMA node. The collected values are checked
+against a plain parser of the tables.
+
+Usage: python support-scripts/benchmark_interrupts.py [collects]
+"""
+
+import os
+import sys
+import imp
+import time
+import shutil
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+CPUS = (32, 128, 256)
+IRQS = 300
+CPUS_PER_NODE = 16
+SOFTIRQS = ('HI', 'TIMER', 'NET_TX', 'NET_RX', 'BLOCK', 'IRQ_POLL', 'TASKLET', 'SCHED', 'HRTIMER', 'RCU')
+
+def make_tables(tmpdir, cpus, tick):
+    header = ' ' * 4 + ''.join('CPU{0:<7}'.format(cpu) for cpu in range(cpus))
+    lines = [header]
+    for irq in range(IRQS):
+        counts = ''.join('{0:>11}'.format((irq + 1) * tick * (cpu + 1)) for cpu in range(cpus))
+        lines.append('{0:>4}:{1}  PCI-MSI 524288-edge      eth0-TxRx-{2}'.format(irq, counts, irq))
+    for name in ('NMI', 'LOC', 'RES', 'CAL'):
+        counts = ''.join('{0:>11}'.format(tick * 1000 + cpu) for cpu in range(cpus))
+        lines.append('{0:>4}:{1}   {2} interrupts'.format(name, counts, name))
+    lines.append(' ERR:          0')
+    with open(os.path.join(tmpdir, 'interrupts'), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+    lines = [' ' * 12 + ''.join('CPU{0:<7}'.format(cpu) for cpu in range(cpus))]
+    for i, name in enumerate(SOFTIRQS):
+        counts = ''.join('{0:>11}'.format(tick * (i + 1) * (cpu + 7)) for cpu in range(cpus))
+        lines.append('{0:>12}:{1}'.format(name, counts))
+    with open(os.path.join(tmpdir, 'softirqs'), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+def make_nodes(tmpdir, cpus):
+    nodes = os.path.join(tmpdir, 'node')
+    for node in range(cpus // CPUS_PER_NODE):
+        path = os.path.join(nodes, 'node' + str(node))
+        os.makedirs(path)
+        with open(os.path.join(path, 'cpulist'), 'w') as f:
+            f.write('{0}-{1}\n'.format(node * CPUS_PER_NODE, (node + 1) * CPUS_PER_NODE - 1))
+    return nodes
+
+def plain_parse(path):
+    """
+    Returns {name: {cpu: count}} of a table, parsed line by line
+    """
+    with open(path) as f:
+        lines = f.readlines()
+    cpus = [token.lower() for token in lines[0].split()]
+    table = {}
+    for line in lines[1:]:
+        name, rest = line.split(':', 1)
+        table[name.strip()] = {}
+        for cpu, token in zip(cpus, rest.split()):
+            if not token.isdigit():
+                break
+            table[name.strip()][cpu] = int(token)
+    return table
+
+def make_plugin(irq, tmpdir, nodes, aggregate):
+    plugin = irq.irq_stats()
+    plugin.SOURCES = irq.OrderedDict([('interrupts', os.path.join(tmpdir, 'interrupts')),
+                                      ('softirqs', os.path.join(tmpdir, 'softirqs'))])
+    plugin.NODE_PATH = nodes
+    plugin.config.add_section('Plugin')
+    plugin.config.set('Plugin', 'aggregate_numa_nodes', str(aggregate))
+    plugin.activate()
+    return plugin
+
+def check(plugin, tmpdir, prev_tables, results):
+    # The values of every cpu (or the sum of the cpus of every node) must
+    # be the difference from the previous tables
+    for source in ('interrupts', 'softirqs'):
+        table = plain_parse(os.path.join(tmpdir, source))
+        for name, values in results[source].items():
+            for column, value in values.items():
+                cpus = [cpu for cpu in plugin.cpus if plugin.column_of_cpu[cpu] == column]
+                if not all(cpu in table[name] for cpu in cpus):
+                    expected = None
+                else:
+                    expected = sum(table[name][cpu] - prev_tables[source][name][cpu] for cpu in cpus)
+                assert value == expected, (source, name, column, value, expected)
+
+def bench(func, collects):
+    started = time.time()
+    for i in range(collects):
+        func()
+    return (time.time() - started) * 1e6 / collects
+
+def main():
+    collects = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    irq = imp.load_source('interrupts', os.path.join(ROOT, 'plugins', 'interrupts.py'))
+    print("{0:>6} {1:>8} {2:>14} {3:>8} {4:>19}".format('cpus', 'columns', 'collect() us', 'columns', 'per NUMA node us'))
+    for cpus in CPUS:
+        tmpdir = tempfile.mkdtemp()
+        try:
+            nodes = make_nodes(tmpdir, cpus)
+            row = [cpus]
+            for aggregate in (False, True):
+                make_tables(tmpdir, cpus, 1)
+                plugin = make_plugin(irq, tmpdir, nodes, aggregate)
+                prev = plugin.collect(None)
+                prev_tables = dict((source, plain_parse(os.path.join(tmpdir, source))) for source in ('interrupts', 'softirqs'))
+                make_tables(tmpdir, cpus, 2)
+                check(plugin, tmpdir, prev_tables, plugin.collect(prev))
+
+                # Keep collecting against the same prevResults
+                history = plugin._history[-1:]
+                def sample():
+                    plugin._history = history
+                    plugin.collect(prev)
+                columns = sum(len(irqs) for irqs in plugin.irqs.values()) * len(plugin.columns)
+                row += [columns, bench(sample, collects)]
+            print("{0:>6} {1:>8} {2:>14.1f} {3:>8} {4:>19.1f}".format(*row))
+        finally:
+            shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014  Vangelis Tasoulas <vangelis@tasoulas.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark the collect() of the net_stats plugin with the procfs
+(/proc/net/dev) and the netlink (RTM_GETLINK dump) stats_source.
+
+The benchmark must run as root: it moves itself to a new network
+namespace (so that the interfaces of the host are not touched) and
+creates veth pairs in it, for 10, 1000 and 10000 interfaces. The
+milliseconds to read the counters of all of the interfaces
+(readCounters()) and per collect() are reported, and the counters of
+both sources are checked to be the same.
+
+Usage: sudo python support-scripts/benchmark_net_stats.py [collects]
+"""
+
+import os
+import sys
+import imp
+import time
+import ctypes
+import ctypes.util
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+INTERFACES = (10, 1000, 10000)
+
+# From <sched.h>
+CLONE_NEWNET = 0x40000000
+
+def new_network_namespace():
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    if libc.unshare(CLONE_NEWNET) != 0:
+        raise OSError(ctypes.get_errno(), 'unshare(CLONE_NEWNET) failed: ' + os.strerror(ctypes.get_errno()))
+
+def add_interfaces(first, last):
+    """
+    Add veth pairs until there are 'last' interfaces
+    """
+    commands = ''.join('link add v{0}a type veth peer name v{0}b\n'.format(pair)
+                       for pair in range(first // 2, last // 2))
+    ip = subprocess.Popen(['ip', '-batch', '-'], stdin=subprocess.PIPE)
+    ip.communicate(commands)
+    if ip.returncode != 0:
+        raise OSError("Failed to add the interfaces with 'ip'")
+
+def make_plugin(net, source):
+    plugin = net.net_stats()
+    plugin.config.add_section('Plugin')
+    plugin.config.set('Plugin', 'fields_to_collect', '*')
+    plugin.config.set('Plugin', 'stats_source', source)
+    plugin.activate()
+    return plugin
+
+def bench(func, collects):
+    started = time.time()
+    for i in range(collects):
+        func()
+    return (time.time() - started) * 1e3 / collects
+
+def main():
+    collects = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    new_network_namespace()
+    net = imp.load_source('net', os.path.join(ROOT, 'plugins', 'net.py'))
+
+    print("{0:>10} {1:>12} {2:>13} {3:>9} {4:>18} {5:>19}".format(
+        'interfaces', 'procfs ms', 'netlink ms', 'speedup', 'collect() procfs', 'collect() netlink'))
+    # lo and a bridge, so that the veth pairs make an even number of interfaces
+    subprocess.check_call(['ip', 'link', 'add', 'br0', 'type', 'bridge'])
+    interfaces = 2
+    for count in INTERFACES:
+        add_interfaces(interfaces, count)
+        interfaces = count
+
+        plugins = dict((source, make_plugin(net, source)) for source in ('procfs', 'netlink'))
+        assert plugins['netlink']._links is not None, 'netlink is not available'
+        # No traffic goes through the interfaces, so the counters must be the same
+        assert plugins['procfs'].collect(None) == plugins['netlink'].collect(None)
+
+        read_ms = {}
+        collect_ms = {}
+        for source, plugin in plugins.items():
+            read_ms[source] = bench(lambda: plugin.readCounters(plugin._interfaces), collects)
+            collect_ms[source] = bench(lambda: plugin.collect(None), collects)
+            plugin.deactivate()
+        print("{0:>10} {1:>12.2f} {2:>13.2f} {3:>8.1f}x {4:>18.2f} {5:>19.2f}".format(
+            len(plugins['procfs'].interfaces_to_collect_data_from), read_ms['procfs'], read_ms['netlink'],
+            read_ms['procfs'] / read_ms['netlink'], collect_ms['procfs'], collect_ms['netlink']))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014  Vangelis Tasoulas <vangelis@tasoulas.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark the collect() of the net_stats plugin with network_namespaces
+enabled, on a host with 10, 100 and 500 network namespaces.
+
+The benchmark must run as root: every namespace is created with
+'unshare -n', with a shell and PROCESSES_PER_NAMESPACE processes in it
+(like the processes of a container), which are killed at the end. The
+milliseconds
+per incremental namespace scan (libs.netns) are reported against a full
+scan which resolves the namespace of every process, and the milliseconds
+per collect() of all of the namespaces.
+
+Usage: sudo python support-scripts/benchmark_netns.py [collects]
+"""
+
+import os
+import sys
+import imp
+import time
+import signal
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from libs.netns import NetnsScanner
+
+NAMESPACES = (10, 100, 500)
+PROCESSES_PER_NAMESPACE = 5
+
+def full_scan(scanner):
+    reps = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            inode = scanner.nsInode(entry)
+            if inode is not None:
+                reps.setdefault(inode, int(entry))
+    return reps
+
+def make_plugin(net):
+    plugin = net.net_stats()
+    plugin.config.add_section('Plugin')
+    plugin.config.set('Plugin', 'network_namespaces', 'True')
+    plugin.config.set('Plugin', 'fields_to_collect', '*bytes, *packets, *errs, *drop, multicast')
+    plugin.activate()
+    return plugin
+
+def bench(func, collects):
+    started = time.time()
+    for i in range(collects):
+        func()
+    return (time.time() - started) * 1e3 / collects
+
+def main():
+    collects = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    net = imp.load_source('net', os.path.join(ROOT, 'plugins', 'net.py'))
+    processes = []
+    try:
+        print("{0:>10} {1:>10} {2:>14} {3:>17} {4:>14}".format(
+            'namespaces', 'processes', 'full scan ms', 'incremental ms', 'collect() ms'))
+        for count in NAMESPACES:
+            while len(processes) < count:
+                processes.append(subprocess.Popen(['unshare', '-n', 'sh', '-c',
+                                                   'sleep 3600 & ' * PROCESSES_PER_NAMESPACE + 'wait'],
+                                                  preexec_fn=os.setsid))
+            # Wait until all of the processes are in their namespaces
+            scanner = NetnsScanner()
+            while len(full_scan(scanner)) <= count:
+                time.sleep(0.1)
+
+            plugin = make_plugin(net)
+            found = len(plugin.namespaces_to_collect_data_from)
+            assert found >= count, found
+            scanner.scan()
+            row = [found, len(scanner._pid_ns),
+                   bench(lambda: full_scan(scanner), collects),
+                   bench(scanner.scan, collects),
+                   bench(lambda: plugin.collect(None), collects)]
+            plugin.deactivate()
+            print("{0:>10} {1:>10} {2:>14.2f} {3:>17.2f} {4:>14.2f}".format(*row))
+    finally:
+        for process in processes:
+            # Kill the processes of the namespace too
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+
+if __name__ == '__main__':
+    main()
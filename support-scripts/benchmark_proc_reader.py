@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014  Vangelis Tasoulas <vangelis@tasoulas.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark the procfs/sysfs reader which keeps the files open between
+the samples (libs.procreader), against opening and reading the files
+with readlines() on every sample.
+
+The microseconds per sample are reported for /proc/stat, /proc/net/dev
+and all of the network statistics files in /sys/class/net/*/statistics
+(read together, as a plugin reading many sysfs files per sample would).
+
+Usage: python support-scripts/benchmark_proc_reader.py [samples]
+"""
+
+import os
+import sys
+import glob
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from libs.procreader import ProcFileCache
+
+def open_readlines(paths):
+    for path in paths:
+        with open(path) as f:
+            f.readlines()
+
+def cached_read(cache, paths):
+    for path in paths:
+        cache.read(path).splitlines()
+
+def bench(func, samples):
+    started = time.time()
+    for i in range(samples):
+        func()
+    return (time.time() - started) * 1e6 / samples
+
+def main():
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    sysfs = sorted(glob.glob('/sys/class/net/*/statistics/*'))
+    cases = [
+        ('/proc/stat', ['/proc/stat']),
+        ('/proc/net/dev', ['/proc/net/dev']),
+        (str(len(sysfs)) + ' sysfs files', sysfs),
+    ]
+
+    print("{0:<20} {1:>18} {2:>14} {3:>9}".format('files', 'open+readlines us', 'cached us', 'speedup'))
+    for name, paths in cases:
+        if not paths or not all(os.path.exists(path) for path in paths):
+            continue
+        cache = ProcFileCache()
+        try:
+            # The contents must be the same
+            for path in paths:
+                if cache.read(path).splitlines()[:1] != [line.rstrip('\n') for line in open(path).readlines()][:1]:
+                    raise AssertionError("Different contents read from '" + path + "'")
+            legacy_us = bench(lambda: open_readlines(paths), samples)
+            cached_us = bench(lambda: cached_read(cache, paths), samples)
+        finally:
+            cache.close()
+        print("{0:<20} {1:>18.1f} {2:>14.1f} {3:>8.1f}x".format(name, legacy_us, cached_us, legacy_us / cached_us))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014  Vangelis Tasoulas <vangelis@tasoulas.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark the RowEncoder against the per-sample flatten and string
+concatenation that was used to build the output lines.
+
+Synthetic results with 1k, 10k and 50k columns are encoded (20 fields
+per nested dictionary, like the per-core dictionaries of the cpu plugin)
+and the number of rows per second is reported.
+
+Usage: python support-scripts/benchmark_row_encoder.py [rows]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from libs.helperfuncs import flatten_nested_dicts
+from libs.rowencoder import RowEncoder
+try:
+    from collections import OrderedDict
+except ImportError:
+    # python 2.6 or earlier, use backport
+    from ordereddict import OrderedDict
+
+FIELDS_PER_GROUP = 20
+COLUMNS = (1000, 10000, 50000)
+
+def make_results(columns):
+    results = OrderedDict()
+    for group in range(columns // FIELDS_PER_GROUP):
+        results['cpu' + str(group)] = OrderedDict(('field' + str(i), str(group * i)) for i in range(FIELDS_PER_GROUP))
+    return results
+
+def legacy_line(results, delimiter=','):
+    line = '2014-01-01_00:00:00' + delimiter + '1388534400000000' + delimiter
+    flat_dict = flatten_nested_dicts(results)
+    last_value_in_flat_dict = len(flat_dict) - 1
+    for j, key in enumerate(flat_dict):
+        if flat_dict[key]:
+            if j == last_value_in_flat_dict:
+                line += str(flat_dict[key])
+            else:
+                line += str(flat_dict[key]) + delimiter
+    return line
+
+def bench(func, rows):
+    started = time.time()
+    for i in range(rows):
+        func()
+    return rows / (time.time() - started)
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    print("{0:>10} {1:>18} {2:>18} {3:>9}".format('columns', 'legacy rows/sec', 'encoder rows/sec', 'speedup'))
+    for columns in COLUMNS:
+        results = make_results(columns)
+        encoder = RowEncoder(['datetime', 'timestamp'])
+        encoder.addSegment('bench', results)
+        leading = ['2014-01-01_00:00:00', '1388534400000000']
+
+        # Both ways must produce exactly the same line
+        assert legacy_line(results) == encoder.encode([results], leading)
+
+        legacy = bench(lambda: legacy_line(results), rows)
+        encoded = bench(lambda: encoder.encode([results], leading), rows)
+        print("{0:>10} {1:>18.1f} {2:>18.1f} {3:>8.1f}x".format(columns, legacy, encoded, encoded / legacy))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014  Vangelis Tasoulas <vangelis@tasoulas.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Check that the binary output format (libs/binaryformat.py) writes rows
+with values which cannot be stored, and that the records written after
+them are read back correctly, with the fixed and the delta encoding:
+
+- Values which overflow their column (ints outside int64, int('inf'))
+  are NA, and the rest of the row is kept.
+- A row which fails to be packed doesn't move the counter references
+  of the delta encoding, so the next records are decoded correctly.
+
+Exits with a non-zero status if a check fails.
+
+Usage: python support-scripts/check_binaryformat.py
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    # python 2.6 or earlier, use backport
+    from ordereddict import OrderedDict
+
+from libs.collector import DataCollector
+from libs.rowencoder import RowEncoder
+from libs.binaryformat import BinaryFormat, BinaryReader
+
+def make_format(encoding):
+    layout = OrderedDict([('c', DataCollector.COUNTER), ('g', DataCollector.INT), ('f', DataCollector.FLOAT)])
+    encoder = RowEncoder()
+    encoder.addSegment('check', layout, described=True)
+    return BinaryFormat(encoder, encoding=encoding)
+
+def write_and_read(fmt, rows, directory):
+    """
+    Write the rows one by one (skipping the rows which fail to be
+    encoded) and return the rows read back
+    """
+    path = os.path.join(directory, fmt.encoding + '.sdcb')
+    with open(path, 'wb') as f:
+        f.write(fmt.header())
+        for row in rows:
+            try:
+                f.write(fmt.record(row))
+            except Exception:
+                pass
+    reader = BinaryReader(path)
+    try:
+        return list(reader.rows())
+    finally:
+        reader.close()
+
+class FailOnce(object):
+    """
+    Wraps the struct of a BinaryFormat, to fail the pack() of one record
+    """
+    def __init__(self, struct, fail_at):
+        self._struct = struct
+        self._calls = 0
+        self._fail_at = fail_at
+        self.size = struct.size
+
+    def pack(self, *args):
+        self._calls += 1
+        if self._calls == self._fail_at:
+            raise ValueError('Injected pack() failure')
+        return self._struct.pack(*args)
+
+def check(name, got, expected):
+    if got != expected:
+        print("FAIL " + name + ": got " + repr(got) + ", expected " + repr(expected))
+        return False
+    print("ok   " + name)
+    return True
+
+def main():
+    directory = tempfile.mkdtemp()
+    passed = True
+    try:
+        for encoding in ('fixed', 'delta'):
+            rows = [[100, 5, 1.0], [200, 2 ** 63, 2.0], [300, 7, float('inf')], [400, -2 ** 63 - 1, 4.0]]
+            got = write_and_read(make_format(encoding), rows, directory)
+            passed &= check(encoding + ': int64 overflow is NA', [row[1] for row in got], [5, 'NA', 7, 'NA'])
+            passed &= check(encoding + ': rows with NA are kept', [row[0] for row in got], [100, 200, 300, 400])
+
+            rows = [[100, 5, 1.0], [200, 6, 2.0], ['inf', 7, 3.0], [400, 8, 4.0]]
+            got = write_and_read(make_format(encoding), rows, directory)
+            passed &= check(encoding + ": int('inf') is NA", [row[0] for row in got], [100, 200, 'NA', 400])
+
+        # The second record fails to be packed, the third one must
+        # still be decoded from the references of the first one
+        fmt = make_format('delta')
+        fmt._struct = FailOnce(fmt._struct, 2)
+        got = write_and_read(fmt, [[100, 5, 1.0], [200, 6, 2.0], [300, 7, 3.0]], directory)
+        passed &= check('delta: failed record keeps the references', [row[0] for row in got], [100, 300])
+    finally:
+        shutil.rmtree(directory)
+
+    if not passed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014  Vangelis Tasoulas <vangelis@tasoulas.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Check the cpu percentages of the cpu_stats plugin (plugins/cpu.py) against
+the per cpu calculation the plugin used before the counters were kept in
+arrays (reference_collect() below).
+
+Both calculations run on the same generated /proc/stat files: normal
+samples, identical samples (zero delta), decreasing counters, missing cpu
+lines, truncated lines and malformed values, in the current or in the
+previous sample, followed by randomized samples. The pct_* values must be
+the same (after the rounding of the outputs) and in the same order, and NA
+where the previous calculation returned NA.
+
+If numpy is installed, the numpy and the plain python calculations are
+both checked.
+
+Exits with a non-zero status if a check fails.
+
+Usage: python support-scripts/check_cpu_stats.py [random samples]
+"""
+
+import os
+import sys
+import imp
+import random
+import shutil
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    # python 2.6 or earlier, use backport
+    from ordereddict import OrderedDict
+
+CPUS = ['cpu', 'cpu0', 'cpu1', 'cpu2', 'cpu3']
+
+def reference_collect(plugin, text, prevResults):
+    """
+    The cpu lines and the percentages of a /proc/stat file, as they were
+    calculated before the counters were kept in arrays. All of the values
+    are strings. The configuration (cores, fields, kernel features and
+    NA value) is taken from the plugin.
+    """
+    samples = OrderedDict()
+    cpu_lines = {}
+    for line in text.splitlines():
+        tokens = line.split()
+        if tokens and tokens[0].startswith('cpu'):
+            cpu_lines[plugin._cpuName(tokens[0])] = tokens
+
+    NA_value = plugin.options['NA_value']
+    for cpuName in plugin.sorted_cpu_cores:
+        tokens = cpu_lines.get(cpuName)
+        if tokens is None:
+            samples[cpuName] = OrderedDict([(field, NA_value) for i, field in plugin.cpu_field_index])
+        else:
+            # The fields which are missing from the line are NA
+            ntokens = len(tokens)
+            samples[cpuName] = OrderedDict([(field, tokens[i] if i < ntokens else NA_value) for i, field in plugin.cpu_field_index])
+
+    has_guest_nice = plugin.hasCapability('guest_nice')
+    has_guest = plugin.hasCapability('guest')
+    has_steal = plugin.hasCapability('steal')
+    for cpuName in samples:
+        samples[cpuName]['pct_total_used'] = NA_value
+        samples[cpuName]['pct_total_idle'] = NA_value
+        samples[cpuName]['pct_user'] = NA_value
+        samples[cpuName]['pct_system'] = NA_value
+        samples[cpuName]['pct_nice'] = NA_value
+        samples[cpuName]['pct_idle'] = NA_value
+        samples[cpuName]['pct_iowait'] = NA_value
+        samples[cpuName]['pct_irq'] = NA_value
+        samples[cpuName]['pct_softirq'] = NA_value
+        if has_guest_nice:
+            samples[cpuName]['pct_guest_nice'] = NA_value
+        if has_guest:
+            samples[cpuName]['pct_guest'] = NA_value
+        if has_steal:
+            samples[cpuName]['pct_steal'] = NA_value
+
+        if prevResults:
+            try:
+                PrevSteal = PrevGuest = PrevGuest_nice = 0
+                Steal = Guest = Guest_nice = 0
+
+                if has_guest_nice:
+                    PrevGuest_nice = float(prevResults[cpuName]['guest_nice'])
+                    Guest_nice = float(samples[cpuName]['guest_nice'])
+                if has_guest:
+                    PrevGuest = float(prevResults[cpuName]['guest'])
+                    Guest = float(samples[cpuName]['guest'])
+                if has_steal:
+                    PrevSteal = float(prevResults[cpuName]['steal'])
+                    Steal = float(samples[cpuName]['steal'])
+
+                prevUser = float(prevResults[cpuName]['user']) - PrevGuest
+                prevNice = float(prevResults[cpuName]['nice']) - PrevGuest_nice
+                prevSystem = float(prevResults[cpuName]['system'])
+                prevIrq = float(prevResults[cpuName]['irq'])
+                prevSoftIrq = float(prevResults[cpuName]['softirq'])
+                prevIdle = float(prevResults[cpuName]['idle'])
+                prevIowait = float(prevResults[cpuName]['iowait'])
+
+                prevTotalIdle = prevIdle + prevIowait
+                prevVirtual = PrevGuest + PrevGuest_nice
+                prevTotalSystem = prevSystem + prevIrq + prevSoftIrq
+                prevTotal = prevUser + prevNice + prevTotalSystem + prevVirtual + prevTotalIdle + PrevSteal
+
+                User = float(samples[cpuName]['user']) - Guest
+                Nice = float(samples[cpuName]['nice']) - Guest_nice
+                System = float(samples[cpuName]['system'])
+                Irq = float(samples[cpuName]['irq'])
+                SoftIrq = float(samples[cpuName]['softirq'])
+                Idle = float(samples[cpuName]['idle'])
+                Iowait = float(samples[cpuName]['iowait'])
+
+                TotalIdle = Idle + Iowait
+                Virtual = Guest + Guest_nice
+                TotalSystem = System + Irq + SoftIrq
+                Total = User + Nice + TotalSystem + Virtual + TotalIdle + Steal
+
+                if Total - prevTotal > 0:
+                    samples[cpuName]['pct_total_used'] = str(round(100 * (( Total - prevTotal ) - ( TotalIdle - prevTotalIdle )) / ( Total - prevTotal ), 2))
+                    samples[cpuName]['pct_total_idle'] = str(round(100 * ( Idle - prevIdle ) / ( Total - prevTotal ), 2))
+                    samples[cpuName]['pct_user'] = str(round((100 * ( User - prevUser ) / ( Total - prevTotal )), 2))
+                    samples[cpuName]['pct_system'] = str(round((100 * ( System - prevSystem ) / ( Total - prevTotal )), 2))
+                    samples[cpuName]['pct_nice'] = str(round((100 * ( Nice - prevNice ) / ( Total - prevTotal )), 2))
+                    samples[cpuName]['pct_idle'] = str(round((100 * ( Idle - prevIdle ) / ( Total - prevTotal )), 2))
+                    samples[cpuName]['pct_iowait'] = str(round((100 * ( Iowait - prevIowait ) / ( Total - prevTotal )), 2))
+                    samples[cpuName]['pct_irq'] = str(round((100 * ( Irq - prevIrq ) / ( Total - prevTotal )), 2))
+                    samples[cpuName]['pct_softirq'] = str(round((100 * ( SoftIrq - prevSoftIrq ) / ( Total - prevTotal )), 2))
+                    if has_guest_nice:
+                        samples[cpuName]['pct_guest_nice'] = str(round((100 * ( Guest_nice - PrevGuest_nice ) / ( Total - prevTotal )), 2))
+                    if has_guest:
+                        samples[cpuName]['pct_guest'] = str(round((100 * ( Guest - PrevGuest ) / ( Total - prevTotal )), 2))
+                    if has_steal:
+                        samples[cpuName]['pct_steal'] = str(round((100 * ( Steal - PrevSteal ) / ( Total - prevTotal )), 2))
+                else:
+                    samples[cpuName]['pct_total_used'] = str(0)
+                    samples[cpuName]['pct_total_idle'] = str(1)
+                    samples[cpuName]['pct_user'] = str(0)
+                    samples[cpuName]['pct_system'] = str(0)
+                    samples[cpuName]['pct_nice'] = str(0)
+                    samples[cpuName]['pct_idle'] = str(1)
+                    samples[cpuName]['pct_iowait'] = str(0)
+                    samples[cpuName]['pct_irq'] = str(0)
+                    samples[cpuName]['pct_softirq'] = str(0)
+                    if has_guest_nice:
+                        samples[cpuName]['pct_guest_nice'] = str(0)
+                    if has_guest:
+                        samples[cpuName]['pct_guest'] = str(0)
+                    if has_steal:
+                        samples[cpuName]['pct_steal'] = str(0)
+            except ZeroDivisionError:
+                pass
+            except ValueError:
+                # The value is NA or not a number
+                pass
+
+    return samples
+
+def make_proc_stat(cpus):
+    """
+    The text of a /proc/stat file with the given {cpu: fields} lines
+    (the cpus which are not given are missing)
+    """
+    lines = [cpu + ' ' + ' '.join(str(value) for value in cpus[cpu]) for cpu in CPUS if cpu in cpus]
+    lines.append('ctxt 1000000')
+    lines.append('btime 1388534400')
+    lines.append('processes 5000')
+    lines.append('procs_running 2')
+    lines.append('procs_blocked 0')
+    return '\n'.join(lines) + '\n'
+
+def counters(tick):
+    return [100 * tick * (i + 1) + i for i in range(10)]
+
+def fixed_cases():
+    """
+    (name, previous /proc/stat, current /proc/stat) of the edge cases
+    """
+    prev = dict((cpu, counters(1)) for cpu in CPUS)
+    cur = dict((cpu, counters(2 + i)) for i, cpu in enumerate(CPUS))
+
+    def changed(sample, cpu, fields):
+        sample = dict(sample)
+        if fields is None:
+            del sample[cpu]
+        else:
+            sample[cpu] = fields
+        return sample
+
+    return [
+        ('normal', prev, cur),
+        ('zero delta', prev, prev),
+        ('decreasing counters', cur, prev),
+        ('missing cpu line', prev, changed(cur, 'cpu1', None)),
+        ('missing previous cpu line', changed(prev, 'cpu1', None), cur),
+        ('missing aggregate line', prev, changed(cur, 'cpu', None)),
+        ('truncated line', prev, changed(cur, 'cpu2', counters(2)[:4])),
+        ('truncated previous line', changed(prev, 'cpu2', counters(1)[:7]), cur),
+        ('empty line', prev, changed(cur, 'cpu3', [])),
+        ('malformed value', prev, changed(cur, 'cpu0', counters(2)[:3] + ['x'] + counters(2)[4:])),
+        ('only guest changed', prev, changed(prev, 'cpu0', counters(1)[:8] + [1000, 1000])),
+        ('no cpu lines', prev, {}),
+    ]
+
+def random_cases(samples, rnd):
+    """
+    Randomized samples, with zero deltas and missing or truncated lines
+    """
+    values = dict((cpu, [rnd.randint(0, 10 ** 6) for i in range(10)]) for cpu in CPUS)
+    prev = dict(values)
+    for n in range(samples):
+        cur = {}
+        for cpu in CPUS:
+            choice = rnd.random()
+            if choice < 0.05:
+                # missing line
+                continue
+            if choice < 0.1:
+                cur[cpu] = values[cpu][:rnd.randint(0, 9)]
+                continue
+            if choice > 0.2:
+                values[cpu] = [v + rnd.choice((0, 0, 1, rnd.randint(0, 1000))) for v in values[cpu]]
+            cur[cpu] = values[cpu]
+        yield 'random ' + str(n), prev, cur
+        prev = cur
+
+def same(ref, value, NA_value):
+    """
+    True if the value of the plugin is the reference value as written in
+    the outputs (rounded to 2 decimals, None is NA)
+    """
+    if value is None:
+        return ref == NA_value
+    if ref == NA_value:
+        return False
+    return round(value, 2) == float(ref)
+
+def check_case(plugin, path, prev_cpus, cur_cpus):
+    """
+    Collect the previous and the current sample with the plugin and with
+    reference_collect(), and return the differences of the pct_* values
+    """
+    NA_value = plugin.options['NA_value']
+    errors = []
+    ref_prev = None
+    prev = None
+    for cpus in (prev_cpus, cur_cpus):
+        text = make_proc_stat(cpus)
+        with open(path, 'w') as f:
+            f.write(text)
+        ref = reference_collect(plugin, text, ref_prev)
+        results = plugin.collect(prev) if prev is not None else plugin.collect()
+        for cpuName in plugin.sorted_cpu_cores:
+            ref_pct = [(k, v) for k, v in ref[cpuName].items() if k.startswith('pct_')]
+            pct = [(k, v) for k, v in results[cpuName].items() if k.startswith('pct_')]
+            if [k for k, v in ref_pct] != [k for k, v in pct]:
+                errors.append(cpuName + ': fields ' + repr([k for k, v in pct]) + ', expected ' + repr([k for k, v in ref_pct]))
+                continue
+            for (field, ref_value), (field, value) in zip(ref_pct, pct):
+                if not same(ref_value, value, NA_value):
+                    errors.append(cpuName + ' ' + field + ': got ' + repr(value) + ', expected ' + repr(ref_value))
+        ref_prev = ref
+        prev = results
+    return errors
+
+def report(name, errors):
+    if errors:
+        print("FAIL " + name)
+        for error in errors:
+            print("       " + error)
+        return False
+    print("ok   " + name)
+    return True
+
+def main():
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    cpu = imp.load_source('cpu', os.path.join(ROOT, 'plugins', 'cpu.py'))
+    numpy = cpu.numpy
+    tmpdir = tempfile.mkdtemp()
+    passed = True
+    try:
+        path = os.path.join(tmpdir, 'stat')
+        with open(path, 'w') as f:
+            f.write(make_proc_stat(dict((c, counters(1)) for c in CPUS)))
+        plugin = cpu.cpu_stats()
+        plugin.PROC_STAT_PATH = path
+        plugin.activate()
+
+        for use_numpy in ((True, False) if numpy is not None else (False,)):
+            cpu.numpy = numpy if use_numpy else None
+            prefix = 'numpy: ' if use_numpy else 'python: '
+            for name, prev_cpus, cur_cpus in fixed_cases():
+                passed &= report(prefix + name, check_case(plugin, path, prev_cpus, cur_cpus))
+            errors = []
+            for name, prev_cpus, cur_cpus in random_cases(samples, random.Random(1)):
+                errors.extend(name + ': ' + error for error in check_case(plugin, path, prev_cpus, cur_cpus))
+            passed &= report(prefix + str(samples) + ' random samples', errors)
+        cpu.numpy = numpy
+    finally:
+        shutil.rmtree(tmpdir)
+
+    if not passed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2014  Vangelis Tasoulas <vangelis@tasoulas.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Check that the net_stats plugin (plugins/net.py) with network_namespaces
+enabled collects the network namespaces which appear after the data
+collection started (i.e. a container which starts, or restarts in a new
+namespace), and switches the layout of its results:
+
+- A new namespace is in the samples and in describe_fields(), and the
+  layout_version of the plugin is increased.
+- A namespace excluded by exclude_namespaces is not added.
+- The namespace of an exited container is kept, with NA values.
+
+The processes and their namespaces are a generated /proc tree, so the
+check doesn't need root.
+
+Exits with a non-zero status if a check fails.
+
+Usage: python support-scripts/check_netns.py
+"""
+
+import os
+import sys
+import imp
+import shutil
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from libs.netns import NetnsScanner
+
+NETDEV = """Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+{0}: {1} 10 0 0 0 0 0 0 {1} 10 0 0 0 0 0 0
+"""
+
+def add_process(proc, pid, inode, ifName='eth0', rx_bytes=1000):
+    """
+    Add a process to the /proc tree 'proc', in the network namespace 'inode'
+    """
+    os.makedirs(os.path.join(proc, str(pid), 'ns'))
+    os.symlink('net:[' + str(inode) + ']', os.path.join(proc, str(pid), 'ns', 'net'))
+    os.makedirs(os.path.join(proc, str(pid), 'net'))
+    with open(os.path.join(proc, str(pid), 'net', 'dev'), 'w') as f:
+        f.write(NETDEV.format(ifName, rx_bytes))
+
+def remove_process(proc, pid):
+    shutil.rmtree(os.path.join(proc, str(pid)))
+
+def check(name, got, expected):
+    if got != expected:
+        print("FAIL " + name + ": got " + repr(got) + ", expected " + repr(expected))
+        return False
+    print("ok   " + name)
+    return True
+
+def main():
+    net = imp.load_source('net', os.path.join(ROOT, 'plugins', 'net.py'))
+    tmpdir = tempfile.mkdtemp()
+    proc = os.path.join(tmpdir, 'proc')
+    passed = True
+    try:
+        # The collector (and pid 100) is in the namespace 1, and a container in 2
+        os.makedirs(os.path.join(proc, 'self', 'ns'))
+        os.symlink('net:[1]', os.path.join(proc, 'self', 'ns', 'net'))
+        add_process(proc, 100, 1, 'lo')
+        add_process(proc, 200, 2)
+        net.NetnsScanner = lambda: NetnsScanner(proc, netns_dirs=())
+
+        plugin = net.net_stats()
+        plugin.NETDEV_PATH = os.path.join(proc, '100', 'net', 'dev')
+        plugin.PID_NETDEV_PATH = os.path.join(proc, '{0}', 'net', 'dev')
+        plugin.config.add_section('Plugin')
+        plugin.config.set('Plugin', 'network_namespaces', 'True')
+        plugin.config.set('Plugin', 'fields_to_collect', '*bytes, *packets')
+        plugin.config.set('Plugin', 'exclude_namespaces', '4')
+        plugin.activate()
+
+        prev = plugin.collect()
+        passed &= check('namespaces at the start', [k for k in prev if k.startswith('netns_')], ['netns_2'])
+        layout_version = plugin.layout_version
+
+        # A container starts in the namespace 3, and one in the excluded namespace 4
+        add_process(proc, 300, 3, 'eth1', 2000)
+        add_process(proc, 400, 4)
+        prev = plugin.collect(prev)
+        passed &= check('new namespace in the samples', [k for k in prev if k.startswith('netns_')], ['netns_2', 'netns_3'])
+        passed &= check('counters of the new namespace', prev.get('netns_3', {}).get('eth1', {}).get('rx_bytes'), 2000)
+        passed &= check('new namespace in describe_fields()', list(plugin.describe_fields().get('netns_3', [])), ['eth1'])
+        passed &= check('layout_version increased', plugin.layout_version, layout_version + 1)
+
+        # The container of the namespace 2 restarts in the namespace 5
+        remove_process(proc, 200)
+        add_process(proc, 201, 5)
+        prev = plugin.collect(prev)
+        passed &= check('restarted container', [k for k in prev if k.startswith('netns_')], ['netns_2', 'netns_3', 'netns_5'])
+        passed &= check('exited namespace is NA', prev['netns_2']['eth0']['rx_bytes'], plugin.NA)
+        passed &= check('layout_version increased again', plugin.layout_version, layout_version + 2)
+
+        # Nothing new
+        prev = plugin.collect(prev)
+        passed &= check('layout_version unchanged', plugin.layout_version, layout_version + 2)
+        plugin.deactivate()
+    finally:
+        shutil.rmtree(tmpdir)
+
+    if not passed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -22,14 +22,18 @@ import yapsy
 import logging
 import time
 import traceback
-from datetime import datetime, timedelta
+from datetime import datetime
 from yapsy.PluginFileLocator import PluginFileLocator, PluginFileAnalyzerWithInfoFile
 from yapsy.PluginManager import PluginManager, IPluginLocator
 from libs import globalvars
 from libs import parseoptions
 from libs.helperfuncs import *
 from libs.collector import DataCollector
-from threading import Thread
+from libs.workerpool import WorkerPool
+from libs.rowencoder import RowEncoder, INT, STR
+from libs.writer import AsyncWriter, CSVFormat, OutputFile, openOutputFile, COMPRESSIONS
+from libs.binaryformat import BinaryFormat, BINARY_EXTENSION
+from libs.scheduler import TickScheduler, monotonic
 from ConfigParser import SafeConfigParser
 from distutils.version import StrictVersion
 try:
@@ -197,6 +201,10 @@ class Main(object):
             print_(4 * " " + str(plugin['order']) + ": '" + plugin['name'] + " v" + str(plugin['info'].version) + "' located at '" + plugin['info'].path + "'")
             print_(8 * " " + " " * len(str(plugin['order'])) + "Module name: '" + os.path.basename(plugin['info'].path) + "'")
             print_(8 * " " + " " * len(str(plugin['order'])) + "Symlink loading this instance: '" + symlink_key + "'")
+            if plugin['interval'] is not None:
+                print_(8 * " " + " " * len(str(plugin['order'])) + "Sampling interval: " + str(plugin['interval']) + " seconds")
+            if plugin['collect_timeout'] is not None:
+                print_(8 * " " + " " * len(str(plugin['order'])) + "Collect timeout: " + str(plugin['collect_timeout']) + " seconds")
 
 
     #----------------------------------------------------------------------
@@ -277,6 +285,8 @@ class Main(object):
                             self.ActiveDataCollectors[symlinked_plugin]['order'] = activated_num
                             self.ActiveDataCollectors[symlinked_plugin]['info'] = plugin
                             self.ActiveDataCollectors[symlinked_plugin]['name'] = plugin.name
+                            self.ActiveDataCollectors[symlinked_plugin]['interval'] = plugin.plugin_object.getSamplingInterval()
+                            self.ActiveDataCollectors[symlinked_plugin]['collect_timeout'] = plugin.plugin_object.getCollectTimeout()
 
         if(activated_num):
             # Sort self.ActiveDataCollectors by ['order'] number
@@ -291,16 +301,41 @@ class Main(object):
             exit(globalvars.exitCode.FAILURE)
 
 
-#----------------------------------------------------------------------
-def runCollectThreaded(toRun, result, key, prevResults):
-    """
-    Function ro run the collect jobs in threads.
-    toRun:        The plugin to be executed
-    results:      The dictionary to store the result
-    key:          The key in dict results to store the result
-    prevResults:  The previous results of this plugin
-    """
-    result[key] = toRun.collect(prevResults)
+    #----------------------------------------------------------------------
+    def configure_sampling_intervals(self):
+        """
+        Calculate how often each one of the active plugins will be sampled.
+
+        Plugins may define their own 'sampling_interval' in their metaconf
+        or conf file. The interval is rounded to a multiple of the global
+        intervalBetweenSamples and it is stored in 'interval_ticks' (the
+        plugin will be sampled every 'interval_ticks' ticks of the scheduler).
+        """
+        for symlink_key, plugin in self.ActiveDataCollectors.items():
+            interval_ticks = 1
+            if plugin['interval'] is not None:
+                if globalvars.intervalBetweenSamples > 0:
+                    interval_ticks = max(1, int(round(plugin['interval'] / globalvars.intervalBetweenSamples)))
+                    if abs(interval_ticks * globalvars.intervalBetweenSamples - plugin['interval']) > 1e-6:
+                        LOG.warning("The sampling_interval (" + str(plugin['interval']) + ") of plugin '" + plugin['name'] + "' is not a multiple of intervalBetweenSamples (" + str(globalvars.intervalBetweenSamples) + ")")
+                        LOG.warning("Plugin '" + plugin['name'] + "' will be sampled every " + str(interval_ticks * globalvars.intervalBetweenSamples) + " seconds")
+                else:
+                    LOG.warning("The sampling_interval of plugin '" + plugin['name'] + "' is ignored because intervalBetweenSamples is 0")
+            plugin['interval_ticks'] = interval_ticks
+
+    #----------------------------------------------------------------------
+    def configure_collect_deadlines(self):
+        """
+        Calculate for how long sysdata-collector will wait for each plugin
+        on every sample, before filling its values with its NA value.
+
+        The deadline of a plugin is the shortest of its own 'collect_timeout'
+        and the global collect_deadline. If none is defined, the plugin has
+        no deadline ('deadline' is None).
+        """
+        for symlink_key, plugin in self.ActiveDataCollectors.items():
+            deadlines = [d for d in (plugin['collect_timeout'], globalvars.collect_deadline) if d]
+            plugin['deadline'] = min(deadlines) if deadlines else None
 
 
 #----------------------------------------------------------------------
@@ -336,33 +371,106 @@ def main():
         main.list_active_plugins()
         exit(globalvars.exitCode.SUCCESS)
 
-    orig_output_file = globalvars.output_file
+    # Work out how often each plugin will be sampled and
+    # in which output stream its data will be written
+    main.configure_sampling_intervals()
+    main.configure_collect_deadlines()
+    streams = getOutputStreams(main)
+
+    LOG.info(globalvars.PROGRAM_NAME + " " + globalvars.VERSION + " started...")
+
+    # If we are writing in a file, print this information to the user
+    if not globalvars.only_print_samples:
+        for stream in streams:
+            if(globalvars.append_file):
+                LOG.info("Appending data to file '" + stream['output_file'] + "'")
+            else:
+                LOG.info("Saving data to file '" + stream['output_file'] + "'")
+    initDataCollection(main, streams)
+
+
+#----------------------------------------------------------------------
+def getUniqueOutputFile(output_file):
+    """
+    Returns a filename which will not overwrite an existing file.
+
+    If output_file exists and append_file is not set, a new filename with
+    a trailing '-ddd' (incremented by one if already exists) is returned.
+    The '-ddd' of compressed and binary files is added before their
+    extensions (i.e. 'data-001.csv.gz'), so that they are still recognised.
+    """
+    root, ext = output_file, ''
+    # The compression extension, and the extension of the file before it
+    suffixes = [suffix for suffix in COMPRESSIONS.values() if suffix and output_file.endswith(suffix)]
+    if suffixes:
+        root, ext = output_file[:-len(suffixes[0])], suffixes[0]
+        root, base_ext = os.path.splitext(root)
+        ext = base_ext + ext
+    elif output_file.endswith(BINARY_EXTENSION):
+        root, ext = output_file[:-len(BINARY_EXTENSION)], BINARY_EXTENSION
     counter = 1
-    while(os.path.exists(globalvars.output_file)):
-        if(not os.path.isdir(globalvars.output_file)):
+    while(os.path.exists(output_file)):
+        if(not os.path.isdir(output_file)):
             if(globalvars.append_file):
                 # Use the existing file to append the data
                 break
             else:
                 # Generate a new filename
-                LOG.debug("'" + globalvars.output_file + "' exists and it will not be appended")
-                globalvars.output_file = orig_output_file + "-" + str(counter).zfill(3)
-                LOG.debug("Trying '" + globalvars.output_file + "'...")
+                LOG.debug("'" + output_file + "' exists and it will not be appended")
+                output_file = root + "-" + str(counter).zfill(3) + ext
+                LOG.debug("Trying '" + output_file + "'...")
                 counter += 1
         else:
-            LOG.critical("The given output file '" + globalvars.output_file + "' is a directory. Please specify a file.")
+            LOG.critical("The given output file '" + output_file + "' is a directory. Please specify a file.")
             exit(globalvars.exitCode.FAILURE)
-    del orig_output_file
+    return output_file
 
-    LOG.info(globalvars.PROGRAM_NAME + " " + globalvars.VERSION + " started...")
 
-    # If we are writing in a file, print this information to the user
-    if not globalvars.only_print_samples:
-        if(globalvars.append_file):
-            LOG.info("Appending data to file '" + globalvars.output_file + "'")
-        else:
-            LOG.info("Saving data to file '" + globalvars.output_file + "'")
-    initDataCollection(main)
+#----------------------------------------------------------------------
+def getOutputStreams(main):
+    """
+    Group the active plugins in output streams.
+
+    By default (multirate_output = carry_forward) all of the plugins are
+    written in the same output file, and the plugins which are not due on
+    a sample, repeat the values of their last collection.
+
+    If multirate_output = split, the plugins with the same sampling interval
+    are written in their own output file. The stream of the fastest plugins
+    keeps the output_file name, and the rest of the streams get a '_<N>s'
+    suffix, where N is their sampling interval in seconds.
+    """
+    groups = OrderedDict()
+    if globalvars.multirate_output == 'split':
+        for symlink, plugin in sorted(main.ActiveDataCollectors.iteritems(), key=lambda x: x[1]['interval_ticks']):
+            groups.setdefault(plugin['interval_ticks'], []).append(symlink)
+    else:
+        groups[min(p['interval_ticks'] for p in main.ActiveDataCollectors.values())] = list(main.ActiveDataCollectors)
+
+    streams = []
+    for i, (interval_ticks, symlinks) in enumerate(groups.iteritems()):
+        output_file = globalvars.output_file
+        if globalvars.output_format == 'binary' and not globalvars.only_print_samples:
+            # Binary files get their own extension, so that they are not mistaken for CSV files
+            root, ext = os.path.splitext(output_file)
+            if ext.lower() == '.csv':
+                output_file = root + BINARY_EXTENSION
+            elif ext.lower() != BINARY_EXTENSION:
+                output_file += BINARY_EXTENSION
+        if i > 0:
+            root, ext = os.path.splitext(output_file)
+            output_file = root + "_" + "{0:g}".format(interval_ticks * globalvars.intervalBetweenSamples) + "s" + ext
+        # Compressed files get the extension of the compression
+        suffix = COMPRESSIONS[globalvars.output_compression]
+        if suffix and not output_file.endswith(suffix):
+            output_file += suffix
+        streams.append({
+            'interval_ticks': interval_ticks,
+            'symlinks': symlinks,
+            'output_file': getUniqueOutputFile(output_file),
+            'writer': None
+        })
+    return streams
 
 
 #----------------------------------------------------------------------
@@ -377,135 +485,296 @@ def testPlugin(plugin):
 
 
 #----------------------------------------------------------------------
-def initDataCollection(main):
-    # Open the file for writing/appending
-    handle = sys.stdout
+def initDataCollection(main, streams):
+    scheduler = None
+    Sample = {}
     try:
-        f = open(globalvars.output_file, mode='a') if not globalvars.only_print_samples else sys.stdout
-
-        # Collect the header line and the 'prevResults'
-        Sample, line = collectHeaders(main)
-
-        # If we write in a file....
-        if not globalvars.only_print_samples:
-            # If f.tell() == 0, it means that the file has nothing in it.
-            # So we need to print the headers
-            if(f.tell() == 0):
-                f.write(line + "\n")
-                LOG_CONSOLE.info(line)
-            # TODO: When appending an existing file (if(f.tell() != 0)),
-            # check if the columns match (check the number of columns and
-            # existing headers)
-        else:
-            f.write(line + "\n")
-
-        # Sleep only for one second for the very first time
-        # The first run is only here for header printing and for initilizing the prevResults
-        # in case any of the plugins need it
-        time.sleep(1)
+        # Start the long-lived worker threads which will run the collect()
+        # method of the active plugins on every sample
+        pool_size = globalvars.worker_pool_size if globalvars.worker_pool_size else len(main.ActiveDataCollectors)
+        pool = WorkerPool(pool_size, name='collector')
 
-        # Enter in an infinite data collection loop
-        while 1:
-            Sample, line, datetime_started_collection = collectData(main, Sample)
+        # Get the layout of the results of the plugins and prime the 'prevResults'
+        Sample = collectHeaders(main, pool)
 
-            timestamp_for_next_execution = (datetime_started_collection + timedelta(seconds=globalvars.intervalBetweenSamples)).strftime('%s%f')
+        for stream in streams:
+            # Compile the row encoder of the stream from the layout of the collected results
+            stream['encoder'] = getRowEncoder(main, Sample, stream['symlinks'])
+            fmt = getOutputFormat(stream['encoder'])
 
-            f.write(line + "\n")
-            # If file descriptor is sys.stdout, there is no need to reprint the output
+            # Open the file for writing/appending
             if not globalvars.only_print_samples:
-                LOG_CONSOLE.info(line)
+                f = OutputFile(stream['output_file'],
+                               binary=fmt.binary,
+                               compression=globalvars.output_compression,
+                               level=globalvars.compression_level,
+                               rotate_size=int(globalvars.rotate_size_mb * 1024 * 1024),
+                               rotate_interval=globalvars.rotate_interval)
+            else:
+                f = sys.stdout
 
-            # Get the sleeping time until next execution
-            sleep_for = (float(timestamp_for_next_execution) - float(datetime.utcnow().strftime('%s%f'))) / 1000000
+            # If we write in a file....
+            write_header = True
+            if not globalvars.only_print_samples:
+                # If f.tell() == 0, it means that the file has nothing in it.
+                # So we need to print the headers
+                write_header = f.tell() == 0
+                # TODO: When appending an existing file (if(f.tell() != 0)),
+                # check if the columns match (check the number of columns and
+                # existing headers)
+                if not write_header and fmt.binary:
+                    # The records of a binary file must match its header block
+                    with openOutputFile(stream['output_file'], globalvars.output_compression) as existing:
+                        header = fmt.header()
+                        if existing.read(len(header)) != header:
+                            LOG.critical("The columns of '" + stream['output_file'] + "' do not match the active plugins. Cannot append binary data to it.")
+                            exit(globalvars.exitCode.FAILURE)
+
+            # The rows are formatted and written by a dedicated writer
+            # thread, so that slow storage does not delay the sampling
+            stream['writer'] = getWriter(f, fmt, write_header)
+
+        # The scheduler keeps the sampling on a monotonic clock so
+        # that the samples do not drift over time. The first sample
+        # is taken one interval after the 'prevResults' were primed
+        # (or on the next wall-clock boundary if aligned).
+        scheduler = TickScheduler(globalvars.intervalBetweenSamples,
+                                  align=globalvars.align_samples_to_wallclock,
+                                  overrun_policy=globalvars.overrun_policy)
 
-            # sleep_for is less or equal to 0, continue with the execution. No need to wait.
-            if(sleep_for > 0):
-                time.sleep(sleep_for)
+        # Enter in an infinite data collection loop
+        while 1:
+            tick = scheduler.wait()
+            due = getDuePlugins(main, Sample, tick.index)
+            Sample, datetime_started_collection = collectData(main, Sample, pool, due)
+            updateLayouts(main, Sample, streams, due)
+
+            for stream in streams:
+                # A stream gets a new line only when any of its plugins has been sampled
+                if not any(symlink in due for symlink in stream['symlinks']):
+                    continue
+
+                # The filled slots are reused by the encoder, so queue a copy of them
+                row = list(stream['encoder'].fill([Sample[symlink]['currentResults'] for symlink in stream['symlinks']],
+                                                  [datetime_started_collection.strftime('%Y-%m-%d_%H:%M:%S'), int(datetime_started_collection.strftime('%s%f'))]))
+                stream['writer'].write(row)
     except KeyboardInterrupt:
         print("\n")
         LOG.info("Collection stopped")
+        if scheduler is not None:
+            LOG.info("Sampling " + scheduler.stats())
+        for symlink in Sample:
+            if Sample[symlink]['deadline_misses']:
+                LOG.info("Plugin '" + main.ActiveDataCollectors[symlink]['name'] + "' (" + symlink + ") missed its collect deadline " + str(Sample[symlink]['deadline_misses']) + " time(s)")
         exit(globalvars.exitCode.FAILURE)
     except:
         LOG.critical(traceback.format_exc())
         exit(globalvars.exitCode.FAILURE)
     finally:
-        if handle is not sys.stdout:
-            handle.close()
+        for stream in streams:
+            if stream['writer'] is not None:
+                stream['writer'].close()
+                LOG.info("Output '" + stream['writer'].name + "' " + stream['writer'].stats())
+
+
+#----------------------------------------------------------------------
+def getOutputFormat(encoder):
+    """
+    Returns the output format (CSV or binary) for the rows of 'encoder'
+    """
+    # Samples printed in stdout are always in CSV
+    if globalvars.output_format == 'binary' and not globalvars.only_print_samples:
+        # The datetime column is always 'YYYY-mm-dd_HH:MM:SS'
+        return BinaryFormat(encoder,
+                            widths={'datetime': 19},
+                            encoding=globalvars.binary_encoding,
+                            keyframe_interval=globalvars.binary_keyframe_interval)
+    return CSVFormat(encoder.delimiter, encoder.columns, precision=globalvars.float_precision)
+
+
+#----------------------------------------------------------------------
+def getWriter(f, fmt, write_header):
+    """
+    Returns an AsyncWriter for the file object 'f', configured
+    with the writer options of sysdata-collector.conf
+    """
+    echo = None
+    echo_fmt = None
+    # If file descriptor is sys.stdout, there is no need to reprint the output
+    if f is not sys.stdout:
+        echo = LOG_CONSOLE.info
+        echo_fmt = getEchoFormat(fmt)
+    return AsyncWriter(f,
+                       fmt=fmt,
+                       write_header=write_header,
+                       max_queue=globalvars.writer_queue_size,
+                       overflow=globalvars.writer_overflow,
+                       max_spill=globalvars.writer_spill_size,
+                       flush_every_rows=globalvars.flush_every_rows,
+                       flush_interval=globalvars.flush_interval,
+                       fsync_on_rotate=globalvars.fsync_on_rotate,
+                       echo=echo,
+                       echo_fmt=echo_fmt,
+                       close_file=f is not sys.stdout)
+
+
+#----------------------------------------------------------------------
+def getEchoFormat(fmt):
+    """
+    Returns the format of the rows of 'fmt' printed in the console
+    """
+    return CSVFormat(globalvars.delimiter, fmt.columns, precision=globalvars.console_float_precision)
 
 
 #----------------------------------------------------------------------
-def collectHeaders(main):
+def collectHeaders(main, pool):
     # Store the samples from all plugins in the Sample dict
     Sample = {}
 
-    # Declare a 'threads' dict to store the threads
-    threads = {}
+    # Declare a 'futures' dict to store the pending collect() jobs
+    futures = {}
 
-    # Read the headers and collect samples once for the prevResults
+    # Get the layout of the results and collect samples once for the prevResults
     for symlink in main.ActiveDataCollectors:
         Sample[symlink] = {}
-        Sample[symlink]['headers'] = main.ActiveDataCollectors[symlink]['plugin'].getHeaders(globalvars.delimiter)
-        # Collect data from each plugin in a separate thread
-        threads[symlink] = Thread(target=runCollectThreaded, args=(main.ActiveDataCollectors[symlink]['plugin'], Sample[symlink], 'prevResults', None))
-        threads[symlink].start()
-
-    line = ''
-    last_value_in_dict = len(main.ActiveDataCollectors) - 1
-    # Join the threads and generate the output line
-    for i, symlink in enumerate(main.ActiveDataCollectors):
-        # Wait for all of the threads to finish execution
-        threads[symlink].join()
-        del threads[symlink]
-
-        # If it is the very first iteration, print the datetine and unix timestamp
-        if i == 0:
-            line += 'datetime' + globalvars.delimiter + 'timestamp' + globalvars.delimiter
-
-        if Sample[symlink]['headers']:
-            if i == last_value_in_dict:
-                line += Sample[symlink]['headers']
-            else:
-                line += Sample[symlink]['headers'] + globalvars.delimiter
+        # Plugins implementing describe_fields() return their layout without
+        # collecting any data. For the rest, the layout will be taken from
+        # the results collected for the prevResults in the same pass.
+        Sample[symlink]['layout'] = main.ActiveDataCollectors[symlink]['plugin'].describe_fields()
+        Sample[symlink]['described'] = Sample[symlink]['layout'] is not None
+        Sample[symlink]['layout_version'] = main.ActiveDataCollectors[symlink]['plugin'].layout_version
+        # The plugin will be sampled on the very first tick
+        Sample[symlink]['next_due'] = None
+        # A collect() job which missed its deadline and is still running
+        Sample[symlink]['pending'] = None
+        Sample[symlink]['deadline_misses'] = 0
+        # Collect data from each plugin in the worker pool
+        futures[symlink] = pool.submit(main.ActiveDataCollectors[symlink]['plugin'].collect, None)
+
+    # Wait for all of the jobs to finish execution
+    for symlink in main.ActiveDataCollectors:
+        Sample[symlink]['prevResults'] = futures.pop(symlink).result()
+        Sample[symlink]['currentResults'] = Sample[symlink]['prevResults']
+        if Sample[symlink]['layout'] is None:
+            Sample[symlink]['layout'] = Sample[symlink]['prevResults']
+
+    return Sample
+
+
+#----------------------------------------------------------------------
+def updateLayouts(main, Sample, streams, due):
+    """
+    Take the layout of the due plugins which changed their layout_version
+    again, and switch the output of their streams to the new columns
+    """
+    changed = set()
+    for symlink in due:
+        plugin = main.ActiveDataCollectors[symlink]['plugin']
+        # The new layout is taken after a successful collect()
+        if plugin.layout_version == Sample[symlink]['layout_version'] or Sample[symlink]['currentResults'] is None:
+            continue
+        layout = plugin.describe_fields()
+        Sample[symlink]['described'] = layout is not None
+        Sample[symlink]['layout'] = layout if layout is not None else Sample[symlink]['currentResults']
+        Sample[symlink]['layout_version'] = plugin.layout_version
+        changed.add(symlink)
+        LOG.info("The layout of plugin '" + main.ActiveDataCollectors[symlink]['name'] + "' (" + symlink + ") changed")
+
+    for stream in streams:
+        if changed.intersection(stream['symlinks']):
+            # Rows queued before are written with the old columns
+            stream['encoder'] = getRowEncoder(main, Sample, stream['symlinks'])
+            fmt = getOutputFormat(stream['encoder'])
+            stream['writer'].setFormat(fmt, getEchoFormat(fmt))
+            LOG.info("New columns of '" + stream['writer'].name + "': " + str(len(fmt.columns)))
+
+
+#----------------------------------------------------------------------
+def getDuePlugins(main, Sample, tick):
+    """
+    Returns a list with the active plugins which need to be sampled on 'tick'
+    """
+    due = []
+    for symlink in main.ActiveDataCollectors:
+        interval_ticks = main.ActiveDataCollectors[symlink]['interval_ticks']
+        next_due = Sample[symlink]['next_due']
+        # If the tick moved backwards (the schedule has been re-aligned
+        # after a wall-clock change), sample the plugin immediately
+        if next_due is None or tick >= next_due or next_due - tick > interval_ticks:
+            due.append(symlink)
+            # Keep the slower plugins aligned on multiples of their interval
+            Sample[symlink]['next_due'] = (tick // interval_ticks + 1) * interval_ticks
+    return due
 
-    return Sample, line
+
+#----------------------------------------------------------------------
+def getRowEncoder(main, Sample, symlinks):
+    """
+    Returns a RowEncoder compiled from the layout of the results
+    of the plugins in 'symlinks'
+    """
+    encoder = RowEncoder(['datetime', 'timestamp'], globalvars.delimiter, leading_types=[STR, INT])
+    for symlink in symlinks:
+        encoder.addSegment(symlink, Sample[symlink]['layout'], main.ActiveDataCollectors[symlink]['plugin'].getNAValue(),
+                           described=Sample[symlink]['described'])
+    return encoder
 
 
 #----------------------------------------------------------------------
-def collectData(main, Sample):
+def collectData(main, Sample, pool, due):
     # Get the current time (it will be used to provide timestamps)
     dt = datetime.utcnow()
-    timestamp_started_collection = dt.strftime('%s%f')
-    datetime_started_collection = dt.strftime('%Y-%m-%d_%H:%M:%S')
+    started = monotonic()
+
+    # Declare a 'futures' dict to store the pending collect() jobs of this sample
+    futures = {}
+
+    # Submit the data collection jobs of the due plugins to the worker pool to run in parallel
+    for symlink in due:
+        pending = Sample[symlink]['pending']
+        if pending is not None:
+            if not pending.done():
+                # The collect() of a previous sample is still running.
+                # Do not start a new one, the values will be filled with NA.
+                continue
+            Sample[symlink]['pending'] = None
+            # The late result can be used as the 'prevResults' of this sample
+            if globalvars.late_results == 'prev_results':
+                try:
+                    Sample[symlink]['prevResults'] = pending.result()
+                except:
+                    LOG.debug(traceback.format_exc())
+        futures[symlink] = pool.submit(main.ActiveDataCollectors[symlink]['plugin'].collect, Sample[symlink]['prevResults'])
+
+    # Wait for the results. The plugins which are not due keep
+    # their 'currentResults' from their last collection
+    for symlink in due:
+        plugin = main.ActiveDataCollectors[symlink]
+        future = futures.get(symlink)
+        if future is not None:
+            timeout = None
+            if plugin['deadline'] is not None:
+                timeout = max(0, started + plugin['deadline'] - monotonic())
+
+            if future.wait(timeout):
+                try:
+                    Sample[symlink]['currentResults'] = future.result()
+                    Sample[symlink]['prevResults'] = Sample[symlink]['currentResults']
+                    continue
+                except:
+                    LOG.error("Plugin '" + plugin['name'] + "' (" + symlink + ") failed to collect data. Its values will be filled with '" + str(plugin['plugin'].getNAValue()) + "'")
+                    LOG.error(traceback.format_exc())
+            else:
+                Sample[symlink]['pending'] = future
 
-    # Declare a 'threads' dict to store the threads
-    threads = {}
+        if Sample[symlink]['pending'] is not None:
+            Sample[symlink]['deadline_misses'] += 1
+            LOG.warning("Plugin '" + plugin['name'] + "' (" + symlink + ") missed its collect deadline of " + str(plugin['deadline']) + " seconds (" + str(Sample[symlink]['deadline_misses']) + " in total)")
 
-    # Start all of the data collection jobs in parallel threads
-    for symlink in main.ActiveDataCollectors:
-        threads[symlink] = Thread(target=runCollectThreaded, args=(main.ActiveDataCollectors[symlink]['plugin'], Sample[symlink], 'currentResults', Sample[symlink]['prevResults']))
-        threads[symlink].start()
-
-    line = ''
-    last_value_in_dict = len(main.ActiveDataCollectors) - 1
-    # Join the threads and generate the output line
-    for i, symlink in enumerate(main.ActiveDataCollectors):
-        threads[symlink].join()
-        del threads[symlink]
-        # If it is the very first iteration, print the datetine and unix timestamp
-        if i == 0:
-            line += datetime_started_collection + globalvars.delimiter + timestamp_started_collection + globalvars.delimiter
-
-        flat_dict = flatten_nested_dicts(Sample[symlink]['currentResults'])
-        last_value_in_flat_dict = len(flat_dict) - 1
-        for j, key in enumerate(flat_dict):
-            if flat_dict[key]:
-                if i == last_value_in_dict and j == last_value_in_flat_dict:
-                    line += str(flat_dict[key])
-                else:
-                    line += str(flat_dict[key]) + globalvars.delimiter
-                Sample[symlink]['prevResults'] = Sample[symlink]['currentResults']
+        # The row encoder fills the values of the plugin with its NA value
+        Sample[symlink]['currentResults'] = None
 
-    return Sample, line, dt
+    return Sample, dt
 
 
 #----------------------------------------------------------------------